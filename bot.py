@@ -1,22 +1,38 @@
+from config import PROFILE_IMPORTS
+if PROFILE_IMPORTS:
+	# Замер начинается до остальных импортов бота, отчёт — в лог после них
+	import import_profile
+	import_profile.start()
+import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils.executor import start_polling
-from config import API_TOKEN, LOG_LEVEL
+from config import API_TOKEN, LOG_LEVEL, WARM_UP
 from handlers import (
 	cmd_start, cmd_help, cmd_abbr, cmd_players, cmd_maps, cmd_tournaments, cmd_progress, cmd_player, cmd_map, cmd_graph,
-	cmd_alert, unknown, cmd_history
+	cmd_alert, unknown, cmd_history, cmd_query
 )
 from callbacks import (
 	player_match_callback, playerstat_callback, back_players_callback, show_map_callback, back_maps_callback,
 	match_info_callback, back_to_tournaments, match_map_callback, match_map_side_callback,
 	players_chart_menu, players_chart_build, players_chart_cancel, progress_chart_callback, graph_callback,
-	export_table_choose_format, export_cancel_callback, export_table_send
+	export_table_choose_format, export_cancel_callback, export_table_send, window_callback,
+	player_sides_callback, team_sides_callback, map_extremes_callback, player_page_callback, tournaments_page_callback,
+	dashboard_callback
 )
 from keyboards import main_menu
+from data_loader import watch_data_file
+from middlewares import SnapshotMiddleware
+from prerender import prerender_charts
+import charts
+import export_utils
 
 logging.basicConfig(level=LOG_LEVEL)
+if PROFILE_IMPORTS:
+	import_profile.finish(write=logging.info)
 bot = Bot(token=API_TOKEN, parse_mode='HTML')
 dp = Dispatcher(bot)
+dp.middleware.setup(SnapshotMiddleware())
 
 # --- Регистрация хендлеров ---
 dp.register_message_handler(cmd_start, commands=['start'])
@@ -29,6 +45,7 @@ dp.register_message_handler(cmd_progress, commands=['progress'])
 dp.register_message_handler(cmd_player, commands=['player'])
 dp.register_message_handler(cmd_map, lambda m: m.text and m.text.startswith('/map'))
 dp.register_message_handler(cmd_graph, commands=['graph'])
+dp.register_message_handler(cmd_query, commands=['query'])
 dp.register_message_handler(cmd_alert, commands=['alert'])
 dp.register_message_handler(cmd_history, commands=['history'])
 
@@ -48,26 +65,85 @@ dp.register_message_handler(unknown)
 dp.register_callback_query_handler(player_match_callback, lambda c: c.data.startswith('player_match_'))
 dp.register_callback_query_handler(playerstat_callback, lambda c: c.data.startswith('playerstat_'))
 dp.register_callback_query_handler(back_players_callback, lambda c: c.data == 'back_players')
+dp.register_callback_query_handler(player_page_callback, lambda c: c.data.startswith('ppage_'))
 dp.register_callback_query_handler(show_map_callback, lambda c: c.data.startswith('show_map_'))
 dp.register_callback_query_handler(back_maps_callback, lambda c: c.data == 'back_maps')
+dp.register_callback_query_handler(window_callback, lambda c: c.data.startswith('window_'))
+dp.register_callback_query_handler(player_sides_callback, lambda c: c.data.startswith('sides_player_'))
+dp.register_callback_query_handler(team_sides_callback, lambda c: c.data == 'sides_team')
+dp.register_callback_query_handler(map_extremes_callback, lambda c: c.data.startswith('mapext_'))
 dp.register_callback_query_handler(
 	match_info_callback, lambda c: c.data.startswith('match_') and not c.data.startswith('matchmap_')
 )
 dp.register_callback_query_handler(back_to_tournaments, lambda c: c.data == 'back_tournaments')
+dp.register_callback_query_handler(tournaments_page_callback, lambda c: c.data.startswith('tpage_'))
 dp.register_callback_query_handler(
 	match_map_callback, lambda c: c.data.startswith('matchmap_') and not c.data.startswith('matchmap_side_')
 )
 dp.register_callback_query_handler(match_map_side_callback, lambda c: c.data.startswith('matchmap_side_'))
-dp.register_callback_query_handler(players_chart_menu, lambda c: c.data == 'players_chart')
 dp.register_callback_query_handler(
-	players_chart_build, lambda c: c.data.startswith('players_chart_') and c.data != 'players_chart_cancel'
+	players_chart_menu, lambda c: c.data == 'players_chart' or c.data.startswith('players_chart_menu_')
+)
+dp.register_callback_query_handler(
+	players_chart_build,
+	lambda c: c.data.startswith('players_chart_') and c.data != 'players_chart_cancel'
+	and not c.data.startswith('players_chart_menu_')
 )
 dp.register_callback_query_handler(players_chart_cancel, lambda c: c.data == 'players_chart_cancel')
 dp.register_callback_query_handler(progress_chart_callback, lambda c: c.data == 'progress_chart')
 dp.register_callback_query_handler(graph_callback, lambda c: c.data.startswith('graph_'))
+dp.register_callback_query_handler(dashboard_callback, lambda c: c.data.startswith('dashboard_'))
 dp.register_callback_query_handler(export_table_choose_format, lambda c: c.data.startswith('export_table_'))
 dp.register_callback_query_handler(export_cancel_callback, lambda c: c.data and c.data.startswith('export_cancel'))
 dp.register_callback_query_handler(export_table_send, lambda c: c.data.startswith('export_tablefmt_'))
 
+
+# Фоновые задачи бота: ссылки держим, чтобы задачи не собрал сборщик мусора, и останавливаем при выходе
+_background = set()
+
+
+def _task_done(task):
+	_background.discard(task)
+	if not task.cancelled() and task.exception() is not None:
+		logging.error('Фоновая задача %s упала', task.get_name(), exc_info=task.exception())
+
+
+def start_background(coro, name):
+	"""Запускает фоновую задачу и держит ссылку на неё до завершения"""
+	task = asyncio.create_task(coro, name=name)
+	_background.add(task)
+	task.add_done_callback(_task_done)
+	return task
+
+
+async def warm_up():
+	"""Фоновый прогрев после старта: процессы графиков и экспорта загружают свои библиотеки,
+	пока бот уже отвечает, — первый график и первый экспорт не ждут импорта"""
+	await charts.start()
+	await export_utils.start()
+	logging.info('Прогрев завершён')
+
+
+async def on_startup(dispatcher):
+	if WARM_UP:
+		start_background(warm_up(), 'warm-up')
+	# Горячая перезагрузка baks_stats.json без рестарта бота
+	start_background(watch_data_file(), 'watch-data-file')
+	# Графики популярных игроков рисуются заранее после каждого обновления данных
+	start_background(prerender_charts(), 'prerender-charts')
+
+
+async def on_shutdown(dispatcher):
+	tasks = list(_background)
+	for task in tasks:
+		task.cancel()
+	await asyncio.gather(*tasks, return_exceptions=True)
+	charts.shutdown()
+	export_utils.shutdown()
+
+
 if __name__ == '__main__':
-	start_polling(dp, skip_updates=True)
+	# Процессы графиков и экспорта форкаются сейчас, пока у бота нет ни потоков, ни event loop
+	charts.launch()
+	export_utils.launch()
+	start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -1,39 +1,37 @@
-import io
-import matplotlib.pyplot as plt
-from tabulate import tabulate
+from table_format import fancy_grid
 from aiogram import types
 from aiogram.types import InputFile
 import json
 import os
 from config import FONT_PATH
 from export_utils import log_history
+import charts
 
 from data_loader import (
 	get_player_averages, get_player_stats, get_maps, get_map_stats,
-	get_tournaments, get_match_by_index, get_players
+	get_tournaments, get_match_by_id, get_player_match, get_players,
+	get_player_side_split, get_team_side_strength, get_player_map_extremes, resolve_player, resolve_map, resolve_window
 )
-from handlers import render_player_card
-from keyboards import export_format_keyboard, players_chart_keyboard
+from stats_store import opponent_of, parse_window
+from handlers import (
+	render_player_view, render_players, render_maps, render_tournaments, window_title, window_suffix, format_metric,
+	GRAPH_METRICS, player_graph, player_dashboard, players_chart, progress_chart
+)
+from keyboards import export_format_keyboard, players_chart_keyboard, window_buttons
 
 
 async def player_match_callback(call: types.CallbackQuery):
 	"""Обработчик для показа матча игрока"""
-	# player_match_{name}_{idx}
-	parts = call.data.split('_', maxsplit=3)
-	if len(parts) < 4:
-		await call.message.edit_text('Матч не найден.')
-		return
-	_, _, name, idx = parts
-	try:
-		idx = int(idx)
-	except Exception:
+	# player_match_{name}_{match_id}
+	parts = call.data[len('player_match_'):].rsplit('_', 1)
+	if len(parts) < 2:
 		await call.message.edit_text('Матч не найден.')
 		return
-	stats = get_player_stats(name)
-	if not stats or idx < 0 or idx >= len(stats):
+	name, match_id = parts
+	match_stat = get_player_match(name, match_id)
+	if not match_stat:
 		await call.message.edit_text('Матч не найден.')
 		return
-	match_stat = stats[idx]
 	table_data = [{
 		"K": match_stat['K'],
 		"D": match_stat['D'],
@@ -48,7 +46,7 @@ async def player_match_callback(call: types.CallbackQuery):
 		"D_t": match_stat['D_t'],
 		"Rating": match_stat['Rating']
 	}]
-	table = tabulate(table_data, headers="keys", tablefmt="fancy_grid")
+	table = fancy_grid(table_data)
 	date = match_stat['date']
 	opponent = match_stat.get('opponent', '-')
 	text = (
@@ -58,34 +56,21 @@ async def player_match_callback(call: types.CallbackQuery):
 	from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 	keyboard = InlineKeyboardMarkup(row_width=2)
 	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к игроку", callback_data=f"playerstat_{name}"))
-	keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_player_match_{name}_{idx}"))
+	keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_player_match_{name}_{match_id}"))
+	# Все метрики одной картинкой — одна отрисовка и одна загрузка вместо двенадцати
+	keyboard.add(InlineKeyboardButton(text="📊 Дашборд", callback_data=f"dashboard_{name}"))
 	# Компактные кнопки графиков по основным метрикам (по 2 в ряд)
-	metrics = [
-		("Rating", "Рейтинг"),
-		("ADR", "ADR"),
-		("KAST", "KAST"),
-		("K", "K"),
-		("D", "D"),
-		("OpK-D", "OpK-D"),
-		("MKs", "MKs"),
-		("1vsX", "1vsX"),
-		("HS", "HS"),
-		("A", "A"),
-		("A_f", "A_f"),
-		("D_t", "D_t")
-	]
-	# Добавляем кнопки по 2 в ряд
-	buttons = [InlineKeyboardButton(text=label, callback_data=f"graph_{name}_{metric}") for metric, label in metrics]
+	buttons = [InlineKeyboardButton(text=label, callback_data=f"graph_{name}_{metric}") for metric, label in GRAPH_METRICS]
 	for i in range(0, len(buttons), 2):
 		keyboard.row(*buttons[i:i+2])
 	await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
 
 
-async def playerstat_callback(call: types.CallbackQuery, as_new_message=False):
+async def playerstat_callback(call: types.CallbackQuery, as_new_message=False, window='all'):
 	"""Обработчик для показа статистики игрока"""
 	name = call.data[len('playerstat_'):]
-	stats = get_player_stats(name)
-	text, keyboard = render_player_card(name, stats, with_keyboard=True)
+	name = resolve_player(name) or name
+	text, keyboard = render_player_view(name, window)
 	log_history(call.from_user.id, call.from_user.username, 'view_player_card', {'player': name})
 	if as_new_message:
 		await call.message.answer(text, reply_markup=keyboard, parse_mode='HTML')
@@ -93,20 +78,31 @@ async def playerstat_callback(call: types.CallbackQuery, as_new_message=False):
 		await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
 
 
+async def player_page_callback(call: types.CallbackQuery):
+	"""Обработчик листания матчей в карточке игрока: ppage_{окно}_{ник}_{курсор}"""
+	rest, cursor = call.data[len('ppage_'):].rsplit('_', 1)
+	window, name = rest.split('_', 1)
+	text, keyboard = render_player_view(name, window, cursor)
+	await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+	await call.answer()
+
+
 async def back_players_callback(call: types.CallbackQuery):
 	"""Обработчик для возврата к списку игроков"""
-	from handlers import cmd_players
-	await cmd_players(call.message)
+	text, keyboard = render_players('all')
+	await call.message.answer(text, reply_markup=keyboard)
 
 
-async def show_map_callback(call: types.CallbackQuery, as_new_message=False):
+async def show_map_callback(call: types.CallbackQuery, as_new_message=False, window='all'):
 	"""Обработчик для показа статистики карты"""
 	map_name = call.data[len('show_map_'):]
-	stats = get_map_stats(map_name)
+	map_name = resolve_map(map_name) or map_name
+	stats = get_map_stats(map_name, window)
+	period = 'все официальные матчи команды' if window == 'all' else f'матчи команды {window_title(window)}'
 	description = (
-		f'🗺️ <b>Карта: {map_name.capitalize()}</b>\n\n'
+		f'🗺️ <b>Карта: {map_name}</b>\n\n'
 		f'📊 <b>Статистика BakS eSports на {map_name}:</b>\n'
-		f'В таблице показаны все официальные матчи команды на этой карте.\n\n'
+		f'В таблице показаны {period} на этой карте.\n\n'
 		f'📋 <b>Информация в таблице:</b>\n'
 		f'• <b>Дата</b> — когда проходил матч\n'
 		f'• <b>Соперник</b> — команда противника\n'
@@ -115,19 +111,21 @@ async def show_map_callback(call: types.CallbackQuery, as_new_message=False):
 		f'🔄 <b>Навигация:</b> Используйте кнопку ниже для возврата к списку карт.'
 	)
 	if stats:
-		table = tabulate(
+		table = fancy_grid(
 			[{
 				"Дата": m.get("date", "-"),
 				"Соперник": m.get("opponent", "-"),
 				"Счёт": m.get("score", "-"),
 				"WinRate": "-"
-			} for m in stats],
-			headers="keys", tablefmt="fancy_grid"
+			} for m in stats]
 		)
 		from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 		keyboard = InlineKeyboardMarkup()
+		keyboard.row(*window_buttons(f'map_{map_name}', window))
 		keyboard.add(InlineKeyboardButton(text="⬅️ Назад к списку карт", callback_data="back_maps"))
-		keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_map_{map_name}"))
+		keyboard.add(InlineKeyboardButton(
+			text="📤 Экспорт", callback_data=f"export_table_map_{map_name}_{window}"
+		))
 		user = call.from_user or (call.message and call.message.from_user)
 		if user:
 			log_history(user.id, user.username, 'view_map', {'map': map_name})
@@ -135,6 +133,17 @@ async def show_map_callback(call: types.CallbackQuery, as_new_message=False):
 			await call.message.answer(f'{description}\n<pre>{table}</pre>', reply_markup=keyboard, parse_mode='HTML')
 		else:
 			await call.message.edit_text(f'{description}\n<pre>{table}</pre>', reply_markup=keyboard, parse_mode='HTML')
+	elif window != 'all':
+		# За период матчей нет — оставляем выбор другого окна
+		from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+		keyboard = InlineKeyboardMarkup()
+		keyboard.row(*window_buttons(f'map_{map_name}', window))
+		keyboard.add(InlineKeyboardButton(text="⬅️ Назад к списку карт", callback_data="back_maps"))
+		text = f'❌ На карте {map_name} нет матчей {window_title(window)}.'
+		if as_new_message:
+			await call.message.answer(text, reply_markup=keyboard)
+		else:
+			await call.message.edit_text(text, reply_markup=keyboard)
 	else:
 		if as_new_message:
 			await call.message.answer('❌ Карта не найдена. Попробуйте выбрать другую из списка.')
@@ -142,16 +151,39 @@ async def show_map_callback(call: types.CallbackQuery, as_new_message=False):
 			await call.message.edit_text('❌ Карта не найдена. Попробуйте выбрать другую из списка.')
 
 
+async def window_callback(call: types.CallbackQuery):
+	"""Обработчик выбора окна: window_{окно}_{players|player_<ник>|map_<карта>}"""
+	_, window, target = call.data.split('_', maxsplit=2)
+
+	class DummyCall:
+		def __init__(self, data):
+			self.message = call.message
+			self.from_user = call.from_user
+			self.data = data
+	try:
+		if target == 'players':
+			text, keyboard = render_players(window)
+			await call.message.edit_text(text, reply_markup=keyboard)
+		elif target.startswith('player_'):
+			await playerstat_callback(DummyCall(f'playerstat_{target[len("player_"):]}'), window=window)
+		elif target.startswith('map_'):
+			await show_map_callback(DummyCall(f'show_map_{target[len("map_"):]}'), window=window)
+	except ValueError:
+		await call.answer('Неизвестный период.')
+		return
+	await call.answer()
+
+
 async def back_maps_callback(call: types.CallbackQuery):
 	"""Обработчик для возврата к списку карт"""
-	from handlers import cmd_maps
-	await cmd_maps(call.message)
+	text, keyboard = render_maps()
+	await call.message.answer(text, reply_markup=keyboard)
 
 
 async def match_info_callback(call: types.CallbackQuery, as_new_message=False):
 	"""Обработчик для показа информации о матче"""
-	idx = int(call.data.split('_')[1])
-	match = get_match_by_index(idx)
+	match_id = call.data[len('match_'):]
+	match = get_match_by_id(match_id)
 	if not match:
 		if as_new_message:
 			await call.message.answer('❌ Матч не найден.')
@@ -172,11 +204,11 @@ async def match_info_callback(call: types.CallbackQuery, as_new_message=False):
 		text += f"   • <b>{m['name']}</b> — <code>{m['score']}</code>\n"
 		keyboard.add(
 			InlineKeyboardButton(
-				text=f"{m['name']}", callback_data=f"matchmap_{idx}_{i}"
+				text=f"{m['name']}", callback_data=f"matchmap_{match_id}_{i}"
 			)
 		)
 	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к турнирам", callback_data="back_tournaments"))
-	keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_match_{idx}"))
+	keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_match_{match_id}"))
 	team = match['overall']['team_stats']
 	text += f"\n📊 <b>Командная статистика:</b>\n"
 	text += f"• ⭐ Рейтинг команды: <code>{team['team_rating']}</code>\n"
@@ -186,8 +218,7 @@ async def match_info_callback(call: types.CallbackQuery, as_new_message=False):
 	text += "\n🏅 <b>Топ-игроки матча:</b>\n"
 	for i, p in enumerate(players, 1):
 		text += f"{i}. <b>{p['nickname']}</b> — рейтинг <code>{p['Rating']}</code> (<code>{p['K']}K</code>)\n"
-	from tabulate import tabulate
-	table = tabulate(
+	table = fancy_grid(
 		[{
 			"Игрок": p["nickname"],
 			"K/D": f'{p["K"]}/{p["D"]}',
@@ -201,31 +232,37 @@ async def match_info_callback(call: types.CallbackQuery, as_new_message=False):
 			"A_f": p["A_f"],
 			"D_t": p["D_t"],
 			"Rating": p["Rating"]
-		} for p in match['overall']['players']['both']],
-		headers="keys", tablefmt="fancy_grid"
+		} for p in match['overall']['players']['both']]
 	)
 	text += f"\n📊 <b>Полная статистика игроков:</b>\n<pre>{table}</pre>"
 	user = call.from_user or (call.message and call.message.from_user)
 	if user:
-		log_history(user.id, user.username, 'view_match', {'match_idx': idx})
+		log_history(user.id, user.username, 'view_match', {'match_id': match_id})
 	if as_new_message:
 		await call.message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 	else:
 		await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
 
 
+async def tournaments_page_callback(call: types.CallbackQuery):
+	"""Обработчик листания турниров: tpage_{курсор}"""
+	text, keyboard = render_tournaments(call.data[len('tpage_'):])
+	await call.message.edit_text(text, reply_markup=keyboard)
+	await call.answer()
+
+
 async def back_to_tournaments(call: types.CallbackQuery):
 	"""Обработчик для возврата к турнирам"""
-	from handlers import cmd_tournaments
-	await cmd_tournaments(call.message)
+	text, keyboard = render_tournaments()
+	await call.message.answer(text, reply_markup=keyboard)
 
 
 async def match_map_callback(call: types.CallbackQuery, as_new_message=False):
 	"""Обработчик для показа карты матча"""
-	_, match_idx, map_idx = call.data.split('_', maxsplit=2)
-	match_idx, map_idx = int(match_idx), int(map_idx)
-	match = get_match_by_index(match_idx)
-	if not match:
+	_, match_id, map_idx = call.data.split('_', maxsplit=2)
+	map_idx = int(map_idx)
+	match = get_match_by_id(match_id)
+	if not match or map_idx > len(match['maps']):
 		if as_new_message:
 			await call.message.answer('❌ Матч не найден.')
 		else:
@@ -242,7 +279,7 @@ async def match_map_callback(call: types.CallbackQuery, as_new_message=False):
 	text += f"🏅 <b>MVP карты:</b> <b>{best['nickname']}</b>\n"
 	text += f"⭐ Рейтинг: <code>{best['Rating']}</code> | 💥 ADR: <code>{best['ADR']}</code> | ⚔️ K/D: <code>{best['K']}K/{best['D']}D</code>\n\n"
 	# Таблица всех игроков (карта)
-	table = tabulate(
+	table = fancy_grid(
 		[{
 			"Игрок": p["nickname"],
 			"K/D": f'{p["K"]}/{p["D"]}',
@@ -256,20 +293,19 @@ async def match_map_callback(call: types.CallbackQuery, as_new_message=False):
 			"A_f": p["A_f"],
 			"D_t": p["D_t"],
 			"Rating": p["Rating"]
-		} for p in m['players']['both']],
-		headers="keys", tablefmt="fancy_grid"
+		} for p in m['players']['both']]
 	)
 	text += f"📊 <b>Статистика игроков на {m['name']}:</b>\n<pre>{table}</pre>"
 	from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 	keyboard = InlineKeyboardMarkup()
 	keyboard.add(
-		InlineKeyboardButton(text="🎯 T-сторона", callback_data=f"matchmap_side_{match_idx}_{map_idx}_t"),
-		InlineKeyboardButton(text="🛡️ CT-сторона", callback_data=f"matchmap_side_{match_idx}_{map_idx}_ct")
+		InlineKeyboardButton(text="🎯 T-сторона", callback_data=f"matchmap_side_{match_id}_{map_idx}_t"),
+		InlineKeyboardButton(text="🛡️ CT-сторона", callback_data=f"matchmap_side_{match_id}_{map_idx}_ct")
 	)
 	# Кнопка назад к матчу
-	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к матчу", callback_data=f"match_{match_idx}"))
+	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к матчу", callback_data=f"match_{match_id}"))
 	# Кнопка экспорта: экспортировать таблицу игроков на карте
-	keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_matchmap_{match_idx}_{map_idx}"))
+	keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_matchmap_{match_id}_{map_idx}"))
 	if as_new_message:
 		await call.message.answer(text, reply_markup=keyboard)
 	else:
@@ -278,9 +314,9 @@ async def match_map_callback(call: types.CallbackQuery, as_new_message=False):
 
 async def match_map_side_callback(call: types.CallbackQuery, as_new_message=False):
 	"""Обработчик для показа стороны карты"""
-	_, _, match_idx, map_idx, side = call.data.split('_', maxsplit=4)
-	match_idx, map_idx = int(match_idx), int(map_idx)
-	match = get_match_by_index(match_idx)
+	_, _, match_id, map_idx, side = call.data.split('_', maxsplit=4)
+	map_idx = int(map_idx)
+	match = get_match_by_id(match_id)
 	if not match or map_idx > len(match['maps']):
 		if as_new_message:
 			await call.message.answer('Нет данных для экспорта.')
@@ -290,7 +326,7 @@ async def match_map_side_callback(call: types.CallbackQuery, as_new_message=Fals
 	m = match['maps'][map_idx - 1]
 	players = m['players'][side]
 	# Таблица игроков по сторонам (T/CT)
-	table = tabulate(
+	table = fancy_grid(
 		[{
 			"Игрок": p["nickname"],
 			"K/D": f'{p["K"]}/{p["D"]}',
@@ -304,18 +340,17 @@ async def match_map_side_callback(call: types.CallbackQuery, as_new_message=Fals
 			"A_f": p["A_f"],
 			"D_t": p["D_t"],
 			"Rating": p["Rating"]
-		} for p in players],
-		headers="keys", tablefmt="fancy_grid"
+		} for p in players]
 	)
 	side_name = "Terrorist" if side == "t" else "Counter-Terrorist"
 	text = f"🎯 <b>{side_name}-сторона</b> на карте <b>{m['name']}</b>\n\n📊 <b>Статистика игроков:</b>\n<pre>{table}</pre>"
 	from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 	keyboard = InlineKeyboardMarkup()
 	# Кнопка назад к карте
-	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к карте", callback_data=f"matchmap_{match_idx}_{map_idx}"))
+	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к карте", callback_data=f"matchmap_{match_id}_{map_idx}"))
 	# Кнопка экспорта: экспортировать таблицу игроков по стороне
 	keyboard.add(
-		InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_matchmap_side_{match_idx}_{map_idx}_{side}")
+		InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_matchmap_side_{match_id}_{map_idx}_{side}")
 	)
 	if as_new_message:
 		await call.message.answer(text, reply_markup=keyboard)
@@ -323,52 +358,121 @@ async def match_map_side_callback(call: types.CallbackQuery, as_new_message=Fals
 		await call.message.edit_text(text, reply_markup=keyboard)
 
 
+async def player_sides_callback(call: types.CallbackQuery):
+	"""Обработчик для сравнения T и CT игрока по каждой карте"""
+	name = call.data[len('sides_player_'):]
+	by_map = get_player_side_split(name)
+	from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+	keyboard = InlineKeyboardMarkup()
+	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к игроку", callback_data=f"playerstat_{name}"))
+	if not by_map:
+		await call.message.edit_text('❌ Нет данных по картам для этого игрока.', reply_markup=keyboard)
+		return
+	rows = []
+	for map_name, sides in by_map.items():
+		t, ct = sides.get('t'), sides.get('ct')
+		rows.append({
+			"Карта": map_name,
+			"Карт": sides['both']['count'] if 'both' in sides else '-',
+			"T Рейтинг": format_metric('Rating', t['Rating']) if t else '-',
+			"CT Рейтинг": format_metric('Rating', ct['Rating']) if ct else '-',
+			"T ADR": format_metric('ADR', t['ADR']) if t else '-',
+			"CT ADR": format_metric('ADR', ct['ADR']) if ct else '-',
+			"T KAST": format_metric('KAST', t['KAST']) if t else '-',
+			"CT KAST": format_metric('KAST', ct['KAST']) if ct else '-'
+		})
+	table = fancy_grid(rows)
+	text = (
+		f"🎯 <b>{name}: T и CT по картам</b>\n\n"
+		f"📊 Средние показатели за каждую сторону по всем сыгранным картам:\n"
+		f"<pre>{table}</pre>"
+	)
+	await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+
+
+async def team_sides_callback(call: types.CallbackQuery):
+	"""Обработчик для силы сторон команды по картам"""
+	by_map = get_team_side_strength()
+	rows = []
+	for map_name, sides in by_map.items():
+		t, ct = sides.get('t'), sides.get('ct')
+		if t and ct:
+			stronger = 'T' if t['Rating'] > ct['Rating'] else ('CT' if ct['Rating'] > t['Rating'] else '=')
+		else:
+			stronger = '-'
+		rows.append({
+			"Карта": map_name,
+			"T Рейтинг": format_metric('Rating', t['Rating']) if t else '-',
+			"CT Рейтинг": format_metric('Rating', ct['Rating']) if ct else '-',
+			"T ADR": format_metric('ADR', t['ADR']) if t else '-',
+			"CT ADR": format_metric('ADR', ct['ADR']) if ct else '-',
+			"Сильнее": stronger
+		})
+	table = fancy_grid(rows)
+	text = (
+		'⚔️ <b>Сила сторон BakS eSports по картам</b>\n\n'
+		'📊 Средние показатели игроков команды за T и CT на каждой карте.\n'
+		'<b>Сильнее</b> — сторона с более высоким средним рейтингом.\n'
+		f'<pre>{table}</pre>'
+	)
+	from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+	keyboard = InlineKeyboardMarkup()
+	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к списку карт", callback_data="back_maps"))
+	await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+
+
+async def map_extremes_callback(call: types.CallbackQuery):
+	"""Обработчик для лучшей и худшей карты игрока по каждой метрике"""
+	name = call.data[len('mapext_'):]
+	extremes = get_player_map_extremes(name)
+	from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+	keyboard = InlineKeyboardMarkup()
+	keyboard.add(InlineKeyboardButton(text="⬅️ Назад к игроку", callback_data=f"playerstat_{name}"))
+	if not extremes:
+		await call.message.edit_text('❌ Нет данных по картам для этого игрока.', reply_markup=keyboard)
+		return
+	table = fancy_grid(
+		[
+			[metric, best, format_metric(metric, best_value), worst, format_metric(metric, worst_value)]
+			for metric, (best, best_value, worst, worst_value) in extremes.items()
+		],
+		headers=["Метрика", "Лучшая", "Знач.", "Худшая", "Знач."]
+	)
+	text = (
+		f"🏅 <b>{name}: лучшие и худшие карты</b>\n\n"
+		f"📊 По среднему значению каждой метрики на карте (для D и OpD лучше меньше):\n"
+		f"<pre>{table}</pre>"
+	)
+	await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+
+
 async def players_chart_menu(call: types.CallbackQuery):
-	"""Обработчик для меню диаграммы игроков"""
-	keyboard = players_chart_keyboard()
+	"""Обработчик для меню диаграммы игроков (players_chart или players_chart_menu_{окно})"""
+	window = call.data[len('players_chart_menu_'):] if call.data.startswith('players_chart_menu_') else 'all'
+	keyboard = players_chart_keyboard(window)
 	await call.message.edit_reply_markup(reply_markup=keyboard)
 	await call.answer('Выберите метрику для диаграммы:')
 
 
 async def players_chart_build(call: types.CallbackQuery):
 	"""Обработчик для построения диаграммы игроков"""
-	metric = call.data[len('players_chart_'):]
-	players_avg = get_player_averages()
-	sorted_players = sorted(players_avg.items(), key=lambda x: x[1]['Rating'], reverse=True)
-	names = [nickname for nickname, _ in sorted_players]
-	if metric == 'rating':
-		values = [stats['Rating'] for _, stats in sorted_players]
-		label = 'Рейтинг'
-	elif metric == 'adr':
-		values = [stats['ADR'] for _, stats in sorted_players]
-		label = 'ADR'
-	elif metric == 'kast':
-		values = [stats['KAST'] for _, stats in sorted_players]
-		label = 'KAST (%)'
-	elif metric == 'kd':
-		values = [stats['K'] / stats['D'] if stats['D'] else 0 for _, stats in sorted_players]
-		label = 'K/D'
-	elif metric == 'hs':
-		values = [stats['HS'] for _, stats in sorted_players]
-		label = 'HS%'
-	elif metric == 'opkd':
-		values = [stats['OpK-D'] for _, stats in sorted_players]
-		label = 'OpK-D'
-	else:
+	# players_chart_{метрика} или players_chart_{метрика}_{окно}
+	metric, _, window = call.data[len('players_chart_'):].partition('_')
+	window = window or 'all'
+	try:
+		chart = players_chart(metric, window)
+	except ValueError:
+		await call.answer('Неизвестный период.')
+		return
+	if chart is None:
 		await call.answer('Неизвестная метрика.')
 		return
-	plt.figure(figsize=(8, 4))
-	plt.bar(names, values, color='#4e79a7')
-	plt.title(f'{label} всех игроков BakS eSports')
-	plt.xlabel('Игрок')
-	plt.ylabel(label)
-	plt.xticks(rotation=30)
-	plt.tight_layout()
-	buf = io.BytesIO()
-	plt.savefig(buf, format='png')
-	buf.seek(0)
-	plt.close()
-	await call.message.answer_photo(buf, caption=f'📊 {label} всех игроков BakS eSports')
+	log_history(call.from_user.id, call.from_user.username, 'view_players_chart', {'metric': metric})
+	try:
+		await charts.answer_chart(call.message, *chart)
+	except charts.ChartError as e:
+		await call.answer(str(e))
+		return
 	await call.answer()
 
 
@@ -380,65 +484,47 @@ async def players_chart_cancel(call: types.CallbackQuery):
 
 async def progress_chart_callback(call: types.CallbackQuery):
 	"""Обработчик для диаграммы прогресса"""
-	players = get_players()
-	progress = []
-	for player in players:
-		stats = get_player_stats(player)
-		if len(stats) >= 2:
-			first = stats[0]['Rating']
-			last = stats[-1]['Rating']
-			progress.append((player, first, last))
-	if not progress:
+	chart = progress_chart()
+	if chart is None:
 		await call.answer('Нет данных для построения графика.')
 		return
-	names = [p for p, _, _ in progress]
-	changes = [l - f for _, f, l in progress]
-	plt.figure(figsize=(8, 4))
-	bars = plt.bar(names, changes, color=['#4e79a7' if c >= 0 else '#e15759' for c in changes])
-	plt.title('Изменение рейтинга игроков BakS eSports')
-	plt.xlabel('Игрок')
-	plt.ylabel('Δ Рейтинг (последний - первый)')
-	plt.axhline(0, color='gray', linewidth=0.8)
-	plt.xticks(rotation=30)
-	plt.tight_layout()
-	buf = io.BytesIO()
-	plt.savefig(buf, format='png')
-	buf.seek(0)
-	plt.close()
-	await call.message.answer_photo(buf, caption='📊 Изменение рейтинга игроков (Δ = последний - первый матч)')
+	try:
+		await charts.answer_chart(call.message, *chart)
+	except charts.ChartError as e:
+		await call.answer(str(e))
+		return
 	await call.answer()
 
 
 async def graph_callback(call: types.CallbackQuery):
 	"""Обработчик для графиков игроков"""
 	_, name, metric = call.data.split('_', maxsplit=2)
-	stats = get_player_stats(name)
-	if not stats:
+	# Тот же график, что /graph {ник} {метрика} — общий ключ кэша
+	chart = player_graph(name, metric)
+	if chart is None:
+		await call.message.edit_text('Игрок не найден.')
+		return
+	log_history(call.from_user.id, call.from_user.username, 'view_graph', {'player': name, 'metric': metric})
+	try:
+		await charts.answer_chart(call.message, *chart)
+	except charts.ChartError as e:
+		await call.answer(str(e))
+
+
+async def dashboard_callback(call: types.CallbackQuery):
+	"""Обработчик для сводки всех графиков игрока: dashboard_{ник}"""
+	name = call.data[len('dashboard_'):]
+	chart = player_dashboard(name)
+	if chart is None:
 		await call.message.edit_text('Игрок не найден.')
 		return
-	x = [s['date'] for s in stats]
-
-	def parse_metric(val):
-		if isinstance(val, str) and val.endswith('%'):
-			return float(val.replace('%', ''))
-		try:
-			return float(val)
-		except Exception:
-			return 0
-
-	y = [parse_metric(s[metric]) if metric in s else 0 for s in stats]
-	plt.figure(figsize=(7, 4))
-	plt.plot(x, y, marker='o')
-	plt.title(f'{name} — {metric} по матчам')
-	plt.xlabel('Дата')
-	plt.ylabel(metric)
-	plt.grid(True)
-	buf = io.BytesIO()
-	plt.tight_layout()
-	plt.savefig(buf, format='png')
-	buf.seek(0)
-	await call.message.answer_photo(buf, caption=f'{name} — {metric} по матчам')
-	plt.close()
+	log_history(call.from_user.id, call.from_user.username, 'view_dashboard', {'player': name})
+	try:
+		await charts.answer_chart(call.message, *chart)
+	except charts.ChartError as e:
+		await call.answer(str(e))
+		return
+	await call.answer()
 
 
 async def export_table_choose_format(call: types.CallbackQuery):
@@ -450,12 +536,50 @@ async def export_table_choose_format(call: types.CallbackQuery):
 	await call.answer(desc)
 
 
+def _log_export(call, export_type, filename, fmt):
+	"""Сохраняет экспорт в историю"""
+	user = call.from_user or (call.message and call.message.from_user)
+	if user:
+		log_history(user.id, user.username, 'export', {
+			'type': export_type,
+			'filename': filename,
+			'format': fmt
+		})
+
+
+def _export_target(cb_data):
+	"""(ник или карта, окно) из callback экспорта списка игроков, игрока или карты, иначе (None, None).
+
+	Окно — последняя часть: players_<окно>, player_<ник>_<окно>, map_<карта>_<окно>,
+	поэтому ник и карта могут содержать «_». Кнопки игрока и карты без окна
+	(созданные до выбора окон) экспортируют все матчи.
+	"""
+	kind, _, rest = cb_data.partition('_')
+	if kind == 'players':
+		return None, rest or 'all'
+	if kind not in ('player', 'map') or cb_data.startswith('player_match_'):
+		return None, None
+	name, _, window = rest.rpartition('_')
+	if not name or not _is_window(window):
+		return rest, 'all'
+	return name, window
+
+
+def _is_window(window):
+	"""Разбирается ли окно (stats_store.parse_window после resolve_window)"""
+	try:
+		parse_window(resolve_window(window))
+	except ValueError:
+		return False
+	return True
+
+
 async def export_table_send(call: types.CallbackQuery):
 	"""Универсальный обработчик экспорта файлов"""
 	# --- Импортируем необходимые функции ---
-	from data_loader import get_player_stats, get_players, get_maps, get_map_stats
-	from export_utils import export_data, log_history
-	from aiogram.types import InputFile
+	from data_loader import get_player_stats, get_players, get_maps, get_map_stats, data_version
+	from export_utils import ExportError, answer_cached_export, answer_export
+	from config import EXPORT_PROGRESS_ROWS
 
 	# export_tablefmt_<type>_<id...>_<fmt>
 	parts = call.data[len('export_tablefmt_'):].rsplit('_', 1)
@@ -464,11 +588,29 @@ async def export_table_send(call: types.CallbackQuery):
 		return
 	cb_data, fmt = parts[0], parts[1]
 	cb_parts = cb_data.split('_')
+	target, window = _export_target(cb_data)
+	if window is not None and not _is_window(window):
+		await call.answer('Неизвестный период.')
+		return
+
+	# Этот файл уже отправлялся для той же версии данных — повторяем его без сборки данных и файла.
+	# В ключе и окно в виде хранилища: файл «за этот месяц» не переживает смену месяца
+	cache_key = (data_version(), cb_data, window and resolve_window(window), fmt)
+	try:
+		cached = await answer_cached_export(call.message, cache_key)
+	except Exception as e:
+		await call.message.answer(f'❌ Ошибка при экспорте: {str(e)}')
+		await call.answer('❌ Ошибка экспорта')
+		return
+	if cached is not None:
+		await call.answer('✅ Файл экспортирован!')
+		_log_export(call, cb_parts[0], os.path.splitext(cached.filename)[0], fmt)
+		return
 
 	# --- Экспорт средней статистики всех игроков (таблица) ---
 	if cb_parts[0] == 'players':
 		from data_loader import get_player_averages
-		players_avg = get_player_averages()
+		players_avg = get_player_averages(window)
 		if not players_avg:
 			await call.message.answer('Нет данных для экспорта.')
 			return
@@ -481,25 +623,25 @@ async def export_table_send(call: types.CallbackQuery):
 			"Средний HS%": f"{stats['HS']:.1f}%"
 		} for nickname, stats in players_avg.items()]
 		desc = 'Средняя статистика всех игроков'
-		filename = 'players_average_stats'
+		if window != 'all':
+			desc += f' ({window_title(window)})'
+		filename = f'players_average_stats{window_suffix(window)}'
 
 	# --- Экспорт списка всех карт ---
 	elif cb_parts[0] == 'maps':
 		maps = get_maps()
-		data = [{"Карта": map_name, "Количество матчей": len(get_map_stats(map_name))} for map_name in maps]
+		data = [{"Карта": map_name, "Количество матчей": len(map_stats)} for map_name, map_stats in maps.items()]
 		desc = 'Список всех карт с количеством матчей'
 		filename = 'maps_list'
 
 	# --- Экспорт статистики игрока за матч ---
 	elif cb_parts[0] == 'player' and cb_parts[1] == 'match':
-		# export_table_player_match_{name}_{idx}
-		player_name = cb_parts[2]
-		match_idx = int(cb_parts[3])
-		stats = get_player_stats(player_name)
-		if not stats or match_idx < 0 or match_idx >= len(stats):
+		# export_table_player_match_{name}_{match_id}
+		player_name, match_id = cb_data[len('player_match_'):].rsplit('_', 1)
+		s = get_player_match(player_name, match_id)
+		if not s:
 			await call.message.answer('Нет данных для экспорта.')
 			return
-		s = stats[match_idx]
 		data = [{
 			"Дата": s.get("date", "-"),
 			"Турнир": s.get("tournament", "-"),
@@ -518,13 +660,12 @@ async def export_table_send(call: types.CallbackQuery):
 			"Rating": s.get("Rating", "-")
 		}]
 		desc = f'Статистика игрока {player_name} за матч {s.get("date", "-")} vs {s.get("opponent", "-")}'
-		filename = f'player_{player_name}_match_{match_idx}_stats'
+		filename = f'player_{player_name}_match_{match_id}_stats'
 
 	# --- Экспорт матча ---
 	elif cb_parts[0] == 'match':
-		from data_loader import get_match_by_index
-		match_idx = int(cb_parts[1])
-		match = get_match_by_index(match_idx)
+		match_id = cb_parts[1]
+		match = get_match_by_id(match_id)
 		if not match:
 			await call.message.answer('Матч не найден.')
 			return
@@ -544,13 +685,12 @@ async def export_table_send(call: types.CallbackQuery):
 			"Rating": p["Rating"]
 		} for p in match['overall']['players']['both']]
 		desc = f'Статистика матча BakS vs {opp} ({match["date"]})'
-		filename = f'match_{match_idx}_stats'
+		filename = f'match_{match_id}_stats'
 
 	# --- Экспорт стороны карты ---
 	elif cb_parts[0] == 'matchmap' and cb_parts[1] == 'side':
-		from data_loader import get_match_by_index
-		match_idx, map_idx, side = int(cb_parts[2]), int(cb_parts[3]), cb_parts[4]
-		match = get_match_by_index(match_idx)
+		match_id, map_idx, side = cb_parts[2], int(cb_parts[3]), cb_parts[4]
+		match = get_match_by_id(match_id)
 		if not match or map_idx > len(match['maps']):
 			await call.message.answer('Данные не найдены.')
 			return
@@ -571,14 +711,13 @@ async def export_table_send(call: types.CallbackQuery):
 			"Rating": p["Rating"]
 		} for p in players]
 		side_name = "T" if side == "t" else "CT"
-		desc = f'Статистика {side_name}-стороны на {m["name"]} (матч {match_idx})'
-		filename = f'match_{match_idx}_map_{m["name"]}_{side_name}_stats'
+		desc = f'Статистика {side_name}-стороны на {m["name"]} (матч {match["date"]} vs {opponent_of(match)})'
+		filename = f'match_{match_id}_map_{m["name"]}_{side_name}_stats'
 
 	# --- Экспорт карты матча ---
 	elif cb_parts[0] == 'matchmap':
-		from data_loader import get_match_by_index
-		match_idx, map_idx = int(cb_parts[1]), int(cb_parts[2])
-		match = get_match_by_index(match_idx)
+		match_id, map_idx = cb_parts[1], int(cb_parts[2])
+		match = get_match_by_id(match_id)
 		if not match or map_idx > len(match['maps']):
 			await call.message.answer('Данные не найдены.')
 			return
@@ -597,13 +736,13 @@ async def export_table_send(call: types.CallbackQuery):
 			"D_t": p["D_t"],
 			"Rating": p["Rating"]
 		} for p in m['players']['both']]
-		desc = f'Статистика на карте {m["name"]} (матч {match_idx})'
-		filename = f'match_{match_idx}_map_{m["name"]}_stats'
+		desc = f'Статистика на карте {m["name"]} (матч {match["date"]} vs {opponent_of(match)})'
+		filename = f'match_{match_id}_map_{m["name"]}_stats'
 
 	# --- Экспорт статистики игрока по всем матчам ---
 	elif cb_parts[0] == 'player':
-		player_name = cb_parts[1]
-		stats = get_player_stats(player_name)
+		player_name = resolve_player(target) or target
+		stats = get_player_stats(player_name, window)
 		if not stats:
 			await call.message.answer('Нет данных для экспорта.')
 			return
@@ -624,13 +763,13 @@ async def export_table_send(call: types.CallbackQuery):
 			"D_t": s.get("D_t", "-"),
 			"Rating": s.get("Rating", "-")
 		} for s in stats]
-		desc = f'Статистика игрока {player_name} по всем матчам'
-		filename = f'player_{player_name}_all_matches_stats'
+		desc = f'Статистика игрока {player_name} {window_title(window)}'
+		filename = f'player_{player_name}_all_matches_stats' if window == 'all' else f'player_{player_name}_{window}_stats'
 
 	# --- Экспорт статистики по карте ---
 	elif cb_parts[0] == 'map':
-		map_name = cb_parts[1]
-		stats = get_map_stats(map_name)
+		map_name = resolve_map(target) or target
+		stats = get_map_stats(map_name, window)
 		if not stats:
 			await call.message.answer('Нет данных для экспорта.')
 			return
@@ -641,7 +780,27 @@ async def export_table_send(call: types.CallbackQuery):
 			"WinRate": "-"
 		} for m in stats]
 		desc = f'Статистика по карте {map_name}'
-		filename = f'map_{map_name}_stats'
+		if window != 'all':
+			desc += f' ({window_title(window)})'
+		filename = f'map_{map_name}{window_suffix(window)}_stats'
+
+	# --- Экспорт результата /query: запрос повторяется с большим лимитом строк ---
+	elif cb_parts[0] == 'query':
+		from config import QUERY_EXPORT_LIMIT
+		from data_loader import run_query
+		from handlers import query_table_rows
+		from query_dsl import recall
+		text = recall(cb_parts[1])
+		if text is None:
+			await call.message.answer('Запрос устарел — повторите /query.')
+			return
+		columns, rows, _ = run_query(text, QUERY_EXPORT_LIMIT)
+		data = query_table_rows(columns, rows)
+		if not data:
+			await call.message.answer('Нет данных для экспорта.')
+			return
+		desc = f'Запрос: {text}'
+		filename = f'query_{cb_parts[1]}'
 
 	# --- Экспорт турниров с количеством матчей ---
 	elif cb_parts[0] == 'tournaments':
@@ -655,27 +814,28 @@ async def export_table_send(call: types.CallbackQuery):
 		await call.message.answer('Экспорт для этого типа данных не реализован.')
 		return
 
-	# Экспортируем данные
+	# Экспортируем данные: файл готовится в пуле, event loop и другие пользователи не ждут
+	progress = None
 	try:
-		file_data = export_data(data, desc, filename, fmt)
-		await call.message.answer_document(
-			InputFile(file_data, filename=f"{filename}.{fmt}"),
-			caption=f"📤 {desc}"
-		)
-		await call.answer('✅ Файл экспортирован!')
-		
-		# Сохраняем в историю
-		user = call.from_user or (call.message and call.message.from_user)
-		if user:
-			log_history(user.id, user.username, 'export', {
-				'type': cb_parts[0],
-				'filename': filename,
-				'format': fmt
-			})
-			
+		if len(data) >= EXPORT_PROGRESS_ROWS:
+			# Большой файл: на callback отвечаем сразу, о ходе работы сообщает отдельное сообщение
+			await call.answer('⏳ Готовлю файл…')
+			progress = await call.message.answer(f'⏳ Готовлю {fmt.upper()}, строк: {len(data)}…')
+		await answer_export(call.message, cache_key, data, desc, filename, fmt)
+		if progress is None:
+			await call.answer('✅ Файл экспортирован!')
+		_log_export(call, cb_parts[0], filename, fmt)
+	except ExportError as e:
+		await call.message.answer(str(e))
+		if progress is None:
+			await call.answer('❌ Ошибка экспорта')
 	except Exception as e:
 		await call.message.answer(f'❌ Ошибка при экспорте: {str(e)}')
-		await call.answer('❌ Ошибка экспорта')
+		if progress is None:
+			await call.answer('❌ Ошибка экспорта')
+	finally:
+		if progress is not None:
+			await progress.delete()
 
 
 async def export_cancel_callback(call: types.CallbackQuery):
@@ -684,26 +844,38 @@ async def export_cancel_callback(call: types.CallbackQuery):
 
 	cb = call.data[len('export_cancel_'):] if call.data.startswith('export_cancel_') else ''
 
-	if cb.startswith('players'):
+	if cb.startswith('query_'):
+		from handlers import render_query
+		from query_dsl import recall
+		text = recall(cb[len('query_'):])
+		if text is None:
+			await call.message.answer('Запрос устарел — повторите /query.')
+			return
+		text, keyboard = render_query(text)
+		await call.message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+	elif cb.startswith('players'):
 		from handlers import cmd_players
-		await cmd_players(call.message)
+		await cmd_players(call.message, window=cb[len('players_'):] or 'all')
 	elif cb.startswith('maps'):
 		from handlers import cmd_maps
 		await cmd_maps(call.message)
 	elif cb.startswith('map_'):
-		map_name = cb[4:]
+		# export_cancel_map_{карта}[_{окно}]
+		map_name, _, window = cb[4:].partition('_')
 		from callbacks import show_map_callback
 		class DummyCall:
 			def __init__(self, message, from_user, data):
 				self.message = message
 				self.from_user = from_user
 				self.data = f'show_map_{map_name}'
-		await show_map_callback(DummyCall(call.message, call.from_user, f'show_map_{map_name}'), as_new_message=True)
+		await show_map_callback(
+			DummyCall(call.message, call.from_user, f'show_map_{map_name}'), as_new_message=True, window=window or 'all'
+		)
 	elif cb.startswith('matchmap_side_'):
-		# export_cancel_matchmap_side_{match_idx}_{map_idx}_{side}
+		# export_cancel_matchmap_side_{match_id}_{map_idx}_{side}
 		parts = cb.split('_')
 		if len(parts) >= 5:
-			match_idx = int(parts[2])
+			match_id = parts[2]
 			map_idx = int(parts[3])
 			side = parts[4]
 			from callbacks import match_map_side_callback
@@ -711,24 +883,24 @@ async def export_cancel_callback(call: types.CallbackQuery):
 				def __init__(self, message, from_user, data):
 					self.message = message
 					self.from_user = from_user
-					self.data = f'matchmap_side_{match_idx}_{map_idx}_{side}'
-			await match_map_side_callback(DummyCall(call.message, call.from_user, f'matchmap_side_{match_idx}_{map_idx}_{side}'), as_new_message=True)
+					self.data = f'matchmap_side_{match_id}_{map_idx}_{side}'
+			await match_map_side_callback(DummyCall(call.message, call.from_user, f'matchmap_side_{match_id}_{map_idx}_{side}'), as_new_message=True)
 		else:
 			from handlers import cmd_tournaments
 			await cmd_tournaments(call.message)
 	elif cb.startswith('matchmap_'):
-		# export_cancel_matchmap_{match_idx}_{map_idx}
+		# export_cancel_matchmap_{match_id}_{map_idx}
 		parts = cb.split('_')
 		if len(parts) >= 3:
-			match_idx = int(parts[1])
+			match_id = parts[1]
 			map_idx = int(parts[2])
 			from callbacks import match_map_callback
 			class DummyCall:
 				def __init__(self, message, from_user, data):
 					self.message = message
 					self.from_user = from_user
-					self.data = f'matchmap_{match_idx}_{map_idx}'
-			await match_map_callback(DummyCall(call.message, call.from_user, f'matchmap_{match_idx}_{map_idx}'), as_new_message=True)
+					self.data = f'matchmap_{match_id}_{map_idx}'
+			await match_map_callback(DummyCall(call.message, call.from_user, f'matchmap_{match_id}_{map_idx}'), as_new_message=True)
 		else:
 			from handlers import cmd_tournaments
 			await cmd_tournaments(call.message)
@@ -736,19 +908,19 @@ async def export_cancel_callback(call: types.CallbackQuery):
 		from handlers import cmd_tournaments
 		await cmd_tournaments(call.message)
 	elif cb.startswith('match_'):
-		match_idx = int(cb[len('match_'):])
+		match_id = cb[len('match_'):]
 		from callbacks import match_info_callback
 		class DummyCall:
 			def __init__(self, message, from_user, data):
 				self.message = message
 				self.from_user = from_user
-				self.data = f'match_{match_idx}'
-		await match_info_callback(DummyCall(call.message, call.from_user, f'match_{match_idx}'), as_new_message=True)
+				self.data = f'match_{match_id}'
+		await match_info_callback(DummyCall(call.message, call.from_user, f'match_{match_id}'), as_new_message=True)
 	elif cb.startswith('player_match_'):
-		# export_cancel_player_match_{name}_{idx}
-		parts = cb.split('_')
-		if len(parts) >= 3:
-			name = parts[2]
+		# export_cancel_player_match_{name}_{match_id}
+		parts = cb[len('player_match_'):].rsplit('_', 1)
+		if len(parts) == 2:
+			name = parts[0]
 			from callbacks import playerstat_callback
 			class DummyCall:
 				def __init__(self, message, from_user, data):
@@ -761,13 +933,17 @@ async def export_cancel_callback(call: types.CallbackQuery):
 			await cmd_players(call.message)
 	elif cb.startswith('playerstat_') or cb.startswith('player_'):
 		from callbacks import playerstat_callback
+		# export_cancel_player_{ник}[_{окно}]
 		name = cb[len('playerstat_'):] if cb.startswith('playerstat_') else cb[len('player_'):]
+		name, _, window = name.partition('_')
 		class DummyCall:
 			def __init__(self, message, from_user, data):
 				self.message = message
 				self.from_user = from_user
 				self.data = f'playerstat_{name}'
-		await playerstat_callback(DummyCall(call.message, call.from_user, f'playerstat_{name}'), as_new_message=True)
+		await playerstat_callback(
+			DummyCall(call.message, call.from_user, f'playerstat_{name}'), as_new_message=True, window=window or 'all'
+		)
 	else:
 		from handlers import cmd_start
 		await cmd_start(call.message)
@@ -0,0 +1,288 @@
+import asyncio
+import contextlib
+import io
+import logging
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import CHART_CACHE_SIZE, CHART_ENGINE, CHART_QUEUE_SIZE, CHART_THREADS, CHART_TIMEOUT, CHART_WORKERS
+import memo
+
+log = logging.getLogger(__name__)
+
+# Описание графика — всё, что нужно для рисования; передаётся в процесс пула через pickle.
+# kind — шаблон из TEMPLATES или FIGURE_TEMPLATES; colors — цвет или список цветов столбцов
+ChartSpec = namedtuple('ChartSpec', ['kind', 'title', 'xlabel', 'ylabel', 'x', 'y', 'colors'])
+
+BAR_COLOR = '#4e79a7'
+NEGATIVE_COLOR = '#e15759'
+
+
+# Готовый график: PNG и file_id фото в Telegram после первой отправки
+CachedChart = namedtuple('CachedChart', ['png', 'file_id'])
+# (версия данных, ключ графика) -> CachedChart; очищается при перезагрузке данных
+_cache = memo.VersionedCache('charts', CHART_CACHE_SIZE)
+
+
+class ChartError(Exception):
+    """График не построен; текст показывается пользователю"""
+
+
+class ChartBusy(ChartError):
+    """Очередь графиков заполнена"""
+
+
+class ChartTimeout(ChartError):
+    """График строился дольше CHART_TIMEOUT"""
+
+
+def line_chart(title, x, y, xlabel, ylabel):
+    """Линейный график метрики по матчам"""
+    return ChartSpec('line', title, xlabel, ylabel, list(x), list(y), None)
+
+
+def bar_chart(title, names, values, xlabel, ylabel):
+    """Столбчатая диаграмма по игрокам"""
+    return ChartSpec('bar', title, xlabel, ylabel, list(names), list(values), BAR_COLOR)
+
+
+def delta_bar_chart(title, names, deltas, xlabel, ylabel):
+    """Столбцы изменений со знаком: рост и падение разными цветами, линия нуля"""
+    colors = [BAR_COLOR if d >= 0 else NEGATIVE_COLOR for d in deltas]
+    return ChartSpec('delta_bar', title, xlabel, ylabel, list(names), list(deltas), colors)
+
+
+def dashboard_chart(title, x, metrics, series, xlabel):
+    """Сетка линейных графиков по общей оси x: series[i] — значения метрики metrics[i].
+    Названия метрик хранятся в ylabel"""
+    return ChartSpec('dashboard', title, xlabel, tuple(metrics), list(x), [list(v) for v in series], None)
+
+
+def _draw_line(ax, spec):
+    ax.plot(spec.x, spec.y, marker='o')
+    ax.grid(True)
+
+
+def _draw_bar(ax, spec):
+    ax.bar(spec.x, spec.y, color=spec.colors)
+    for label in ax.get_xticklabels():
+        label.set_rotation(30)
+
+
+def _draw_delta_bar(ax, spec):
+    ax.bar(spec.x, spec.y, color=spec.colors)
+    ax.axhline(0, color='gray', linewidth=0.8)
+    for label in ax.get_xticklabels():
+        label.set_rotation(30)
+
+
+def _draw_dashboard(fig, spec):
+    columns = 3
+    rows = -(-len(spec.y) // columns)
+    axes = fig.subplots(rows, columns, sharex=True, squeeze=False).flat
+    for ax, metric, values in zip(axes, spec.ylabel, spec.y):
+        ax.plot(spec.x, values, marker='o')
+        ax.set_title(metric, fontsize=10)
+        ax.grid(True)
+    for ax in list(axes):
+        ax.set_visible(False)
+    for ax in fig.axes[:len(spec.y)][-columns:]:
+        ax.set_xlabel(spec.xlabel)
+    fig.suptitle(spec.title)
+
+
+# Шаблон: (размер полотна в дюймах, функция рисования осей графика)
+TEMPLATES = {
+    'line': ((7, 4), _draw_line),
+    'bar': ((8, 4), _draw_bar),
+    'delta_bar': ((8, 4), _draw_delta_bar),
+}
+# Графики из нескольких осей: функция рисует всю фигуру
+FIGURE_TEMPLATES = {
+    'dashboard': ((12, 9), _draw_dashboard),
+}
+
+
+def render_png(spec):
+    """Рисует график в PNG.
+
+    Простые шаблоны рисует pil_charts за миллисекунды и без импорта matplotlib
+    (CHART_ENGINE = 'pillow'); всё, что ему не по силам, — matplotlib.
+    """
+    if CHART_ENGINE == 'pillow':
+        # Pillow и matplotlib импортируются при первом графике — в процессе пула, а не при старте бота
+        try:
+            import pil_charts
+        except ImportError:
+            pil_charts = None
+        if pil_charts is not None and pil_charts.supports(spec):
+            figsize, _ = TEMPLATES.get(spec.kind) or FIGURE_TEMPLATES[spec.kind]
+            return pil_charts.render_png(spec, figsize)
+    return render_matplotlib(spec)
+
+
+def render_matplotlib(spec):
+    """PNG через matplotlib.
+
+    Figure с холстом Agg без глобального состояния pyplot: вызовы из разных
+    потоков не мешают друг другу, а фигура освобождается вместе с функцией.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    if spec.kind in FIGURE_TEMPLATES:
+        figsize, draw_figure = FIGURE_TEMPLATES[spec.kind]
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        draw_figure(fig, spec)
+    else:
+        figsize, draw = TEMPLATES[spec.kind]
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        draw(ax, spec)
+        ax.set_title(spec.title)
+        ax.set_xlabel(spec.xlabel)
+        ax.set_ylabel(spec.ylabel)
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def _init_worker():
+    """Прогрев процесса: первый рендер загружает шрифты и библиотеку рисования"""
+    render_png(line_chart('warm-up', [0, 1], [0, 1], 'x', 'y'))
+
+
+def _warm_up():
+    return True
+
+
+_pool = None
+_pending = 0
+
+
+def _mp_context():
+    # fork: процессу не нужно заново импортировать bot.py; на Windows — только spawn
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+
+def launch():
+    """Создаёт пул процессов графиков (CHART_WORKERS > 0).
+
+    Вызывается при старте bot.py до event loop и до первых потоков: fork из
+    многопоточного процесса может унаследовать чужие захваченные блокировки.
+    Процессы создаются сразу, прогрев в них идёт в фоне.
+    """
+    global _pool
+    if CHART_WORKERS > 0 and _pool is None:
+        _pool = ProcessPoolExecutor(CHART_WORKERS, mp_context=_mp_context(), initializer=_init_worker)
+        _pool.submit(_warm_up)
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        # Процессы запускает только launch() при старте; без него или после падения пула
+        # процессы из уже многопоточного бота не форкаются — графики строятся в потоках
+        _pool = ThreadPoolExecutor(CHART_THREADS, thread_name_prefix='charts', initializer=_init_worker)
+    return _pool
+
+
+async def start():
+    """Дожидается прогрева пула, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    pool = _executor()
+    processes = isinstance(pool, ProcessPoolExecutor)
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_up) for _ in range(CHART_WORKERS if processes else 1)))
+    log.info('Пул графиков запущен: %s', f'{CHART_WORKERS} процессов' if processes else f'{CHART_THREADS} потоков')
+
+
+def shutdown():
+    """Останавливает пул (при остановке бота)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _release():
+    global _pending
+    _pending -= 1
+
+
+async def render(spec):
+    """PNG графика, построенного вне event loop.
+
+    ChartBusy — в очереди уже CHART_QUEUE_SIZE графиков, ChartTimeout — график
+    не успел за CHART_TIMEOUT секунд. Без пула процессов (CHART_WORKERS = 0)
+    графики строятся в пуле из CHART_THREADS потоков.
+    """
+    global _pending
+    if _pending >= CHART_QUEUE_SIZE:
+        raise ChartBusy('⏳ Сейчас строится много графиков, попробуйте через минуту.')
+    loop = asyncio.get_running_loop()
+    try:
+        job = _executor().submit(render_png, spec)
+        _pending += 1
+        # Место в очереди освобождается, когда задача завершилась в пуле, а не когда её
+        # перестали ждать: после таймаута процесс ещё рисует, и очередь это учитывает
+        job.add_done_callback(lambda _: _call_soon(loop, _release))
+        return await asyncio.wait_for(asyncio.wrap_future(job), CHART_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ChartTimeout('⏳ График строится слишком долго, попробуйте позже.')
+    except BrokenProcessPool:
+        log.exception('Пул процессов графиков упал, дальше графики строятся в потоках')
+        shutdown()
+        raise ChartError('❌ Не удалось построить график, попробуйте ещё раз.')
+
+
+def _call_soon(loop, callback):
+    # Колбэк future пула вызывается в его служебном потоке; счётчик меняем в потоке event loop
+    with contextlib.suppress(RuntimeError):
+        loop.call_soon_threadsafe(callback)
+
+
+async def answer_chart(message, key, spec, caption):
+    """Отправляет график в ответ на message через кэш.
+
+    key — (вид графика, игрок, метрика, окно...) без версии данных. Повтор уходит
+    по file_id без рисования и загрузки; если Telegram его не принял — тем же PNG.
+    """
+    from aiogram.utils.exceptions import BadRequest
+    from data_loader import data_version
+    cache_key = (data_version(), key)
+    cached = _cache.get(cache_key)
+    if cached is not None and cached.file_id is not None:
+        try:
+            return await message.answer_photo(cached.file_id, caption=caption)
+        except BadRequest:
+            log.warning('file_id графика %s отклонён, отправляем PNG', key)
+    png = cached.png if cached is not None else await render(spec)
+    sent = await message.answer_photo(io.BytesIO(png), caption=caption)
+    photo = getattr(sent, 'photo', None)
+    _cache.put(cache_key, CachedChart(png, photo[-1].file_id if photo else None))
+    return sent
+
+
+def is_cached(key):
+    """Есть ли график в кэше для текущей версии данных"""
+    from data_loader import data_version
+    return (data_version(), key) in _cache
+
+
+def busy():
+    """Строятся ли сейчас графики"""
+    return _pending > 0
+
+
+async def prerender(key, spec):
+    """Рисует график в кэш без отправки; file_id появится при первом показе"""
+    from data_loader import data_version
+    cache_key = (data_version(), key)
+    png = await render(spec)
+    # Пока рисовали, график мог уже отправить пользователь — его file_id не затираем
+    if cache_key not in _cache:
+        _cache.put(cache_key, CachedChart(png, None))
@@ -2,7 +2,58 @@ import os
 
 API_TOKEN = ''
 DATA_PATH = os.path.join(os.path.dirname(__file__), 'baks_stats.json')
+# Хранилище статистики: 'json' (baks_stats.json в памяти) или 'sqlite'
+STORAGE_BACKEND = 'json'
+SQLITE_PATH = os.path.join(os.path.dirname(__file__), 'baks_stats.sqlite3')
+# Бинарный снимок разобранных данных для быстрого старта (None — отключить)
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'baks_stats.snapshot')
 CALLBACK_LAST_PATH = os.path.join(os.path.dirname(__file__), 'callback_last.json')
 FONT_PATH = os.path.join(os.path.dirname(__file__), 'arialmt.ttf')
 LOG_LEVEL = 'INFO'
-EXPORT_FORMATS = ['csv', 'json', 'xlsx', 'pdf'] 
+EXPORT_FORMATS = ['csv', 'json', 'xlsx', 'pdf']
+# Экспорт: процессов сборки файлов (0 — потоки, EXPORT_THREADS), файлов в очереди, секунд на один файл.
+# Процессы запускаются при старте bot.py; если пул процессов упал, файлы собираются в потоках
+EXPORT_WORKERS = 1
+EXPORT_THREADS = 2
+EXPORT_QUEUE_SIZE = 8
+EXPORT_TIMEOUT = 120
+# CSV и JSON до EXPORT_INLINE_ROWS строк собираются сразу в памяти, остальное — в пуле через временный файл;
+# куски потоковой записи CSV/JSON в байтах; с EXPORT_PROGRESS_ROWS строк пользователь видит сообщение о подготовке
+EXPORT_INLINE_ROWS = 200
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_PROGRESS_ROWS = 300
+# Кэш готовых файлов экспорта на диске (по версии данных) и его предельный размер в байтах
+EXPORT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'export_cache')
+EXPORT_CACHE_BYTES = 64 * 1024 * 1024
+# Период проверки baks_stats.json на изменения, секунды
+RELOAD_INTERVAL = 5
+# Дополнительные написания имён: {'псевдоним': 'ник или карта как в данных'}
+PLAYER_ALIASES = {}
+MAP_ALIASES = {}
+# Графики: процессов рисования (0 — потоки, CHART_THREADS), графиков в очереди, секунд на один график.
+# Процессы запускаются при старте bot.py; если пул процессов упал, графики строятся в потоках
+CHART_WORKERS = 2
+CHART_THREADS = 2
+CHART_QUEUE_SIZE = 16
+CHART_TIMEOUT = 20
+# Чем рисовать простые графики: 'pillow' (быстро, сложные — всё равно matplotlib) или 'matplotlib'
+CHART_ENGINE = 'pillow'
+# Готовых графиков (PNG и file_id) в кэше
+CHART_CACHE_SIZE = 256
+# Прогрев кэша графиков после обновления данных: графиков за версию, пауза между ними в секундах
+PRERENDER_LIMIT = 48
+PRERENDER_DELAY = 1.0
+# Старт бота: фоновая подгрузка тяжёлых библиотек после начала приёма апдейтов,
+# бюджет времени import bot (python import_profile.py) и библиотеки, которые при старте грузиться не должны
+WARM_UP = True
+IMPORT_BUDGET_MS = 1000
+LAZY_MODULES = ['matplotlib', 'PIL', 'tabulate', 'fpdf', 'openpyxl', 'reportlab']
+# Замер импортов при старте в самом процессе бота: BAKS_PROFILE_IMPORTS=1 python bot.py пишет отчёт в лог
+PROFILE_IMPORTS = os.getenv('BAKS_PROFILE_IMPORTS') == '1'
+# Матчей на странице списка турниров и карточки игрока
+PAGE_SIZE = 8
+# /query: строк в ответе и в экспорте не больше
+QUERY_ROW_LIMIT = 20
+QUERY_EXPORT_LIMIT = 1000
+# Дата замены состава (ГГГГ-ММ-ДД) для окна «С замены состава»; None — окно не показывается
+ROSTER_CHANGE_DATE = None
@@ -1,136 +1,356 @@
+import asyncio
+import contextvars
 import json
+import logging
 import os
-from config import DATA_PATH
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from config import (
+    DATA_PATH, MAP_ALIASES, PLAYER_ALIASES, QUERY_ROW_LIMIT, RELOAD_INTERVAL, ROSTER_CHANGE_DATE, SNAPSHOT_PATH,
+    SQLITE_PATH, STORAGE_BACKEND
+)
+from stats_store import (
+    LOWER_IS_BETTER, METRICS, StatsStore, TEAM_NAME, opponent_of, parse_match, parse_stats, serialize_stats
+)
+from metric_columns import MetricColumns, summarize
+from sqlite_store import SqliteStore
+from name_resolver import NameResolver
+import query_dsl
+import snapshot_file
+import memo
 
-# Загрузка данных из baks_stats.json
-with open(DATA_PATH, encoding='utf-8') as f:
-    STATS = json.load(f)
+log = logging.getLogger(__name__)
 
+# Неизменяемый срез данных: всё, что нужно для ответа на запрос одной версии
+Snapshot = namedtuple('Snapshot', ['version', 'stats', 'store', 'columns', 'source_mtime'])
 
+
+# Файл, изменения которого отслеживаются для перезагрузки
+SOURCE_PATH = SQLITE_PATH if STORAGE_BACKEND == 'sqlite' else DATA_PATH
+
+
+def build_snapshot(path=SOURCE_PATH, version=1):
+    """Строит срез: для JSON — берёт бинарный снимок или читает файл и строит индексы
+    и колонки метрик; для SQLite — открывает базу"""
+    if STORAGE_BACKEND == 'sqlite':
+        store = SqliteStore(path)
+        return Snapshot(version, None, store, None, os.stat(path).st_mtime_ns)
+    if SNAPSHOT_PATH:
+        cached = snapshot_file.load(SNAPSHOT_PATH, path)
+        if cached is not None:
+            stats, store, columns = cached
+            return Snapshot(version, stats, store, columns, os.stat(path).st_mtime_ns)
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    stats = parse_stats(json.loads(raw))
+    store = StatsStore(stats)
+    columns = MetricColumns(store)
+    if SNAPSHOT_PATH:
+        snapshot_file.save(SNAPSHOT_PATH, st, raw, (stats, store, columns))
+    return Snapshot(version, stats, store, columns, st.st_mtime_ns)
+
+
+_snapshot = build_snapshot()
+# Срез, закреплённый за текущим апдейтом (см. middlewares.SnapshotMiddleware)
+_pinned = contextvars.ContextVar('stats_snapshot', default=None)
+_failed_mtime = None
+_written_mtime = None
+# Запись добавленных матчей на диск идёт в отдельном потоке по одной
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-writer')
+_persist_lock = threading.Lock()
+# Публикация версий: перезагрузка файла и добавление матча не публикуют срезы одновременно
+_publish_lock = threading.Lock()
+REQUIRED_MATCH_KEYS = ('tournament', 'date', 'teams', 'score', 'overall', 'maps')
+
+
+def current_snapshot():
+    """Срез, на котором работает текущий обработчик (или последний опубликованный)"""
+    return _pinned.get() or _snapshot
+
+
+def pin_snapshot():
+    """Закрепляет последний срез за текущим контекстом до конца обработки апдейта"""
+    _pinned.set(_snapshot)
+    return _snapshot
+
+
+def publish_snapshot(snapshot):
+    """Атомарно подменяет опубликованный срез"""
+    global _snapshot
+    previous, _snapshot = _snapshot, snapshot
+    if isinstance(previous.store, SqliteStore) and previous.store is not snapshot.store:
+        # Соединения заменённой базы больше не нужны; закрепивший её обработчик переоткроет своё
+        previous.store.close()
+    # Ключи кэшей содержат версию, очистка лишь сразу освобождает память
+    memo.clear_all()
+    log.info('Данные статистики обновлены: версия %s', snapshot.version)
+
+
+def _store():
+    return current_snapshot().store
+
+
+def data_version():
+    """Версия данных текущего среза"""
+    return current_snapshot().version
+
+
+def latest_version():
+    """Версия последнего опубликованного среза, даже если за контекстом закреплён более старый"""
+    return _snapshot.version
+
+
+async def reload_if_changed(path=SOURCE_PATH):
+    """Перечитывает файл вне event loop, если он изменился. Возвращает True при обновлении"""
+    global _failed_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+    if mtime in (_snapshot.source_mtime, _failed_mtime, _written_mtime) or _persist_lock.locked():
+        return False
+    base = _snapshot
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, build_snapshot, path, base.version + 1)
+    except Exception:
+        # Битый файл не трогаем до следующей записи, продолжаем работать на старом срезе
+        _failed_mtime = mtime
+        log.exception('Не удалось перечитать %s', path)
+        return False
+    with _publish_lock:
+        if _snapshot is not base:
+            # Пока файл читался, ingest_match опубликовал матч, которого в прочитанном файле
+            # может не быть: такой срез не публикуем, файл проверяется снова на следующем шаге
+            log.info('Перечитанный %s устарел: вышла версия %s', path, _snapshot.version)
+            return False
+        publish_snapshot(snapshot)
+    return True
+
+
+def _persist(stats, path):
+    """Атомарно перезаписывает файл данных (через временный файл)"""
+    global _written_mtime
+    with _persist_lock:
+        data = serialize_stats(stats)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        # Собственную запись наблюдатель перечитывать не должен
+        _written_mtime = os.stat(path).st_mtime_ns
+
+
+def ingest_match(match_dict, persist=True):
+    """Добавляет матч и публикует новую версию. Возвращает номер новой версии.
+
+    Следующая версия делит структуру с текущей (StatsStore.with_match,
+    MetricColumns.with_match): матч дописывается в общие списки и буферы колонок
+    за концом текущей версии, копируются только затронутые суммы и поверхностно —
+    словари верхнего уровня. Это O(игроков в матче) плюс копия словаря id матчей
+    (массив ссылок). Обработчики, закрепившие прошлую версию, матча не видят. Для
+    SQLite запись идёт прямо в базу. Запись JSON на диск выполняется в фоне.
+    """
+    missing = [key for key in REQUIRED_MATCH_KEYS if key not in match_dict]
+    if missing:
+        raise ValueError(f'В матче нет полей: {", ".join(missing)}')
+    if TEAM_NAME not in match_dict['teams']:
+        raise ValueError(f'{TEAM_NAME} не участвует в матче')
+    global _written_mtime
+    with _publish_lock:
+        snapshot = _snapshot
+        # Суффиксы -N даёт только разбор файла: без явного id совпадение турнира, даты,
+        # времени и команд с загруженным матчем считается повторной загрузкой того же матча
+        generated = not match_dict.get('id')
+        match = parse_match(match_dict)
+        if snapshot.store.match_by_id(match['id']) is not None:
+            hint = ' (другой матч с теми же турниром, датой, временем и командами добавляйте с явным id)'
+            raise ValueError(f'Матч {match["id"]} уже загружен' + (hint if generated else ''))
+        version = snapshot.version + 1
+        if snapshot.stats is None:
+            # SQLite: запись и есть сохранение
+            snapshot.store.add_match(match)
+            _written_mtime = os.stat(SOURCE_PATH).st_mtime_ns
+            published = snapshot._replace(version=version)
+        else:
+            store = snapshot.store.with_match(match)
+            # Список матчей версии — тот же, что в хранилище (SharedList, без копии)
+            stats = {**snapshot.stats, 'match_info': store.matches}
+            columns = snapshot.columns.with_match(match, len(store.matches) - 1)
+            published = Snapshot(version, stats, store, columns, snapshot.source_mtime)
+            if persist:
+                _writer.submit(_persist, stats, DATA_PATH)
+        publish_snapshot(published)
+    return version
+
+
+async def watch_data_file(path=SOURCE_PATH, interval=RELOAD_INTERVAL):
+    """Фоновая задача: следит за mtime файла данных и публикует новые срезы"""
+    while True:
+        await asyncio.sleep(interval)
+        await reload_if_changed(path)
+
+
+def resolve_window(window='all'):
+    """Приводит окно к виду хранилища (stats_store.parse_window): 'month' и 'roster' — к 'since:<дата>'.
+
+    Дата подставляется до кэша, чтобы результат за «этот месяц» не пережил смену месяца.
+    """
+    if window == 'month':
+        return f'since:{date.today():%Y-%m}-01'
+    if window == 'roster':
+        return f'since:{ROSTER_CHANGE_DATE}' if ROSTER_CHANGE_DATE else 'all'
+    return window
+
+
+@memo.versioned(data_version, maxsize=4)
 def get_tournaments():
     """Возвращает словарь турниров с матчами"""
-    tournaments = {}
-    for match in STATS['match_info']:
-        t = match['tournament']
-        if t not in tournaments:
-            tournaments[t] = []
-        tournaments[t].append(match)
-    return tournaments
+    return {t: list(matches) for t, matches in _store().tournament_index().items()}
 
 
+@memo.versioned(data_version, maxsize=16)
 def get_games(tournament=None):
     """Возвращает список игр с возможностью фильтрации по турниру"""
     games = []
-    for match in STATS['match_info']:
-        if tournament is None or match['tournament'] == tournament:
-            for i, m in enumerate(match['maps'], 1):
-                games.append({
-                    'id': f"{match['date']}#{i}",
-                    'tournament': match['tournament'],
-                    'opponent': [t for t in match['teams'] if t != 'BAKS'][0],
-                    'score': m['score'],
-                    'map': m['name'],
-                    'date': match['date'],
-                    'mvp': max(m['players']['both'], key=lambda p: p.get('Rating', 0))['nickname'] if m['players']['both'] else '-'
-                })
+    store = _store()
+    if tournament is None:
+        matches = store.all_matches()
+    else:
+        matches = store.tournament_index().get(tournament, [])
+    for match in matches:
+        for i, m in enumerate(match['maps'], 1):
+            games.append({
+                'id': f"{match['date']}#{i}",
+                'tournament': match['tournament'],
+                'opponent': opponent_of(match),
+                'score': m['score'],
+                'map': m['name'],
+                'date': match['date'],
+                'mvp': max(m['players']['both'], key=lambda p: p.get('Rating', 0))['nickname'] if m['players']['both'] else '-'
+            })
     return games
 
 
+@memo.versioned(data_version, maxsize=4)
 def get_players():
     """Возвращает список всех игроков"""
-    players = {}
-    for match in STATS['match_info']:
-        for p in match['overall']['players']['both']:
-            players[p['nickname']] = p
-    return list(players.keys())
-
-
-def get_player_stats(nickname):
-    """Возвращает статистику игрока по всем матчам"""
-    stats = []
-    for match in STATS['match_info']:
-        opponent = [t for t in match['teams'] if t != 'BAKS'][0]
-        for p in match['overall']['players']['both']:
-            if p['nickname'].lower() == nickname.lower():
-                stats.append({
-                    'tournament': match['tournament'],
-                    'date': match['date'],
-                    'opponent': opponent,
-                    'K': p['K'],
-                    'D': p['D'],
-                    'ADR': p['ADR'],
-                    'Rating': p['Rating'],
-                    'KAST': p['KAST'],
-                    'OpK-D': p['OpK-D'],
-                    'MKs': p['MKs'],
-                    '1vsX': p.get('1vsX', 0),
-                    'HS': p['HS'],
-                    'A': p['A'],
-                    'A_f': p['A_f'],
-                    'D_t': p['D_t']
-                })
-    return stats
+    return _store().players()
+
+
+def get_player_stats(nickname, window='all'):
+    """Возвращает статистику игрока по всем матчам или за окно
+    (записи PlayerLine с датой, турниром и соперником)"""
+    return _player_stats(nickname, resolve_window(window))
+
+
+@memo.versioned(data_version)
+def _player_stats(nickname, window):
+    return _store().player_stats(nickname, window)
+
+
+@memo.versioned(data_version, maxsize=2)
+def _player_resolver():
+    return NameResolver(_store().players(), PLAYER_ALIASES)
+
+
+@memo.versioned(data_version, maxsize=2)
+def _map_resolver():
+    return NameResolver(_store().map_names(), MAP_ALIASES, strip_prefixes=('de_',))
 
 
+def resolve_player(name):
+    """Ник как в данных по написанию пользователя (регистр, псевдоним, начало ника) или None"""
+    return _player_resolver().resolve(name)
+
+
+def resolve_map(name):
+    """Название карты как в данных (Dust2 для dust2, de_dust2, DUST 2) или None"""
+    return _map_resolver().resolve(name)
+
+
+def suggest_players(name, limit=3):
+    """Похожие ники для подсказки «возможно, вы имели в виду»"""
+    return _player_resolver().suggest(name, limit)
+
+
+def suggest_maps(name, limit=3):
+    """Похожие названия карт для подсказки «возможно, вы имели в виду»"""
+    return _map_resolver().suggest(name, limit)
+
+
+@memo.versioned(data_version, maxsize=4)
 def get_maps():
     """Возвращает словарь карт с матчами"""
-    maps = {}
-    for match in STATS['match_info']:
-        for m in match['maps']:
-            map_copy = m.copy()
-            map_copy['date'] = match['date']
-            map_copy['tournament'] = match['tournament']
-            map_copy['opponent'] = [t for t in match['teams'] if t != 'BAKS'][0]
-            if m['name'] not in maps:
-                maps[m['name']] = []
-            maps[m['name']].append(map_copy)
-    return maps
+    return {name: list(maps) for name, maps in _store().map_index().items()}
+
+
+def get_map_stats(map_name, window='all'):
+    """Возвращает статистику по конкретной карте за все матчи или за окно
+    (название — в любом написании, понятном resolve_map)"""
+    map_name = resolve_map(map_name)
+    if map_name is None:
+        return []
+    return _map_stats(map_name, resolve_window(window))
 
 
-def get_map_stats(map_name):
-    """Возвращает статистику по конкретной карте"""
-    maps = get_maps()
-    return maps.get(map_name.capitalize(), [])
+@memo.versioned(data_version, maxsize=64)
+def _map_stats(map_name, window):
+    return _store().map_entries(map_name, window)
 
 
 def get_match_by_index(idx):
-    """Возвращает матч по индексу (1-based)"""
-    matches = []
-    for t_matches in get_tournaments().values():
-        matches.extend(t_matches)
+    """Возвращает матч по позиции в списке (1-based); для ссылок используйте get_match_by_id"""
+    matches = get_match_list()
     if 1 <= idx <= len(matches):
         return matches[idx - 1]
     return None
 
 
+@memo.versioned(data_version)
+def get_match_by_id(match_id):
+    """Возвращает матч по стабильному id"""
+    return _store().match_by_id(match_id)
+
+
+def get_player_match(nickname, match_id):
+    """Возвращает запись игрока за матч с заданным id (ник — в любом написании, понятном resolve_player)"""
+    nickname = resolve_player(nickname)
+    if nickname is None:
+        return None
+    return _player_match(nickname, match_id)
+
+
+@memo.versioned(data_version)
+def _player_match(nickname, match_id):
+    return _store().player_match(nickname, match_id)
+
+
+@memo.versioned(data_version, maxsize=4)
 def get_match_list():
     """Возвращает список всех матчей"""
-    matches = []
-    for t_matches in get_tournaments().values():
-        matches.extend(t_matches)
-    return matches
+    return _store().match_list()
+
+
+@memo.versioned(data_version, maxsize=2)
+def get_match_positions():
+    """Позиции id матчей в get_match_list — для листания по курсору"""
+    return {match['id']: i for i, match in enumerate(get_match_list())}
 
 
+@memo.versioned(data_version)
 def get_best_map_for_player(nickname):
     """Возвращает лучшую карту игрока"""
-    best = None
-    best_rating = 0
-    for match in STATS['match_info']:
-        for m in match['maps']:
-            for p in m['players']['both']:
-                if p['nickname'].lower() == nickname.lower() and p['Rating'] > best_rating:
-                    best_rating = p['Rating']
-                    best = (m['name'], best_rating)
-    return best
+    return _store().best_map(nickname)
 
 
+@memo.versioned(data_version)
 def get_last_match_for_player(nickname):
     """Возвращает последний матч игрока"""
-    for match in reversed(STATS['match_info']):
-        for p in match['overall']['players']['both']:
-            if p['nickname'].lower() == nickname.lower():
-                return match
-    return None
+    return _store().last_match(nickname)
 
 
 def get_side_stats(map_stats, side):
@@ -138,51 +358,90 @@ def get_side_stats(map_stats, side):
     return map_stats['players'][side]
 
 
-def get_player_averages():
-    """Возвращает средние показатели всех игроков по всем матчам"""
-    players_avg = {}
-    players_count = {}
-
-    def safe_float(value):
-        """Безопасно конвертирует значение в float"""
-        if isinstance(value, (int, float)):
-            return float(value)
-        elif isinstance(value, str):
-            clean_value = value.replace('%', '').replace(' ', '')
-            try:
-                return float(clean_value)
-            except:
-                return 0.0
-        else:
-            return 0.0
-
-    for match in STATS['match_info']:
-        for p in match['overall']['players']['both']:
-            nickname = p['nickname']
-            if nickname not in players_avg:
-                players_avg[nickname] = {
-                    'K': 0, 'D': 0, 'ADR': 0, 'Rating': 0, 'KAST': 0,
-                    'OpK-D': 0, 'MKs': 0, '1vsX': 0, 'HS': 0, 'A': 0, 'A_f': 0, 'D_t': 0
-                }
-                players_count[nickname] = 0
-
-            players_count[nickname] += 1
-            players_avg[nickname]['K'] += safe_float(p['K'])
-            players_avg[nickname]['D'] += safe_float(p['D'])
-            players_avg[nickname]['ADR'] += safe_float(p['ADR'])
-            players_avg[nickname]['Rating'] += safe_float(p['Rating'])
-            players_avg[nickname]['OpK-D'] += safe_float(p['OpK-D'])
-            players_avg[nickname]['MKs'] += safe_float(p['MKs'])
-            players_avg[nickname]['1vsX'] += safe_float(p.get('1vsX', 0))
-            players_avg[nickname]['HS'] += safe_float(p['HS'])
-            players_avg[nickname]['A'] += safe_float(p['A'])
-            players_avg[nickname]['A_f'] += safe_float(p['A_f'])
-            players_avg[nickname]['D_t'] += safe_float(p['D_t'])
-            players_avg[nickname]['KAST'] += safe_float(p['KAST'])
-
-    for nickname in players_avg:
-        count = players_count[nickname]
-        for key in players_avg[nickname]:
-            players_avg[nickname][key] = round(players_avg[nickname][key] / count, 2)
-
-    return players_avg 
\ No newline at end of file
+def get_player_averages(window='all'):
+    """Возвращает средние показатели всех игроков по всем матчам или за окно"""
+    return _player_averages(resolve_window(window))
+
+
+@memo.versioned(data_version, maxsize=16)
+def _player_averages(window):
+    snapshot = current_snapshot()
+    if snapshot.columns is None:
+        # SQLite: одним GROUP BY в базе
+        means = snapshot.store.averages(window)
+    else:
+        # Все метрики всех игроков — одним bincount по колонкам (окно — маска по позициям матчей)
+        columns = snapshot.columns
+        means = columns.group_by_player(mask=columns.mask(matches=snapshot.store.window_positions(window)))
+    return {
+        nickname: {key: round(value, 2) for key, value in stats.items()}
+        for nickname, stats in means.items()
+    }
+
+
+@memo.versioned(data_version, maxsize=4)
+def get_player_progress():
+    """Рейтинг игроков в первом и последнем матче: [(ник, первый, последний)]"""
+    return _store().progress()
+
+
+@memo.versioned(data_version, maxsize=256)
+def get_metric_summary(metric, nickname=None, map_name=None, side='both'):
+    """Сводка по метрике (среднее, сумма, min/max, σ, квартили) для игрока, карты и стороны"""
+    snapshot = current_snapshot()
+    if snapshot.columns is None:
+        return summarize(snapshot.store.metric_values(metric, nickname, map_name, side))
+    columns = snapshot.columns
+    return columns.summary(metric, columns.mask(player=nickname, map_name=map_name, side=side))
+
+
+@memo.versioned(data_version)
+def get_player_map_stats(nickname):
+    """Средние показатели игрока по каждой карте: {карта: {метрика: среднее, 'count': n}}"""
+    return _store().player_map_averages(nickname)
+
+
+@memo.versioned(data_version)
+def get_player_side_split(nickname):
+    """Средние игрока по картам и сторонам: {карта: {сторона: {метрика: среднее, 'count': n}}}"""
+    return _store().player_map_side_averages(nickname)
+
+
+@memo.versioned(data_version, maxsize=4)
+def get_team_side_strength():
+    """Средние команды по картам и сторонам: {карта: {сторона: {метрика: среднее, 'count': n}}}"""
+    return _store().map_side_averages()
+
+
+@memo.versioned(data_version)
+def get_player_map_extremes(nickname, side='both'):
+    """Лучшая и худшая карта игрока по каждой метрике:
+    {метрика: (лучшая карта, значение, худшая карта, значение)}"""
+    by_map = {name: sides[side] for name, sides in get_player_side_split(nickname).items() if side in sides}
+    if not by_map:
+        return {}
+    extremes = {}
+    for metric in METRICS:
+        ranked = sorted(by_map, key=lambda name: by_map[name][metric], reverse=metric not in LOWER_IS_BETTER)
+        best, worst = ranked[0], ranked[-1]
+        extremes[metric] = (best, by_map[best][metric], worst, by_map[worst][metric])
+    return extremes
+
+
+@memo.versioned(data_version, maxsize=64)
+def run_query(text, max_limit=QUERY_ROW_LIMIT):
+    """Выполняет запрос /query (см. query_dsl.compile_query): (колонки, строки, всего строк).
+
+    Для JSON — над колонками метрик, для SQLite — одним SQL-запросом.
+    Ошибки разбора — query_dsl.QueryError.
+    """
+    plan = query_dsl.compile_query(text, max_limit)
+    snapshot = current_snapshot()
+    if snapshot.columns is None:
+        return query_dsl.execute_sql(plan, snapshot.store.conn, resolve_player, resolve_map)
+    return query_dsl.execute_columns(plan, snapshot.columns, snapshot.store.matches, resolve_player, resolve_map)
+
+
+def get_cache_stats():
+    """Попадания и промахи кэшей производных запросов"""
+    return memo.cache_stats()
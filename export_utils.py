@@ -3,36 +3,101 @@ import json
 import csv
 import textwrap
 import os
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import StringIO
-from fpdf import FPDF
-from config import FONT_PATH
+from config import (
+    EXPORT_CACHE_BYTES, EXPORT_CACHE_DIR, EXPORT_CHUNK_SIZE, EXPORT_INLINE_ROWS, EXPORT_QUEUE_SIZE, EXPORT_THREADS,
+    EXPORT_TIMEOUT, EXPORT_WORKERS, FONT_PATH
+)
 from datetime import datetime
-from openpyxl import Workbook
+import memo
+
+log = logging.getLogger(__name__)
 
 HISTORY_PATH = os.path.join(os.path.dirname(__file__), 'history.json')
+# Библиотеки форматов загружаются при первом экспорте; warm_up подгружает их заранее
+EXPORT_MODULES = (
+    'openpyxl', 'reportlab.platypus', 'reportlab.pdfbase.ttfonts', 'reportlab.lib.styles'
+)
 
-def export_to_csv(data, description):
-    """Экспорт данных в CSV формат"""
+
+def warm_up():
+    """Импортирует библиотеки экспорта, чтобы первый экспорт не ждал загрузки"""
+    import importlib
+    for name in EXPORT_MODULES:
+        importlib.import_module(name)
+
+
+class ExportError(Exception):
+    """Файл не подготовлен; текст показывается пользователю"""
+
+
+class ExportBusy(ExportError):
+    """Очередь экспорта заполнена"""
+
+
+class ExportTimeout(ExportError):
+    """Файл готовился дольше EXPORT_TIMEOUT"""
+
+
+def iter_csv(data, chunk_size=EXPORT_CHUNK_SIZE):
+    """CSV кусками байтов примерно по chunk_size: файл не собирается в одну строку"""
+    if not data:
+        return
     buf = StringIO()
-    if data:
-        writer = csv.DictWriter(buf, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-    return io.BytesIO(buf.getvalue().encode('utf-8'))
+    writer = csv.DictWriter(buf, fieldnames=data[0].keys())
+    writer.writeheader()
+    for row in data:
+        writer.writerow(row)
+        if buf.tell() >= chunk_size:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
 
 
-def export_to_json(data, description):
-    """Экспорт данных в JSON формат"""
+def iter_json(data, description, chunk_size=EXPORT_CHUNK_SIZE):
+    """JSON кусками байтов примерно по chunk_size; текст тот же, что у json.dumps(indent=2)"""
     output = {
         "description": description,
         "export_date": datetime.now().isoformat(),
         "data": data
     }
-    return io.BytesIO(json.dumps(output, ensure_ascii=False, indent=2).encode('utf-8'))
+    parts = []
+    size = 0
+    for part in json.JSONEncoder(ensure_ascii=False, indent=2).iterencode(output):
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts).encode('utf-8')
+
+
+def export_to_csv(data, description):
+    """Экспорт данных в CSV формат"""
+    return io.BytesIO(b''.join(iter_csv(data)))
+
+
+def export_to_json(data, description):
+    """Экспорт данных в JSON формат"""
+    return io.BytesIO(b''.join(iter_json(data, description)))
 
 
 def export_to_xlsx(data, description):
     """Экспорт данных в Excel формат"""
+    from openpyxl import Workbook
     wb = Workbook()
     ws = wb.active
     ws.title = "Stats"
@@ -54,6 +119,7 @@ def export_to_xlsx(data, description):
 
 def export_to_pdf(data, description, filename):
     """Экспорт данных в PDF формат"""
+    from fpdf import FPDF
     pdf = FPDF()
     pdf.add_page()
     
@@ -191,6 +257,277 @@ def export_data(data, description, filename, format_type):
         raise ValueError('Неизвестный формат экспорта')
 
 
+def write_export(data, description, filename, format_type, out):
+    """Пишет файл экспорта в бинарный файл out: CSV и JSON — по кускам, по мере сериализации"""
+    if format_type == 'csv':
+        chunks = iter_csv(data)
+    elif format_type == 'json':
+        chunks = iter_json(data, description)
+    else:
+        # openpyxl и reportlab собирают документ целиком сами
+        shutil.copyfileobj(export_data(data, description, filename, format_type), out)
+        return
+    for chunk in chunks:
+        out.write(chunk)
+
+
+def _export_job(data, description, filename, format_type, path):
+    """Задача пула: файл экспорта пишется на диск, в event loop возвращается только размер"""
+    with open(path, 'wb') as out:
+        write_export(data, description, filename, format_type, out)
+    return os.path.getsize(path)
+
+
+def _warm_up_worker():
+    return True
+
+
+_pool = None
+_pending = 0
+
+
+def _mp_context():
+    # fork: процессу не нужно заново импортировать bot.py; на Windows — только spawn
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+
+def launch():
+    """Создаёт пул процессов экспорта (EXPORT_WORKERS > 0).
+
+    Вызывается при старте bot.py до event loop и до первых потоков, как
+    charts.launch(): fork из многопоточного процесса небезопасен.
+    """
+    global _pool
+    if EXPORT_WORKERS > 0 and _pool is None:
+        # Библиотеки форматов (warm_up) загружаются в процессах пула, а не в процессе бота
+        _pool = ProcessPoolExecutor(EXPORT_WORKERS, mp_context=_mp_context(), initializer=warm_up)
+        _pool.submit(_warm_up_worker)
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        # Без launch() или после падения пула файлы собираются в потоках
+        _pool = ThreadPoolExecutor(EXPORT_THREADS, thread_name_prefix='export', initializer=warm_up)
+    return _pool
+
+
+async def start():
+    """Дожидается загрузки библиотек форматов в пуле экспорта, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    pool = _executor()
+    processes = isinstance(pool, ProcessPoolExecutor)
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_up_worker) for _ in range(EXPORT_WORKERS if processes else 1)))
+    log.info('Пул экспорта запущен: %s', f'{EXPORT_WORKERS} процессов' if processes else f'{EXPORT_THREADS} потоков')
+
+
+def shutdown():
+    """Останавливает пул (при остановке бота)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _release():
+    global _pending
+    _pending -= 1
+
+
+def _call_soon(loop, callback):
+    # Колбэк future пула вызывается в его служебном потоке; счётчик меняем в потоке event loop
+    with contextlib.suppress(RuntimeError):
+        loop.call_soon_threadsafe(callback)
+
+
+def runs_in_pool(data, format_type):
+    """Готовится ли файл в пуле: XLSX и PDF — всегда, CSV и JSON — больше EXPORT_INLINE_ROWS строк"""
+    return format_type not in ('csv', 'json') or len(data) > EXPORT_INLINE_ROWS
+
+
+@contextlib.asynccontextmanager
+async def prepared_export(data, description, filename, format_type):
+    """Файл экспорта, подготовленный вне event loop: async with даёт открытый бинарный файл.
+
+    Небольшие CSV и JSON собираются сразу в памяти. Остальное пишется в пуле во
+    временный файл, который отправляется с диска и удаляется на выходе из with.
+    ExportBusy — в очереди уже EXPORT_QUEUE_SIZE файлов, ExportTimeout — файл не
+    успел за EXPORT_TIMEOUT секунд.
+    """
+    global _pending
+    if format_type not in ('csv', 'json', 'xlsx', 'pdf'):
+        raise ValueError('Неизвестный формат экспорта')
+    if not runs_in_pool(data, format_type):
+        yield export_data(data, description, filename, format_type)
+        return
+    if _pending >= EXPORT_QUEUE_SIZE:
+        raise ExportBusy('⏳ Сейчас готовится много файлов, попробуйте через минуту.')
+    fd, path = tempfile.mkstemp(prefix='export_', suffix=f'.{format_type}')
+    os.close(fd)
+    try:
+        loop = asyncio.get_running_loop()
+        try:
+            job = _executor().submit(_export_job, data, description, filename, format_type, path)
+            _pending += 1
+            # Место в очереди освобождается, когда файл дописан в пуле, а не когда его
+            # перестали ждать: после таймаута пул ещё занят этим файлом
+            job.add_done_callback(lambda _: _call_soon(loop, _release))
+            await asyncio.wait_for(asyncio.wrap_future(job), EXPORT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ExportTimeout('⏳ Файл готовится слишком долго, попробуйте позже.')
+        except BrokenProcessPool:
+            log.exception('Пул процессов экспорта упал, дальше файлы собираются в потоках')
+            shutdown()
+            raise ExportError('❌ Не удалось подготовить файл, попробуйте ещё раз.')
+        with open(path, 'rb') as f:
+            yield f
+    finally:
+        # После таймаута процесс пула может ещё писать файл, и на Windows удалить его не выйдет
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+# Файл в кэше экспорта: путь на диске, размер в байтах, имя документа, подпись и file_id после первой отправки
+CachedExport = namedtuple('CachedExport', ['path', 'size', 'filename', 'caption', 'file_id'])
+
+
+class ExportCache(memo.VersionedCache):
+    """LRU-кэш файлов экспорта: содержимое лежит в directory, в памяти — только CachedExport.
+
+    Давно не отправлявшиеся файлы вытесняются, пока общий размер больше maxbytes;
+    файл больше maxbytes в кэш не попадает. Очищается вместе с остальными кэшами
+    при перезагрузке данных. Вытесненные файлы удаляются в отдельном потоке:
+    clear и put вызываются и из event loop.
+    """
+
+    def __init__(self, name, directory, maxbytes):
+        super().__init__(name, maxsize=None)
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self._ready = False
+        # Поток создаётся при первом удалении, то есть уже после fork пулов в launch()
+        self._disk = ThreadPoolExecutor(1, thread_name_prefix='export-cache')
+
+    def add(self, key, fileobj, filename, caption):
+        """Копирует файл из fileobj на диск и кладёт его в кэш без file_id; возвращает CachedExport"""
+        with self._lock:
+            # add вызывается из потоков: каталог очищается один раз, до первой копии
+            if not self._ready:
+                # Файлы прошлого запуска: ни версия данных, ни file_id от них не сохранились
+                shutil.rmtree(self.directory, ignore_errors=True)
+                os.makedirs(self.directory, exist_ok=True)
+                self._ready = True
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=os.path.splitext(filename)[1])
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(fileobj, out)
+        entry = CachedExport(path, os.path.getsize(path), filename, caption, None)
+        self.put(key, entry)
+        return entry
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+                if old.path != value.path:
+                    evicted.append(old)
+            if value.size > self.maxbytes:
+                # Ради одного огромного файла остальной кэш не вытесняем
+                self._remove(evicted + [value])
+                return
+            self._data[key] = value
+            self.bytes += value.size
+            while self.bytes > self.maxbytes:
+                _, entry = self._data.popitem(last=False)
+                self.bytes -= entry.size
+                evicted.append(entry)
+        self._remove(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.bytes -= entry.size
+        self._remove([entry])
+        return entry
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._data.values())
+            self._data.clear()
+            self.bytes = 0
+        self._remove(entries)
+
+    def stats(self):
+        return {**super().stats(), 'bytes': self.bytes, 'maxbytes': self.maxbytes}
+
+    def _remove(self, entries):
+        if entries:
+            self._disk.submit(_delete_files, [entry.path for entry in entries])
+
+
+def _delete_files(paths):
+    for path in paths:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+# (версия данных, тип и id экспорта из callback, окно в виде хранилища или None, формат) -> CachedExport
+_cache = ExportCache('exports', EXPORT_CACHE_DIR, EXPORT_CACHE_BYTES)
+
+
+async def answer_cached_export(message, key):
+    """Повторяет файл из кэша экспорта: по file_id без загрузки, если Telegram его не принял — с диска.
+
+    Возвращает CachedExport или None, если файла в кэше нет.
+    """
+    from aiogram.types import InputFile
+    from aiogram.utils.exceptions import BadRequest
+    cached = _cache.get(key)
+    if cached is None:
+        return None
+    if cached.file_id is not None:
+        try:
+            await message.answer_document(cached.file_id, caption=cached.caption)
+            return cached
+        except BadRequest:
+            log.warning('file_id экспорта %s отклонён, отправляем файл', key)
+    try:
+        f = open(cached.path, 'rb')
+    except OSError:
+        # Файл удалили с диска — экспорт соберётся заново
+        _cache.pop(key)
+        return None
+    with f:
+        sent = await message.answer_document(InputFile(f, filename=cached.filename), caption=cached.caption)
+    document = getattr(sent, 'document', None)
+    if document is not None:
+        _cache.put(key, cached._replace(file_id=document.file_id))
+    return cached
+
+
+async def answer_export(message, key, data, description, filename, format_type):
+    """Готовит файл экспорта (prepared_export), отправляет его и кладёт в кэш под key вместе с file_id"""
+    from aiogram.types import InputFile
+    name = f'{filename}.{format_type}'
+    caption = f'📤 {description}'
+    loop = asyncio.get_running_loop()
+    async with prepared_export(data, description, filename, format_type) as f:
+        # Копия в кэш — до отправки: InputFile закрывает файл. Копирование идёт
+        # в потоке, чтобы большой файл не задерживал event loop
+        entry = await loop.run_in_executor(None, _cache.add, key, f, name, caption)
+        f.seek(0)
+        sent = await message.answer_document(InputFile(f, filename=name), caption=caption)
+    document = getattr(sent, 'document', None)
+    if document is not None and key in _cache:
+        _cache.put(key, entry._replace(file_id=document.file_id))
+    return sent
+
+
 def log_history(user_id, username, action, params=None):
     entry = {
         'user_id': user_id,
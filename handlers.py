@@ -1,31 +1,101 @@
-import io
-import matplotlib.pyplot as plt
-from tabulate import tabulate
+from table_format import fancy_grid
 from aiogram import types
 from aiogram.types import InputFile
 import json
 import os
-from config import FONT_PATH
+from html import escape
+from config import FONT_PATH, PAGE_SIZE
 from data_loader import (
     get_player_averages, get_player_stats, get_maps, get_map_stats,
-    get_tournaments, get_match_by_index, get_best_map_for_player,
-    get_last_match_for_player, get_players, get_match_list
+    get_tournaments, get_best_map_for_player,
+    get_last_match_for_player, get_player_match, get_players, get_match_list, get_match_positions, get_player_progress,
+    resolve_player, resolve_map, resolve_window, suggest_players, suggest_maps, run_query, data_version
 )
-from keyboards import main_menu, export_format_keyboard, players_chart_keyboard
-from export_utils import export_data, HISTORY_PATH
+import memo
+from query_dsl import QueryError, remember
+from keyboards import main_menu, export_format_keyboard, players_chart_keyboard, window_buttons, page_buttons
+from export_utils import export_data, log_history, HISTORY_PATH
+import charts
+
+
+def window_title(window):
+    """Подпись окна выборки для заголовков: «по всем матчам», «за этот месяц»..."""
+    titles = {
+        'all': 'по всем матчам',
+        'month': 'за этот месяц',
+        'roster': 'с замены состава'
+    }
+    if window in titles:
+        return titles[window]
+    if window.startswith('last'):
+        return f'за последние {window[4:]} матчей'
+    return window
+
+
+def window_suffix(window):
+    """Суффикс окна для callback_data и имён файлов экспорта (для всех матчей — пустой)"""
+    return '' if window == 'all' else f'_{window}'
+
+
+def page_bounds(positions, cursor, total):
+    """Страница по курсору — id первого матча страницы.
+
+    Возвращает (начало, конец, начало предыдущей, начало следующей); соседних страниц
+    может не быть (None). Неизвестный курсор (матч удалён) — первая страница.
+    """
+    start = positions.get(cursor, 0) if cursor is not None else 0
+    end = min(start + PAGE_SIZE, total)
+    prev_start = max(start - PAGE_SIZE, 0) if start > 0 else None
+    next_start = end if end < total else None
+    return start, end, prev_start, next_start
+
+
+def page_title(start, total):
+    """Подпись «Страница N из M» или пустая строка, если страница одна"""
+    if total <= PAGE_SIZE:
+        return ''
+    pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    return f'📄 <b>Страница {start // PAGE_SIZE + 1} из {pages}</b>\n'
 
 
-def render_player_card(name, stats, with_keyboard=True):
-    """Унификация вывода карточки игрока"""
+def suggestion_reply(text, names, callback_prefix):
+    """Дополняет ответ «не найдено» подсказкой «возможно, вы имели в виду» с кнопками"""
+    if not names:
+        return text, None
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    keyboard = InlineKeyboardMarkup()
+    for name in names:
+        keyboard.add(InlineKeyboardButton(text=name, callback_data=f"{callback_prefix}{name}"))
+    text += '\n\n🤔 <b>Возможно, вы имели в виду:</b> ' + ', '.join(f'<code>{name}</code>' for name in names)
+    return text, keyboard
+
+
+def format_metric(metric, value):
+    """Среднее значение метрики для таблиц: рейтинг — 2 знака, KAST — с процентом, остальное — 1 знак"""
+    if metric == 'Rating':
+        return f'{value:.2f}'
+    if metric == 'KAST':
+        return f'{value:.1f}%'
+    return f'{value:.1f}'
+
+
+def render_player_card(name, stats, with_keyboard=True, window='all', cursor=None):
+    """Унификация вывода карточки игрока; кнопки матчей — по страницам от курсора"""
     if not stats:
-        return '❌ Игрок не найден.', None
+        if window == 'all':
+            return '❌ Игрок не найден.', None
+        # За период матчей нет — оставляем выбор другого окна
+        keyboard = None
+        if with_keyboard:
+            from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+            keyboard = InlineKeyboardMarkup(row_width=2)
+            keyboard.row(*window_buttons(f'player_{name}', window))
+            keyboard.add(InlineKeyboardButton(text="⬅️ Назад к списку игроков", callback_data="back_players"))
+        return f'❌ У игрока {name} нет матчей {window_title(window)}.', keyboard
     
-    ratings = [float(s['Rating']) for s in stats]
-    adrs = [float(s['ADR']) for s in stats]
-    kasts = [float(s['KAST'].replace('%', '')) for s in stats if isinstance(s['KAST'], str)]
-    avg_rating = sum(ratings) / len(ratings)
-    avg_adr = sum(adrs) / len(adrs)
-    avg_kast = sum(kasts) / len(kasts) if kasts else 0
+    avg_rating = sum(s.Rating for s in stats) / len(stats)
+    avg_adr = sum(s.ADR for s in stats) / len(stats)
+    avg_kast = sum(s.KAST for s in stats) / len(stats)
     best_map = get_best_map_for_player(name)
     last_match = get_last_match_for_player(name)
 
@@ -34,45 +104,148 @@ def render_player_card(name, stats, with_keyboard=True):
         "Рейтинг": f"{avg_rating:.2f}",
         "KAST": f"{avg_kast:.1f}%",
         "ADR": f"{avg_adr:.0f}",
-        "K/D": f"{sum([float(s['K']) for s in stats]) / len(stats):.2f}/{sum([float(s['D']) for s in stats]) / len(stats):.2f}"
+        "K/D": f"{sum(s.K for s in stats) / len(stats):.2f}/{sum(s.D for s in stats) / len(stats):.2f}"
     }]
-    table = tabulate(table_data, headers="keys", tablefmt="fancy_grid")
+    table = fancy_grid(table_data, kinds=('float', 'str', 'int', 'str'))
 
     text = (
         f"👤 <b>Профиль игрока: {name}</b>\n"
         f"🏆 <b>Команда: BakS eSports</b>\n\n"
-        f"📊 <b>Средние показатели по всем матчам:</b>\n"
+        f"📊 <b>Средние показатели {window_title(window)}:</b>\n"
         f"<pre>{table}</pre>\n"
     )
 
     if best_map:
         text += f"🎯 <b>Лучшая карта:</b> <code>{best_map[0]}</code> (рейтинг <code>{best_map[1]:.2f}</code>)\n"
 
-    if last_match:
-        for p in last_match['overall']['players']['both']:
-            if p['nickname'].lower() == name.lower():
-                opponent = [t for t in last_match['teams'] if t != 'BAKS'][0]
-                text += f"📅 <b>Последний матч:</b> vs <code>{opponent}</code>\n"
-                text += f"⚔️ K/D: <code>{p['K']}K/{p['D']}D</code> | ⭐ Рейтинг: <code>{p['Rating']}</code> | 💥 ADR: <code>{p['ADR']}</code>\n"
-                break
+    p = get_player_match(name, last_match['id']) if last_match else None
+    if p is not None:
+        opponent = [t for t in last_match['teams'] if t != 'BAKS'][0]
+        text += f"📅 <b>Последний матч:</b> vs <code>{opponent}</code>\n"
+        text += f"⚔️ K/D: <code>{p['K']}K/{p['D']}D</code> | ⭐ Рейтинг: <code>{p['Rating']}</code> | 💥 ADR: <code>{p['ADR']}</code>\n"
 
+    start, end, prev_start, next_start = page_bounds(
+        {s.match_id: i for i, s in enumerate(stats)} if cursor is not None else {}, cursor, len(stats)
+    )
     text += f"\n🎮 <b>Выберите матч для подробной статистики:</b>"
+    if len(stats) > PAGE_SIZE:
+        text += f"\n{page_title(start, len(stats)).rstrip()}"
 
     keyboard = None
     if with_keyboard:
         from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
         keyboard = InlineKeyboardMarkup(row_width=2)
-        for idx, s in enumerate(stats):
+        for s in stats[start:end]:
             date = s['date']
             opponent = s.get('opponent', '-')
             button_text = f"{date} vs {opponent}"
-            callback_data = f"player_match_{name}_{idx}"
+            callback_data = f"player_match_{name}_{s.match_id}"
             keyboard.insert(InlineKeyboardButton(text=button_text, callback_data=callback_data))
+        if prev_start is not None or next_start is not None:
+            keyboard.row(*page_buttons(
+                f'ppage_{window}_{name}_',
+                stats[prev_start].match_id if prev_start is not None else None,
+                stats[next_start].match_id if next_start is not None else None
+            ))
+        keyboard.row(*window_buttons(f'player_{name}', window))
+        keyboard.row(
+            InlineKeyboardButton(text="🎯 T/CT по картам", callback_data=f"sides_player_{name}"),
+            InlineKeyboardButton(text="🏅 Лучшие и худшие карты", callback_data=f"mapext_{name}")
+        )
         keyboard.add(InlineKeyboardButton(text="⬅️ Назад к списку игроков", callback_data="back_players"))
-        keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_player_{name}"))
+        keyboard.add(InlineKeyboardButton(
+            text="📤 Экспорт", callback_data=f"export_table_player_{name}_{window}"
+        ))
     return text, keyboard
 
 
+def render_player_view(name, window='all', cursor=None):
+    """Готовая карточка игрока за окно: (текст, клавиатура) из кэша представлений;
+    cursor — id первого матча страницы кнопок.
+
+    Результат общий для всех запросов — клавиатуру изменять нельзя.
+    """
+    # В ключе кэша — окно с датой (resolve_window): карточка «за месяц» не переживёт смену месяца
+    return _render_player_view(name, window, resolve_window(window), cursor)
+
+
+@memo.versioned(data_version, maxsize=128)
+def _render_player_view(name, window, resolved_window, cursor):
+    return render_player_card(name, get_player_stats(name, window), with_keyboard=True, window=window, cursor=cursor)
+
+
+# Заголовки колонок результата /query
+QUERY_TITLES = {
+    'player': 'Игрок',
+    'map': 'Карта',
+    'side': 'Сторона',
+    'opponent': 'Соперник',
+    'tournament': 'Турнир',
+    'date': 'Дата',
+    'count': 'Строк'
+}
+QUERY_HELP = (
+    '📝 <code>/query [условия] [group by поля] [sort -поле] [limit N] [show метрики]</code>\n\n'
+    '• Условия: <code>rating &gt; 1.2</code>, <code>map=Mirage</code>, <code>side=ct</code>, '
+    '<code>vs~Team</code>, <code>tournament~ESEA</code>, <code>date&gt;=2024-01-01</code>\n'
+    '• <code>map=*</code> — строки по каждой карте вместо итогов матча\n'
+    '• Группировка: <code>group by player, map</code> — средние по группам\n\n'
+    '🎯 <b>Примеры:</b>\n'
+    '• <code>/query rating &gt; 1.3 sort -rating</code>\n'
+    '• <code>/query map=* side=ct group by player sort -adr</code>\n'
+    '• <code>/query player=swetsi group by map sort -count</code>'
+)
+
+
+def query_table_rows(columns, rows):
+    """Строки результата /query для таблицы и экспорта: список словарей с русскими заголовками"""
+    grouped = 'count' in columns
+    table = []
+    for row in rows:
+        item = {}
+        for column, value in zip(columns, row):
+            title = QUERY_TITLES.get(column, column)
+            if column in QUERY_TITLES:
+                item[title] = value.upper() if column == 'side' else value
+            elif grouped or column in ('Rating', 'ADR', 'KAST'):
+                item[title] = format_metric(column, value)
+            else:
+                item[title] = int(value) if float(value).is_integer() else value
+        table.append(item)
+    return table
+
+
+def render_query(text):
+    """Результат /query: (текст, клавиатура); при ошибке в запросе — подсказка по синтаксису"""
+    try:
+        columns, rows, total = run_query(text)
+    except QueryError as e:
+        return f'❌ <b>Ошибка в запросе:</b> {escape(str(e))}\n\n{QUERY_HELP}', None
+    header = f'🔎 <b>Запрос:</b> <code>{escape(text)}</code>\n'
+    if not rows:
+        return header + '\n😔 Ничего не найдено.', None
+    table_rows = query_table_rows(columns, rows)
+    table = escape(fancy_grid(table_rows))
+    # Широкая таблица может не влезть в сообщение — урезаем строки, полный результат доступен в экспорте
+    while len(table) > 3500 and len(table_rows) > 1:
+        table_rows = table_rows[:max(1, len(table_rows) // 2)]
+        table = escape(fancy_grid(table_rows))
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_query_{remember(text)}"))
+    return f'{header}📋 Показано {len(table_rows)} из {total}\n<pre>{table}</pre>', keyboard
+
+
+async def cmd_query(message: types.Message):
+    """Обработчик команды /query"""
+    args = message.text.split(maxsplit=1) if message.text else []
+    if len(args) < 2:
+        await message.answer('❓ <b>Как использовать команду:</b>\n\n' + QUERY_HELP, parse_mode='HTML')
+        return
+    text, keyboard = render_query(args[1].strip())
+    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+
+
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
     text = (
@@ -111,7 +284,10 @@ async def cmd_help(message: types.Message):
         '• <code>/history</code> — <b>история ваших действий (просмотры, экспорты)</b>\n\n'
         '📊 <b>Аналитика и графики:</b>\n'
         '• <code>/graph [ник] [метрика]</code> — график по метрике игрока\n'
-        '• Доступные метрики: Rating, ADR, KAST, K/D, HS%\n\n'
+        '• Доступные метрики: Rating, ADR, KAST, K/D, HS%\n'
+        '• Период (необязательно): <code>all</code>, <code>last10</code>, <code>month</code>, <code>roster</code>\n'
+        '• <code>/query [условия]</code> — выборка матчей и карт по условиям, например '
+        '<code>/query rating &gt; 1.3 map=Mirage sort -adr</code>\n\n'
         '📤 <b>Экспорт данных:</b>\n'
         '• В каждом сообщении с таблицей есть кнопка <b>📤 Экспорт</b>\n'
         '• Поддерживаются форматы: CSV, JSON, Excel, PDF\n'
@@ -161,9 +337,15 @@ async def cmd_abbr(message: types.Message):
     await message.answer(abbr_text, reply_markup=main_menu())
 
 
-async def cmd_players(message: types.Message):
-    """Обработчик команды /players"""
-    players_avg = get_player_averages()
+def render_players(window='all'):
+    """Таблица средних показателей всех игроков за окно: (текст, клавиатура), кэшируется по версии данных"""
+    # В ключе кэша — окно с датой (resolve_window): таблица «за месяц» не переживёт смену месяца
+    return _render_players(window, resolve_window(window))
+
+
+@memo.versioned(data_version, maxsize=16)
+def _render_players(window, resolved_window):
+    players_avg = get_player_averages(window)
 
     sorted_players = sorted(players_avg.items(), key=lambda x: x[1]['Rating'], reverse=True)
 
@@ -178,11 +360,11 @@ async def cmd_players(message: types.Message):
             "K/D": f"{stats['K']:.1f}/{stats['D']:.1f}"
         })
 
-    table = tabulate(table_data, headers="keys", tablefmt="fancy_grid")
+    table = fancy_grid(table_data, kinds=('int', 'str', 'float', 'int', 'str', 'str'))
 
     description = (
         '👥 <b>Состав команды BakS eSports</b>\n\n'
-        '📊 <b>Средние показатели по всем матчам:</b>\n'
+        f'📊 <b>Средние показатели {window_title(window)}:</b>\n'
         '• <b>Рейтинг</b> — комплексная оценка эффективности\n'
         '• <b>ADR</b> — средний урон за раунд\n'
         '• <b>KAST</b> — % раундов с вкладом в победу\n'
@@ -194,14 +376,22 @@ async def cmd_players(message: types.Message):
     keyboard = InlineKeyboardMarkup()
     for nickname, _ in sorted_players:
         keyboard.add(InlineKeyboardButton(text=nickname, callback_data=f"playerstat_{nickname}"))
-    keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data="export_table_players"))
-    keyboard.add(InlineKeyboardButton(text="📊 Диаграмма", callback_data="players_chart"))
+    keyboard.row(*window_buttons('players', window))
+    keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_players{window_suffix(window)}"))
+    chart_cb = "players_chart" if window == 'all' else f"players_chart_menu_{window}"
+    keyboard.add(InlineKeyboardButton(text="📊 Диаграмма", callback_data=chart_cb))
+    return f'{description}\n<pre>{table}</pre>', keyboard
 
-    await message.answer(f'{description}\n<pre>{table}</pre>', reply_markup=keyboard)
 
+async def cmd_players(message: types.Message, window='all'):
+    """Обработчик команды /players"""
+    text, keyboard = render_players(window)
+    await message.answer(text, reply_markup=keyboard)
 
-async def cmd_maps(message: types.Message):
-    """Обработчик команды /maps"""
+
+@memo.versioned(data_version, maxsize=2)
+def render_maps():
+    """Список карт: (текст, клавиатура), кэшируется по версии данных"""
     maps = get_maps()
     description = (
         '🗺️ <b>Карты в портфолио BakS eSports</b>\n\n'
@@ -213,21 +403,31 @@ async def cmd_maps(message: types.Message):
         '• Пример: <code>/map Mirage</code>\n\n'
         '💡 <b>Подсказка:</b> Нажмите на карту для просмотра всех матчей на ней.'
     )
-    table = tabulate(
-        [{"Карта": name, "Матчей": len(maps[name])} for name in maps],
-        headers="keys", tablefmt="fancy_grid"
+    table = fancy_grid(
+        [{"Карта": name, "Матчей": len(maps[name])} for name in maps], kinds=('str', 'int')
     )
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     keyboard = InlineKeyboardMarkup()
     for name in maps:
         keyboard.add(InlineKeyboardButton(text=name, callback_data=f"show_map_{name}"))
+    keyboard.add(InlineKeyboardButton(text="⚔️ Сила сторон по картам", callback_data="sides_team"))
     keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data="export_table_maps"))
-    await message.answer(f'{description}\n<pre>{table}</pre>', reply_markup=keyboard)
+    return f'{description}\n<pre>{table}</pre>', keyboard
 
 
-async def cmd_tournaments(message: types.Message):
-    """Обработчик команды /tournaments"""
-    tournaments = get_tournaments()
+async def cmd_maps(message: types.Message):
+    """Обработчик команды /maps"""
+    text, keyboard = render_maps()
+    await message.answer(text, reply_markup=keyboard)
+
+
+@memo.versioned(data_version, maxsize=64)
+def render_tournaments(cursor=None):
+    """Страница турниров и матчей от курсора (id первого матча): (текст, клавиатура),
+    кэшируется по версии данных"""
+    matches = get_match_list()
+    start, end, prev_start, next_start = page_bounds(get_match_positions(), cursor, len(matches))
+    counts = {t: len(games) for t, games in get_tournaments().items()}
     text = (
         '🏆 <b>Турниры и матчи BakS eSports</b>\n\n'
         '📊 <b>История выступлений команды:</b>\n'
@@ -235,37 +435,48 @@ async def cmd_tournaments(message: types.Message):
     )
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     keyboard = InlineKeyboardMarkup()
-    match_idx = 1
-    for t, games in tournaments.items():
-        text += f"🏅 <b>{t}</b> (<code>{len(games)} матчей</code>):\n"
-        for match in games:
-            opp = [team for team in match['teams'] if team != 'BAKS'][0]
-            text += f"   • <b>{match['date']}</b> vs <b>{opp}</b> — <code>{match['score']}</code>\n"
-            keyboard.add(
-                InlineKeyboardButton(
-                    text=f"{match['date']} vs {opp}",
-                    callback_data=f"match_{match_idx}"
-                )
+    tournament = None
+    for match in matches[start:end]:
+        if match['tournament'] != tournament:
+            if tournament is not None:
+                text += "\n"
+            tournament = match['tournament']
+            text += f"🏅 <b>{tournament}</b> (<code>{counts[tournament]} матчей</code>):\n"
+        opp = [team for team in match['teams'] if team != 'BAKS'][0]
+        text += f"   • <b>{match['date']}</b> vs <b>{opp}</b> — <code>{match['score']}</code>\n"
+        keyboard.add(
+            InlineKeyboardButton(
+                text=f"{match['date']} vs {opp}",
+                callback_data=f"match_{match['id']}"
             )
-            match_idx += 1
+        )
+    if tournament is not None:
         text += "\n"
+    text += page_title(start, len(matches))
+    if prev_start is not None or next_start is not None:
+        keyboard.row(*page_buttons(
+            'tpage_',
+            matches[prev_start]['id'] if prev_start is not None else None,
+            matches[next_start]['id'] if next_start is not None else None
+        ))
     # Кнопка экспорта: экспортировать список турниров
     keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data="export_table_tournaments"))
     text += '🎯 <b>Выберите матч для подробного анализа:</b>'
+    return text, keyboard
+
+
+async def cmd_tournaments(message: types.Message):
+    """Обработчик команды /tournaments"""
+    text, keyboard = render_tournaments()
     await message.answer(text, reply_markup=keyboard)
 
 
 async def cmd_progress(message: types.Message):
     """Обработчик команды /progress"""
-    players = get_players()
     progress = []
-    for player in players:
-        stats = get_player_stats(player)
-        if len(stats) >= 2:
-            first = stats[0]['Rating']
-            last = stats[-1]['Rating']
-            arrow = '📈' if last > first else ('📉' if last < first else '➡️')
-            progress.append((player, first, last, arrow))
+    for player, first, last in get_player_progress():
+        arrow = '📈' if last > first else ('📉' if last < first else '➡️')
+        progress.append((player, first, last, arrow))
     description = (
         '📈 <b>Динамика развития игроков BakS eSports</b>\n\n'
         '📊 <b>Анализ прогресса:</b>\n'
@@ -288,9 +499,12 @@ async def cmd_player(message: types.Message):
     """Обработчик команды /player"""
     args = message.text.split()
     if len(args) == 2:
-        name = args[1]
-        stats = get_player_stats(name)
-        text, keyboard = render_player_card(name, stats, with_keyboard=True)
+        name = resolve_player(args[1])
+        if name is None:
+            text, keyboard = suggestion_reply('❌ Игрок не найден.', suggest_players(args[1]), 'playerstat_')
+            await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+            return
+        text, keyboard = render_player_view(name, 'all')
         await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
     else:
         await message.answer(
@@ -305,32 +519,33 @@ async def cmd_player(message: types.Message):
 
 async def cmd_map(message: types.Message):
     """Обработчик команды /map"""
-    args = message.text.split() if message.text else []
+    # Название может быть из нескольких слов: /map dust 2
+    args = message.text.split(maxsplit=1) if message.text else []
     if len(args) == 2:
-        name = args[1]
+        name = resolve_map(args[1]) or args[1]
         stats = get_map_stats(name)
         if stats:
-            table = tabulate(
+            table = fancy_grid(
                 [{
                     "Дата": m.get("date", "-"),
                     "Соперник": m.get("opponent", "-"),
                     "Счёт": m.get("score", "-"),
                     "WinRate": "-"
-                } for m in stats],
-                headers="keys", tablefmt="fancy_grid"
+                } for m in stats]
             )
             from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
             keyboard = InlineKeyboardMarkup()
-            keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_map_{name}"))
+            keyboard.row(*window_buttons(f'map_{name}'))
+            keyboard.add(InlineKeyboardButton(text="📤 Экспорт", callback_data=f"export_table_map_{name}_all"))
             await message.answer(
-                f'🗺️ <b>Статистика по карте: {name.capitalize()}</b>\n\n'
+                f'🗺️ <b>Статистика по карте: {name}</b>\n\n'
                 f'📊 <b>Все матчи BakS eSports на {name}:</b>\n'
                 f'<pre>{table}</pre>\n\n'
                 f'💡 <b>Совет:</b> Используйте кнопку "🗺️ Карты" в меню для просмотра всех карт.',
                 reply_markup=keyboard
             )
         else:
-            await message.answer(
+            text, keyboard = suggestion_reply(
                 '❌ <b>Карта не найдена</b>\n\n'
                 '🔍 <b>Возможные причины:</b>\n'
                 '• Неправильное название карты\n'
@@ -338,8 +553,10 @@ async def cmd_map(message: types.Message):
                 '💡 <b>Решение:</b>\n'
                 '• Проверьте правильность написания\n'
                 '• Используйте кнопку "🗺️ Карты" в меню\n'
-                '• Выберите карту из списка доступных'
+                '• Выберите карту из списка доступных',
+                suggest_maps(args[1]), 'show_map_'
             )
+            await message.answer(text, reply_markup=keyboard)
     else:
         await message.answer(
             '❓ <b>Как использовать команду:</b>\n\n'
@@ -352,40 +569,103 @@ async def cmd_map(message: types.Message):
         )
 
 
+# Кнопки графиков в карточке матча игрока: (метрика, подпись)
+GRAPH_METRICS = (
+    ('Rating', 'Рейтинг'), ('ADR', 'ADR'), ('KAST', 'KAST'), ('K', 'K'), ('D', 'D'), ('OpK-D', 'OpK-D'),
+    ('MKs', 'MKs'), ('1vsX', '1vsX'), ('HS', 'HS'), ('A', 'A'), ('A_f', 'A_f'), ('D_t', 'D_t')
+)
+
+# Диаграмма по всем игрокам: метрика из callback_data -> (подпись, значение по средним игрока)
+PLAYERS_CHART_METRICS = {
+    'rating': ('Рейтинг', lambda stats: stats['Rating']),
+    'adr': ('ADR', lambda stats: stats['ADR']),
+    'kast': ('KAST (%)', lambda stats: stats['KAST']),
+    'kd': ('K/D', lambda stats: stats['K'] / stats['D'] if stats['D'] else 0),
+    'hs': ('HS%', lambda stats: stats['HS']),
+    'opkd': ('OpK-D', lambda stats: stats['OpK-D']),
+}
+
+
+# Построители графиков возвращают (ключ кэша графиков, спецификация, подпись) или None, если рисовать нечего.
+# В ключе рядом с окном — окно с датой (resolve_window): график «за месяц» и его file_id не переживут смену месяца
+def player_graph(name, metric, window='all'):
+    """График метрики игрока по матчам (/graph и кнопки карточки матча). ValueError — неизвестное окно"""
+    stats = get_player_stats(name, window)
+    if not stats:
+        return None
+    period = 'по матчам' if window == 'all' else window_title(window)
+    title = f'{name} — {metric} {period}'
+    spec = charts.line_chart(title, [s.date for s in stats], [s.value(metric) for s in stats], 'Дата', metric)
+    return ('graph', name, metric, window, resolve_window(window)), spec, title
+
+
+def player_dashboard(name, window='all'):
+    """Все метрики GRAPH_METRICS игрока одной картинкой; ряды собираются за один проход по матчам.
+    ValueError — неизвестное окно"""
+    stats = get_player_stats(name, window)
+    if not stats:
+        return None
+    metrics = [metric for metric, _ in GRAPH_METRICS]
+    series = zip(*([s.value(metric) for metric in metrics] for s in stats))
+    period = 'по матчам' if window == 'all' else window_title(window)
+    title = f'{name} — все метрики {period}'
+    spec = charts.dashboard_chart(title, [s.date for s in stats], metrics, series, 'Дата')
+    return ('dashboard', name, window, resolve_window(window)), spec, f'📊 {title}'
+
+
+def players_chart(metric, window='all'):
+    """Диаграмма метрики всех игроков по убыванию рейтинга; None — неизвестная метрика.
+    ValueError — неизвестное окно"""
+    if metric not in PLAYERS_CHART_METRICS:
+        return None
+    label, value = PLAYERS_CHART_METRICS[metric]
+    players = sorted(get_player_averages(window).items(), key=lambda x: x[1]['Rating'], reverse=True)
+    period = '' if window == 'all' else f' ({window_title(window)})'
+    title = f'{label} всех игроков BakS eSports{period}'
+    spec = charts.bar_chart(title, [p for p, _ in players], [value(stats) for _, stats in players], 'Игрок', label)
+    return ('players', metric, window, resolve_window(window)), spec, f'📊 {title}'
+
+
+def progress_chart():
+    """Изменение рейтинга игроков от первого матча к последнему"""
+    progress = get_player_progress()
+    if not progress:
+        return None
+    spec = charts.delta_bar_chart(
+        'Изменение рейтинга игроков BakS eSports', [p for p, _, _ in progress], [l - f for _, f, l in progress],
+        'Игрок', 'Δ Рейтинг (последний - первый)'
+    )
+    return ('progress',), spec, '📊 Изменение рейтинга игроков (Δ = последний - первый матч)'
+
+
 async def cmd_graph(message: types.Message):
     """Обработчик команды /graph"""
     args = message.text.split()
-    if len(args) == 3:
-        name, metric = args[1], args[2]
-        stats = get_player_stats(name)
-        if not stats:
-            await message.answer('Игрок не найден.')
+    if len(args) in (3, 4):
+        name, metric = resolve_player(args[1]), args[2]
+        window = args[3] if len(args) == 4 else 'all'
+        if name is None:
+            suggestions = suggest_players(args[1])
+            text = 'Игрок не найден.'
+            if suggestions:
+                text += ' Возможно: ' + ', '.join(f'<code>/graph {s} {metric}</code>' for s in suggestions)
+            await message.answer(text)
+            return
+        try:
+            chart = player_graph(name, metric, window)
+        except ValueError:
+            await message.answer('Неизвестный период. Используйте: all, last10, month, roster')
             return
-        x = [s['date'] for s in stats]
-
-        def parse_metric(val):
-            if isinstance(val, str) and val.endswith('%'):
-                return float(val.replace('%', ''))
-            try:
-                return float(val)
-            except Exception:
-                return 0
-
-        y = [parse_metric(s[metric]) if metric in s else 0 for s in stats]
-        plt.figure(figsize=(7, 4))
-        plt.plot(x, y, marker='o')
-        plt.title(f'{name} — {metric} по матчам')
-        plt.xlabel('Дата')
-        plt.ylabel(metric)
-        plt.grid(True)
-        buf = io.BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        await message.answer_photo(buf, caption=f'{name} — {metric} по матчам')
-        plt.close()
+        if chart is None:
+            await message.answer('Игрок не найден.' if window == 'all' else 'Нет матчей игрока за этот период.')
+            return
+        log_history(message.from_user.id, message.from_user.username, 'view_graph', {'player': name, 'metric': metric})
+        try:
+            await charts.answer_chart(message, *chart)
+        except charts.ChartError as e:
+            await message.answer(str(e))
     else:
-        await message.answer('Используйте: /graph [ник] [метрика]')
+        await message.answer('Используйте: /graph [ник] [метрика] [период: all, last10, month, roster]')
 
 
 async def cmd_alert(message: types.Message):
@@ -426,6 +706,8 @@ async def cmd_history(message: types.Message):
         'view_tournament': ('🏆', 'Просмотр турнира'),
         'view_progress': ('📈', 'Просмотр прогресса'),
         'view_players_chart': ('📊', 'Диаграмма игроков'),
+        'view_graph': ('📈', 'График игрока'),
+        'view_dashboard': ('📊', 'Все графики игрока'),
         'view_abbr': ('ℹ️', 'Справка'),
     }
     lines = ["🕓 <b>Последние действия:</b>"]
@@ -440,7 +722,8 @@ async def cmd_history(message: types.Message):
         elif action == 'view_map':
             param_str = f"<b>{params.get('map','-')}</b>"
         elif action == 'view_match':
-            param_str = f"матч #{params.get('match_idx','-')}"
+            # В старых записях — позиция матча, в новых — его id
+            param_str = f"матч #{params.get('match_id', params.get('match_idx', '-'))}"
         elif action == 'export':
             param_str = f"<i>{params.get('type','-')}</i> → <code>{params.get('filename','')}</code> ({params.get('format','')})"
         elif action == 'view_tournament':
@@ -449,6 +732,10 @@ async def cmd_history(message: types.Message):
             param_str = f"<b>{params.get('player','-')}</b>"
         elif action == 'view_players_chart':
             param_str = f"<b>{params.get('metric','-')}</b>"
+        elif action == 'view_dashboard':
+            param_str = f"<b>{params.get('player','-')}</b>"
+        elif action == 'view_graph':
+            param_str = f"<b>{params.get('player','-')}</b> — {params.get('metric','-')}"
         elif action == 'view_abbr':
             param_str = ''
         else:
@@ -0,0 +1,121 @@
+import builtins
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import time
+from config import IMPORT_BUDGET_MS, LAZY_MODULES
+from table_format import fancy_grid
+
+# Строка вывода -X importtime: «import time: своё | с вложенными | <отступ>модуль» (микросекунды)
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_times(module='bot'):
+    """Импортирует модуль в чистом процессе под -X importtime (внешний замер: запускает
+    интерпретатор и разбирает его вывод; замер в самом процессе бота — start и finish).
+
+    Возвращает [(модуль, своё время, время с вложенными, глубина)] в микросекундах,
+    в порядке завершения импорта, как их печатает интерпретатор. Ошибка в теле
+    модуля (например, токен бота не задан) не мешает замеру: интерпретатор печатает
+    время и для неудачного импорта, а последняя строка ошибки выводится предупреждением.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    rows = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append((match[4], int(match[1]), int(match[2]), (len(match[3]) - 1) // 2))
+        elif line.strip():
+            errors.append(line.strip())
+    if not any(name == module and depth == 0 for name, _, _, depth in rows):
+        raise RuntimeError(f'Не удалось импортировать {module}:\n' + '\n'.join(errors[-20:]))
+    if proc.returncode and errors:
+        print(f'Предупреждение: import {module} завершился ошибкой: {errors[-1]}')
+    return rows
+
+
+def _report(module, rows, direct, total, loaded, top, write):
+    """Пишет таблицы прямых и самых долгих импортов и итог (loaded — загружено модулей).
+    True, если старт укладывается в IMPORT_BUDGET_MS и не тянет за собой библиотеки из LAZY_MODULES"""
+    direct = sorted(direct, key=lambda r: -r[2])[:top]
+    heaviest = sorted(rows, key=lambda r: -r[1])[:top]
+    for title, table in (('Прямые импорты', direct), ('Самые долгие модули (без вложенных)', heaviest)):
+        write(f'{title}:\n' + fancy_grid(
+            [[name, f'{own / 1000:.1f}', f'{cumulative / 1000:.1f}'] for name, own, cumulative, _ in table],
+            headers=['Модуль', 'Своё, мс', 'Всего, мс'], kinds=('str', 'float', 'float')
+        ))
+    eager = sorted({name.split('.')[0] for name, *_ in rows} & set(LAZY_MODULES))
+    write(f'import {module}: {total / 1000:.0f} мс (бюджет {IMPORT_BUDGET_MS} мс), модулей: {loaded}')
+    if eager:
+        write('Загружены при старте, хотя должны подгружаться лениво: ' + ', '.join(eager))
+    if total / 1000 > IMPORT_BUDGET_MS:
+        write('Бюджет времени старта превышен')
+    return total / 1000 <= IMPORT_BUDGET_MS and not eager
+
+
+def report(module='bot', top=15):
+    """Печатает время импорта модуля в чистом процессе (import_times) и возвращает True,
+    если старт укладывается в бюджет (см. _report)"""
+    rows = import_times(module)
+    # Дочерние модули печатаются перед родителем: поддерево module — строки после предыдущего
+    # модуля верхнего уровня (импорты самого интерпретатора при старте в отчёт не входят)
+    end = max(i for i, (name, _, _, depth) in enumerate(rows) if name == module and depth == 0)
+    start = max((i + 1 for i, r in enumerate(rows[:end]) if r[3] == 0), default=0)
+    rows = rows[start:end + 1]
+    return _report(module, rows, [r for r in rows if r[3] == 1], rows[-1][2], len(rows), top, print)
+
+
+# Замер в процессе бота (PROFILE_IMPORTS): (исходный __import__, строки, время начала, модулей до начала)
+_profile = None
+
+
+def start():
+    """Начинает замер импортов в текущем процессе — bot.py вызывает его первым, если задан
+    PROFILE_IMPORTS. В отличие от -X importtime время пишется на инструкцию import, загрузившую
+    новые модули (from пакет import подмодуль — на пакет), в тех же строках, что у import_times:
+    (модуль, своё время, время с вложенными, глубина) в микросекундах, глубина 0 — импорты бота"""
+    global _profile
+    original = builtins.__import__
+    rows = []
+    # Время вложенных замеренных импортов каждой выполняющейся инструкции import
+    nested = []
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        loaded = len(sys.modules)
+        nested.append(0)
+        started = time.perf_counter_ns()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = (time.perf_counter_ns() - started) // 1000
+            inner = nested.pop()
+            if len(sys.modules) != loaded:
+                if nested:
+                    nested[-1] += elapsed
+                if level:
+                    name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+                rows.append((name, elapsed - inner, elapsed, len(nested)))
+
+    builtins.__import__ = timed_import
+    _profile = (original, rows, time.perf_counter_ns(), len(sys.modules))
+
+
+def finish(module='bot', top=15, write=print):
+    """Заканчивает замер, начатый start(), и пишет отчёт (см. _report) через write"""
+    global _profile
+    original, rows, started, modules = _profile
+    builtins.__import__ = original
+    _profile = None
+    total = (time.perf_counter_ns() - started) // 1000
+    return _report(module, rows, [r for r in rows if r[3] == 0], total, len(sys.modules) - modules, top, write)
+
+
+if __name__ == '__main__':
+    # Профиль старта: python import_profile.py [модуль]; код возврата 1 — бюджет превышен
+    sys.exit(0 if report(*sys.argv[1:2]) else 1)
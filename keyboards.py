@@ -1,4 +1,13 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from config import ROSTER_CHANGE_DATE
+
+# Окна выборки, доступные из кнопок (см. data_loader.resolve_window)
+WINDOWS = [
+    ('all', 'Все'),
+    ('last10', '10 последних'),
+    ('month', 'Месяц'),
+    ('roster', 'С замены состава')
+]
 
 
 def main_menu():
@@ -30,6 +39,16 @@ def main_menu():
     )
 
 
+def page_buttons(callback_prefix, prev_cursor, next_cursor):
+    """Кнопки листания страниц; курсор — id первого матча соседней страницы"""
+    buttons = []
+    if prev_cursor is not None:
+        buttons.append(InlineKeyboardButton(text='◀️ Пред.', callback_data=f'{callback_prefix}{prev_cursor}'))
+    if next_cursor is not None:
+        buttons.append(InlineKeyboardButton(text='След. ▶️', callback_data=f'{callback_prefix}{next_cursor}'))
+    return buttons
+
+
 def export_format_keyboard(callback_data):
     """Создает клавиатуру для выбора формата экспорта"""
     formats = [
@@ -49,7 +68,19 @@ def export_format_keyboard(callback_data):
     return keyboard
 
 
-def players_chart_keyboard():
+def window_buttons(target, current='all'):
+    """Кнопки выбора окна для карточки или таблицы; target — players, player_<ник> или map_<карта>"""
+    buttons = []
+    for window, label in WINDOWS:
+        if window == 'roster' and not ROSTER_CHANGE_DATE:
+            continue
+        if window == current:
+            label = f'✅ {label}'
+        buttons.append(InlineKeyboardButton(text=label, callback_data=f'window_{window}_{target}'))
+    return buttons
+
+
+def players_chart_keyboard(window='all'):
     """Создает клавиатуру для выбора метрики диаграммы игроков"""
     keyboard = InlineKeyboardMarkup(row_width=2)
     metrics = [
@@ -61,6 +92,7 @@ def players_chart_keyboard():
         ('opkd', '🚀 OpK-D')
     ]
     for m, label in metrics:
-        keyboard.add(InlineKeyboardButton(text=label, callback_data=f"players_chart_{m}"))
+        callback_data = f"players_chart_{m}" if window == 'all' else f"players_chart_{m}_{window}"
+        keyboard.add(InlineKeyboardButton(text=label, callback_data=callback_data))
     keyboard.add(InlineKeyboardButton(text='❌ Отмена', callback_data='players_chart_cancel'))
     return keyboard 
\ No newline at end of file
@@ -0,0 +1,90 @@
+import functools
+import threading
+from collections import OrderedDict
+
+# Все кэши по имени — для статистики попаданий и общей очистки
+_caches = {}
+
+
+class VersionedCache:
+    """LRU-кэш, ключи которого включают версию данных"""
+
+    def __init__(self, name, maxsize=128):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        # Проверка без учёта в статистике попаданий
+        with self._lock:
+            return key in self._data
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+def versioned(version_func, maxsize=128):
+    """Декоратор: результат функции кэшируется по (версия данных, аргументы).
+
+    Результат общий для всех вызывающих — изменять его нельзя.
+    """
+    def decorator(func):
+        cache = VersionedCache(func.__qualname__, maxsize)
+        missing = object()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (version_func(), args, tuple(sorted(kwargs.items())))
+            value = cache.get(key, missing)
+            if value is missing:
+                value = func(*args, **kwargs)
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def clear_all():
+    """Очищает все кэши (после перезагрузки или добавления данных)"""
+    for cache in _caches.values():
+        cache.clear()
+
+
+def cache_stats():
+    """Попадания и промахи всех кэшей: {имя: {...}}"""
+    return {name: cache.stats() for name, cache in _caches.items()}
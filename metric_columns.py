@@ -0,0 +1,203 @@
+import numpy as np
+from stats_store import NUMERIC_METRICS, SIDES, text_key
+
+# Метрики, для которых хранится колонка
+COLUMN_METRICS = NUMERIC_METRICS
+OVERALL = -1
+
+
+def summarize(col):
+    """Сводка по массиву значений: среднее, сумма, минимум, максимум, σ и квартили"""
+    if not col.size:
+        return {'count': 0}
+    p25, p50, p75 = np.percentile(col, [25, 50, 75])
+    return {
+        'count': int(col.size),
+        'mean': float(col.mean()),
+        'sum': float(col.sum()),
+        'min': float(col.min()),
+        'max': float(col.max()),
+        'std': float(col.std()),
+        'p25': float(p25),
+        'p50': float(p50),
+        'p75': float(p75),
+    }
+
+
+class MetricColumns:
+    """Колоночное представление строк игроков: массив NumPy на каждую метрику.
+
+    Строка соответствует (игрок, матч, карта, сторона); карта OVERALL (-1) —
+    итог по матчу. Буферы растут с запасом, поэтому append_match стоит
+    O(строк матча) в среднем.
+    """
+
+    INDEX_COLUMNS = (('player', np.int32), ('match', np.int32), ('map', np.int32),
+                     ('map_no', np.int32), ('side', np.int8))
+
+    def __init__(self, store):
+        # Коды игроков совпадают с порядком первого появления в StatsStore
+        self.player_codes = {key: code for code, key in enumerate(store.player_names)}
+        self.player_names = list(store.player_names.values())
+        self.map_codes = {}
+        self.map_names = []
+        self._size = 0
+        # Сколько строк записано в буферы любой из версий, которые их делят (см. with_match)
+        self._written = [0]
+        self._buffers = {name: np.empty(0, dtype=dtype) for name, dtype in self.INDEX_COLUMNS}
+        self._buffers.update({metric: np.empty(0, dtype=np.float64) for metric in COLUMN_METRICS})
+        for match_idx, match in enumerate(store.matches):
+            self.append_match(match, match_idx)
+
+    def with_match(self, match, match_idx):
+        """Следующая версия колонок с матчем match; эти колонки не меняются.
+
+        Буферы общие: строки матча дописываются за концом этой версии, которая
+        их не видит (её длина — _size); если там уже пишет другая версия, новая
+        получает свою копию буферов. Словари кодов копируются, только если в
+        матче новый игрок или карта.
+        """
+        columns = object.__new__(MetricColumns)
+        columns.__dict__.update(self.__dict__)
+        columns._buffers = dict(self._buffers)
+        blocks = [match['overall']] + match['maps']
+        nicknames = {text_key(p.nickname) for block in blocks for lines in block['players'].values() for p in lines}
+        if not nicknames <= self.player_codes.keys():
+            columns.player_codes = dict(self.player_codes)
+            columns.player_names = list(self.player_names)
+        if not {m['name'] for m in match['maps']} <= self.map_codes.keys():
+            columns.map_codes = dict(self.map_codes)
+            columns.map_names = list(self.map_names)
+        columns.append_match(match, match_idx)
+        return columns
+
+    def _player_code(self, nickname):
+        key = text_key(nickname)
+        if key not in self.player_codes:
+            self.player_codes[key] = len(self.player_names)
+            self.player_names.append(nickname)
+        return self.player_codes[key]
+
+    def _map_code(self, name):
+        if name not in self.map_codes:
+            self.map_codes[name] = len(self.map_names)
+            self.map_names.append(name)
+        return self.map_codes[name]
+
+    def append_match(self, match, match_idx):
+        """Дописывает строки матча (итоги и карты, все стороны) в конец колонок"""
+        rows = []
+        blocks = [(OVERALL, OVERALL, match['overall'])]
+        blocks += [(self._map_code(m['name']), map_no, m) for map_no, m in enumerate(match['maps'])]
+        for map_code, map_no, block in blocks:
+            for side_code, side in enumerate(SIDES):
+                for p in block['players'].get(side, []):
+                    rows.append((self._player_code(p.nickname), match_idx, map_code, map_no, side_code, p))
+        if not rows:
+            return
+        start, end = self._size, self._size + len(rows)
+        if self._written[0] != start:
+            # Хвост общих буферов занят другой версией
+            self._buffers = {name: buf.copy() for name, buf in self._buffers.items()}
+            self._written = [start]
+        self._reserve(end)
+        for i, (name, _) in enumerate(self.INDEX_COLUMNS):
+            self._buffers[name][start:end] = [row[i] for row in rows]
+        for metric in COLUMN_METRICS:
+            self._buffers[metric][start:end] = [row[-1].value(metric) for row in rows]
+        self._size = self._written[0] = end
+
+    def _reserve(self, size):
+        capacity = len(self._buffers['player'])
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 256)
+        for name, buf in self._buffers.items():
+            grown = np.zeros(capacity, dtype=buf.dtype)
+            grown[:self._size] = buf[:self._size]
+            self._buffers[name] = grown
+        self._written = [self._size]
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def player(self):
+        return self._buffers['player'][:self._size]
+
+    @property
+    def match(self):
+        return self._buffers['match'][:self._size]
+
+    @property
+    def map(self):
+        return self._buffers['map'][:self._size]
+
+    @property
+    def map_no(self):
+        return self._buffers['map_no'][:self._size]
+
+    @property
+    def side(self):
+        return self._buffers['side'][:self._size]
+
+    def mask(self, player=None, map_name=None, side='both', matches=None):
+        """Булева маска строк; map_name=None — итоги по матчам, '*' — все карты"""
+        mask = self.side == SIDES.index(side)
+        if map_name is None:
+            mask &= self.map == OVERALL
+        elif map_name == '*':
+            mask &= self.map != OVERALL
+        else:
+            mask &= self.map == self.map_codes.get(map_name, -2)
+        if player is not None:
+            mask &= self.player == self.player_codes.get(text_key(player), -1)
+        if matches is not None:
+            # Выбранные матчи — таблицей по позиции матча: одна выборка вместо поиска каждой строки
+            # (строки дописываются по порядку матчей, у последней строки — наибольшая позиция)
+            selected = np.zeros(int(self.match[-1]) + 1 if self._size else 0, dtype=bool)
+            matches = np.asarray(matches, dtype=np.intp)
+            selected[matches[matches < len(selected)]] = True
+            mask &= selected[self.match]
+        return mask
+
+    def column(self, metric, mask=None):
+        """Значения метрики для подмножества строк"""
+        col = self._buffers[metric][:self._size]
+        return col if mask is None else col[mask]
+
+    def aggregate(self, metric, how='mean', mask=None):
+        """Агрегат метрики по подмножеству строк: mean, sum, min, max, std, median, count"""
+        col = self.column(metric, mask)
+        if how == 'count':
+            return int(col.size)
+        if not col.size:
+            return 0.0
+        return float(getattr(np, how)(col))
+
+    def percentile(self, metric, q, mask=None):
+        """Перцентиль(и) метрики, q — число или список"""
+        col = self.column(metric, mask)
+        if not col.size:
+            return 0.0
+        return np.percentile(col, q)
+
+    def summary(self, metric, mask=None):
+        """Сводка по метрике для подмножества строк (см. summarize)"""
+        return summarize(self.column(metric, mask))
+
+    def group_by_player(self, metrics=COLUMN_METRICS, how='mean', mask=None):
+        """Агрегат по каждому игроку сразу для нескольких метрик: {ник: {метрика: значение}}"""
+        if mask is None:
+            mask = self.mask()
+        codes = self.player[mask]
+        n = len(self.player_names)
+        counts = np.bincount(codes, minlength=n)
+        present = np.flatnonzero(counts)
+        result = {self.player_names[code]: {} for code in present}
+        for metric in metrics:
+            sums = np.bincount(codes, weights=self.column(metric, mask), minlength=n)
+            agg = sums / np.maximum(counts, 1) if how == 'mean' else sums
+            for code in present:
+                result[self.player_names[code]][metric] = float(agg[code])
+        return result
@@ -0,0 +1,9 @@
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from data_loader import pin_snapshot
+
+
+class SnapshotMiddleware(BaseMiddleware):
+	"""Закрепляет срез данных за апдейтом: обработчик дорабатывает на той версии, с которой начал"""
+
+	async def on_pre_process_update(self, update, data):
+		pin_snapshot()
@@ -0,0 +1,85 @@
+import bisect
+
+
+def _trigrams(key):
+    """Триграммы ключа с отступами по краям: 'nuke' -> {'  n', ' nu', 'nuk', 'uke', 'ke '}"""
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameResolver:
+    """Поиск ника или карты по написанию пользователя.
+
+    Строится один раз на версию данных. Точное совпадение без учёта регистра,
+    знаков и префиксов (de_dust2 -> Dust2) и псевдонимы — поиск в словаре,
+    единственное продолжение префикса — бинарный поиск, похожие имена для
+    «возможно, вы имели в виду» — по индексу триграмм.
+    """
+
+    def __init__(self, names, aliases=None, strip_prefixes=(), min_score=0.3):
+        self.strip_prefixes = tuple(p.casefold() for p in strip_prefixes)
+        self.min_score = min_score
+        # ключ -> имя как в данных
+        self.keys = {}
+        for name in names:
+            self.keys.setdefault(self.normalize(name), name)
+        for alias, name in (aliases or {}).items():
+            if self.normalize(name) in self.keys:
+                self.keys.setdefault(self.normalize(alias), self.keys[self.normalize(name)])
+        self.sorted_keys = sorted(self.keys)
+        # триграмма -> ключи, в которых она встречается
+        self.trigrams = {}
+        self.trigram_counts = {}
+        for key in self.keys:
+            grams = _trigrams(key)
+            self.trigram_counts[key] = len(grams)
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(key)
+
+    def normalize(self, text):
+        """Ключ поиска: casefold без префиксов, пробелов и знаков"""
+        key = text.strip().casefold()
+        for prefix in self.strip_prefixes:
+            if key.startswith(prefix) and len(key) > len(prefix):
+                key = key[len(prefix):]
+                break
+        return ''.join(ch for ch in key if ch.isalnum())
+
+    def resolve(self, text):
+        """Имя как в данных или None, если написание не определяет его однозначно"""
+        key = self.normalize(text)
+        if not key:
+            return None
+        if key in self.keys:
+            return self.keys[key]
+        # Однозначное начало имени: swet -> swetsi
+        pos = bisect.bisect_left(self.sorted_keys, key)
+        matches = self.sorted_keys[pos:pos + 2]
+        if matches and matches[0].startswith(key) and (len(matches) == 1 or not matches[1].startswith(key)):
+            return self.keys[matches[0]]
+        return None
+
+    def suggest(self, text, limit=3):
+        """Похожие имена по коэффициенту Дайса на триграммах, лучшие первыми"""
+        key = self.normalize(text)
+        if not key:
+            return []
+        grams = _trigrams(key)
+        shared = {}
+        for gram in grams:
+            for candidate in self.trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scored = []
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + self.trigram_counts[candidate])
+            if score >= self.min_score:
+                scored.append((score, candidate))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        result = []
+        for _, candidate in scored:
+            name = self.keys[candidate]
+            if name not in result:
+                result.append(name)
+            if len(result) == limit:
+                break
+        return result
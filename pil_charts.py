@@ -0,0 +1,282 @@
+import functools
+import io
+import math
+from PIL import Image, ImageDraw, ImageFont
+from config import FONT_PATH
+
+# Рисуем с запасом и уменьшаем — так сглаживаются линии и маркеры
+SCALE = 2
+DPI = 100
+# Размеры как у matplotlib по умолчанию (в пунктах при 100 dpi): шрифт 10, заголовок 12
+FONT_SIZE = 14
+TITLE_SIZE = 17
+PAD = 15
+TICK = 5
+LINE_COLOR = '#1f77b4'
+GRID_COLOR = '#b0b0b0'
+TEXT_COLOR = 'black'
+# Шаги делений оси, как у AutoLocator: 1, 2, 2.5, 5 на степень десяти
+STEPS = (1, 2, 2.5, 5, 10)
+MAX_TICKS = 9
+# Наименьший размах оси y (и относительно модуля значений): шаг делений ещё подписывается
+# не больше чем 6 знаками после запятой. Меньшие размахи matplotlib подписывает
+# со смещением и степенью — такие графики рисует он
+MIN_SPAN = 1e-4
+MIN_RELATIVE_SPAN = 1e-6
+# Колонок в сетке графиков dashboard
+DASHBOARD_COLUMNS = 3
+
+
+# Тире в arialmt.ttf нарисованы кириллическими буквами — заменяем их минусом
+GLYPH_FIXES = str.maketrans({'—': '−', '–': '−'})
+
+
+@functools.lru_cache(maxsize=8)
+def _font(size):
+    return ImageFont.truetype(FONT_PATH, size)
+
+
+@functools.lru_cache(maxsize=1024)
+def _text(text, size, angle=0):
+    """Надпись на прозрачном фоне, повёрнутая на angle градусов.
+
+    Ники, даты и подписи делений повторяются от графика к графику, а растеризация
+    текста — самая дорогая часть после сжатия PNG, поэтому картинки кэшируются.
+    Результат общий — изменять его нельзя.
+    """
+    text = text.translate(GLYPH_FIXES)
+    font = _font(size)
+    left, top, right, bottom = font.getbbox(text or ' ')
+    img = Image.new('RGBA', (right - left + 2, bottom - top + 2), (255, 255, 255, 0))
+    ImageDraw.Draw(img).text((1 - left, 1 - top), text, font=font, fill=TEXT_COLOR)
+    return img.rotate(angle, resample=Image.BICUBIC, expand=True) if angle else img
+
+
+def _ticks(lo, hi, nbins):
+    """Деления оси в [lo, hi]: наименьший шаг из STEPS, при котором интервалов не больше nbins"""
+    raw = (hi - lo) / nbins
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for m in STEPS:
+        step = m * magnitude
+        low, high = math.floor(lo / step + 1e-9), math.ceil(hi / step - 1e-9)
+        if high - low <= nbins:
+            break
+    ticks = [i * step for i in range(math.ceil(lo / step - 1e-9), math.floor(hi / step + 1e-9) + 1)]
+    decimals = next(d for d in range(7) if abs(round(step, d) - step) < step * 1e-6)
+    return ticks, decimals
+
+
+def _tick_label(value, decimals):
+    text = f'{value:.{decimals}f}'
+    if text.startswith('-'):
+        # Ноль без знака, минус — типографский, как в matplotlib
+        text = text[1:] if float(text) == 0 else '−' + text[1:]
+    return text
+
+
+def _limits(values, sticky_zero):
+    """Пределы оси с полями 5%; у столбцов ноль — край оси без поля"""
+    lo, hi = min(values), max(values)
+    if sticky_zero:
+        lo, hi = min(lo, 0), max(hi, 0)
+    if lo == hi:
+        delta = abs(lo) * 0.05 or 0.5
+        return lo - delta, hi + delta
+    margin = (hi - lo) * 0.05
+    return (lo if sticky_zero and lo == 0 else lo - margin), (hi if sticky_zero and hi == 0 else hi + margin)
+
+
+def _visible_labels(widths, span):
+    """Индексы подписей категорий, которые помещаются без наложения"""
+    if not widths:
+        return []
+    every = max(1, math.ceil((max(widths) + 6) * len(widths) / span))
+    return list(range(0, len(widths), every))
+
+
+def _finite(values):
+    return len(values) > 0 and all(isinstance(v, (int, float)) and math.isfinite(v) for v in values)
+
+
+def _labelled(values, sticky_zero):
+    """Подписываются ли деления оси y этих значений (см. MIN_SPAN)"""
+    lo, hi = _limits([float(v) for v in values], sticky_zero)
+    return hi - lo >= max(MIN_SPAN, max(abs(lo), abs(hi)) * MIN_RELATIVE_SPAN)
+
+
+def supports(spec):
+    """Рисуется ли график здесь: шаблоны line, bar, delta_bar и dashboard с конечными числами,
+    размах которых подписывается делениями"""
+    if spec.kind == 'dashboard':
+        return len(spec.y) == len(spec.ylabel) and all(
+            len(v) == len(spec.x) and _finite(v) and _labelled(v, sticky_zero=False) for v in spec.y
+        )
+    return (spec.kind in ('line', 'bar', 'delta_bar') and len(spec.x) == len(spec.y) and _finite(spec.y)
+            and _labelled(spec.y, sticky_zero=spec.kind != 'line'))
+
+
+def _scaled(*points):
+    return [(x * SCALE, y * SCALE) for x, y in points]
+
+
+class _Axes:
+    """Оси одного графика в прямоугольнике box = (left, top, right, bottom) холста.
+
+    Раскладка (аналог tight_layout) считается сразу; draw_shapes рисует линии
+    и фигуры на холсте в SCALE раз крупнее, draw_text — надписи после уменьшения.
+    """
+
+    def __init__(self, box, kind, x, values, colors=None, title='', xlabel='', ylabel='',
+                 title_size=TITLE_SIZE, xticks=True):
+        self.kind = kind
+        self.values = [float(v) for v in values]
+        self.colors = colors if isinstance(colors, list) else [colors] * len(values)
+        n = len(values)
+        is_line = kind == 'line'
+        if is_line:
+            self.xlim = (-0.5, 0.5) if n == 1 else (-0.05 * (n - 1), (n - 1) * 1.05)
+        else:
+            span = n - 0.2
+            self.xlim = (-0.4 - span * 0.05, n - 0.6 + span * 0.05)
+        self.ylim = _limits(self.values, sticky_zero=not is_line)
+        self.title = _text(title, title_size) if title else None
+        self.xlabel = _text(xlabel, FONT_SIZE) if xlabel else None
+        self.ylabel = _text(ylabel, FONT_SIZE, 90) if ylabel else None
+        self.xtick_labels = [_text(str(v), FONT_SIZE, 0 if is_line else 30) for v in x] if xticks else []
+
+        left, top, right, bottom = box
+        self.box = box
+        y0 = top + PAD // 2 + (self.title.height + 10 if self.title else 0)
+        y1 = bottom - PAD - TICK
+        if self.xlabel:
+            y1 -= self.xlabel.height + 6
+        if self.xtick_labels:
+            y1 -= max(im.height for im in self.xtick_labels) + 4
+        nbins = max(1, min(MAX_TICKS, int((y1 - y0) * 0.72 // 20)))
+        self.yticks, decimals = _ticks(*self.ylim, nbins)
+        self.ytick_labels = [_text(_tick_label(v, decimals), FONT_SIZE) for v in self.yticks]
+        x0 = left + PAD + max(im.width for im in self.ytick_labels) + TICK + 4
+        if self.ylabel:
+            x0 += self.ylabel.width + 8
+        x1 = right - PAD
+        if is_line and self.xtick_labels:
+            # Крайние даты центрированы по делению и не должны выходить за холст
+            x0 = max(x0, left + self.xtick_labels[0].width // 2 + 4)
+            x1 = min(x1, right - self.xtick_labels[-1].width // 2 - 4)
+        self.set_frame((x0, y0, x1, y1))
+
+    def set_frame(self, frame):
+        """Задаёт рамку осей (left, top, right, bottom) и выбирает подписи категорий, которые в неё помещаются"""
+        self.frame = frame
+        x0, _, x1, _ = frame
+        self.shown = _visible_labels([im.width for im in self.xtick_labels], x1 - x0) if self.xtick_labels else []
+        # Вертикальная сетка — по делениям категорий, даже если их подписи скрыты
+        self.grid = self.shown or _visible_labels([70] * len(self.values), x1 - x0)
+
+    def px(self, x):
+        x0, _, x1, _ = self.frame
+        xmin, xmax = self.xlim
+        return x0 + (x - xmin) / (xmax - xmin) * (x1 - x0)
+
+    def py(self, y):
+        _, y0, _, y1 = self.frame
+        ymin, ymax = self.ylim
+        return y1 - (y - ymin) / (ymax - ymin) * (y1 - y0)
+
+    def draw_shapes(self, draw):
+        x0, y0, x1, y1 = self.frame
+        px, py = self.px, self.py
+        line_w = round(0.8 * 1.39 * SCALE)
+        if self.kind == 'line':
+            for i in self.grid:
+                draw.line(_scaled((px(i), y0), (px(i), y1)), fill=GRID_COLOR, width=line_w)
+            for v in self.yticks:
+                draw.line(_scaled((x0, py(v)), (x1, py(v))), fill=GRID_COLOR, width=line_w)
+            points = _scaled(*((px(i), py(v)) for i, v in enumerate(self.values)))
+            if len(points) > 1:
+                draw.line(points, fill=LINE_COLOR, width=round(1.5 * 1.39 * SCALE), joint='curve')
+            r = 3 * 1.39 * SCALE
+            for x, y in points:
+                draw.ellipse([x - r, y - r, x + r, y + r], fill=LINE_COLOR)
+        else:
+            for i, (v, color) in enumerate(zip(self.values, self.colors)):
+                a, b = sorted((py(0), py(v)))
+                draw.rectangle(_scaled((px(i - 0.4), a), (px(i + 0.4), b)), fill=color)
+            if self.kind == 'delta_bar':
+                draw.line(_scaled((x0, py(0)), (x1, py(0))), fill='gray', width=line_w)
+        # Рамка и деления
+        draw.rectangle(_scaled((x0, y0), (x1, y1)), outline=TEXT_COLOR, width=line_w)
+        for v in self.yticks:
+            draw.line(_scaled((x0 - TICK, py(v)), (x0, py(v))), fill=TEXT_COLOR, width=line_w)
+        for i in self.grid:
+            draw.line(_scaled((px(i), y1), (px(i), y1 + TICK)), fill=TEXT_COLOR, width=line_w)
+
+    def draw_text(self, img):
+        x0, y0, x1, y1 = self.frame
+        left, top, right, bottom = self.box
+        for v, im in zip(self.yticks, self.ytick_labels):
+            img.paste(im, (x0 - TICK - 4 - im.width, round(self.py(v) - im.height / 2)), im)
+        for i in self.shown:
+            im = self.xtick_labels[i]
+            img.paste(im, (round(self.px(i) - im.width / 2), y1 + TICK + 4), im)
+        if self.title:
+            img.paste(self.title, (round((x0 + x1 - self.title.width) / 2), top + PAD // 2), self.title)
+        if self.xlabel:
+            img.paste(self.xlabel, (round((x0 + x1 - self.xlabel.width) / 2), bottom - PAD - self.xlabel.height),
+                      self.xlabel)
+        if self.ylabel:
+            img.paste(self.ylabel, (left + PAD, round((y0 + y1 - self.ylabel.height) / 2)), self.ylabel)
+
+
+def _dashboard_axes(spec, width, height):
+    """Сетка линейных графиков по метрикам (spec.ylabel) в DASHBOARD_COLUMNS колонок; даты — под нижним рядом"""
+    title = _text(spec.title, TITLE_SIZE)
+    rows = math.ceil(len(spec.y) / DASHBOARD_COLUMNS)
+    top = PAD // 2 + title.height
+    cell_w, cell_h = width / DASHBOARD_COLUMNS, (height - top) / rows
+    axes = []
+    for i, (metric, values) in enumerate(zip(spec.ylabel, spec.y)):
+        row, col = divmod(i, DASHBOARD_COLUMNS)
+        last_row = i + DASHBOARD_COLUMNS >= len(spec.y)
+        box = (round(col * cell_w), round(top + row * cell_h), round((col + 1) * cell_w), round(top + (row + 1) * cell_h))
+        axes.append(_Axes(box, 'line', spec.x, values, title=metric, title_size=FONT_SIZE,
+                          xlabel=spec.xlabel if last_row else '', xticks=last_row))
+    # Общая ось x: рамки одной колонки выравниваются по самой узкой, одного ряда — по самой низкой
+    frames = [ax.frame for ax in axes]
+    for i, ax in enumerate(axes):
+        column = frames[i % DASHBOARD_COLUMNS::DASHBOARD_COLUMNS]
+        row = frames[i - i % DASHBOARD_COLUMNS:][:DASHBOARD_COLUMNS]
+        ax.set_frame((
+            max(f[0] for f in column), max(f[1] for f in row), min(f[2] for f in column), min(f[3] for f in row)
+        ))
+    return title, axes
+
+
+def render_png(spec, figsize):
+    """PNG графика в стиле matplotlib по умолчанию; figsize — размер в дюймах, как у Figure.
+
+    Линии и фигуры рисуются в SCALE раз крупнее и уменьшаются, текст — сразу
+    в итоговом размере: FreeType сглаживает его сам.
+    """
+    width, height = figsize[0] * DPI, figsize[1] * DPI
+    if spec.kind == 'dashboard':
+        title, axes = _dashboard_axes(spec, width, height)
+    else:
+        title = None
+        axes = [_Axes((0, 0, width, height), spec.kind, spec.x, spec.y, spec.colors,
+                      spec.title, spec.xlabel, spec.ylabel)]
+
+    img = Image.new('RGB', (width * SCALE, height * SCALE), 'white')
+    draw = ImageDraw.Draw(img)
+    for ax in axes:
+        ax.draw_shapes(draw)
+    img = img.reduce(SCALE)
+    for ax in axes:
+        ax.draw_text(img)
+    if title:
+        img.paste(title, (round((width - title.width) / 2), PAD // 2), title)
+
+    # Цветов на графике немного: палитровый PNG сжимается быстрее и втрое меньше
+    buf = io.BytesIO()
+    img.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, format='PNG')
+    return buf.getvalue()
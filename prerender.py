@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+from config import PRERENDER_DELAY, PRERENDER_LIMIT, RELOAD_INTERVAL
+from data_loader import get_players, latest_version, pin_snapshot
+from handlers import (
+    GRAPH_METRICS, PLAYERS_CHART_METRICS, player_dashboard, player_graph, players_chart, progress_chart
+)
+import export_utils
+import charts
+
+log = logging.getLogger(__name__)
+
+
+def load_usage():
+    """Счётчики из history.json: графики игроков (ник, метрика), диаграммы по метрике и карточки игроков"""
+    try:
+        with open(export_utils.HISTORY_PATH, encoding='utf-8') as f:
+            history = json.load(f)
+    except Exception:
+        history = []
+    graphs, players_charts, cards = Counter(), Counter(), Counter()
+    for h in history:
+        params = h.get('params') or {}
+        action = h.get('action')
+        if action == 'view_graph':
+            graphs[params.get('player'), params.get('metric')] += 1
+        elif action == 'view_players_chart':
+            players_charts[params.get('metric')] += 1
+        elif action in ('view_player_card', 'view_dashboard'):
+            cards[params.get('player')] += 1
+    return graphs, players_charts, cards
+
+
+def chart_plan(usage):
+    """Построители графиков для прогрева, от популярных к остальным.
+
+    Сначала общие диаграммы (прогресс и диаграммы по всем игрокам), затем сводки
+    игроков и вся сетка игрок × метрика кнопок графиков. Порядок — по числу
+    просмотров в истории, при равенстве — как на кнопках. Построители вызываются
+    без аргументов.
+    """
+    graphs, players_charts, cards = usage
+    plan = [progress_chart]
+    metrics = sorted(PLAYERS_CHART_METRICS, key=lambda m: -players_charts[m])
+    plan += [lambda m=m: players_chart(m) for m in metrics]
+    plan += [lambda p=p: player_dashboard(p) for p in sorted(get_players(), key=lambda p: -cards[p])]
+    grid = [(name, metric) for metric, _ in GRAPH_METRICS for name in get_players()]
+    grid.sort(key=lambda g: (-graphs[g], -cards[g[0]]))
+    plan += [lambda g=g: player_graph(*g) for g in grid]
+    return plan[:PRERENDER_LIMIT]
+
+
+async def prerender_charts(interval=RELOAD_INTERVAL):
+    """Фоновая задача: после каждого обновления данных заранее рисует популярные графики в кэш"""
+    done = None
+    while True:
+        await asyncio.sleep(interval)
+        if latest_version() == done:
+            continue
+        done = latest_version()
+        try:
+            await prerender_version()
+        except Exception:
+            log.exception('Не удалось прогреть кэш графиков')
+
+
+async def prerender_version():
+    """Рисует графики из chart_plan для последней версии данных по одному, уступая интерактивным запросам.
+
+    Прерывается, как только данные снова обновились. Возвращает число нарисованных графиков.
+    """
+    snapshot = pin_snapshot()
+    loop = asyncio.get_running_loop()
+    usage = await loop.run_in_executor(None, load_usage)
+    rendered = 0
+    for build in chart_plan(usage):
+        if latest_version() != snapshot.version:
+            break
+        chart = build()
+        if chart is None:
+            continue
+        key, spec, _ = chart
+        if charts.is_cached(key):
+            continue
+        # Низкий приоритет: пока пользователи ждут свои графики, не занимаем пул
+        while charts.busy():
+            await asyncio.sleep(PRERENDER_DELAY)
+        try:
+            await charts.prerender(key, spec)
+        except charts.ChartError:
+            break
+        rendered += 1
+        await asyncio.sleep(PRERENDER_DELAY)
+    log.info('Кэш графиков прогрет для версии %s: %s графиков', snapshot.version, rendered)
+    return rendered
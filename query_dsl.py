@@ -0,0 +1,383 @@
+import functools
+import hashlib
+import re
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+from stats_store import NUMERIC_METRICS, SIDES, opponent_of, text_key
+from sqlite_store import metric_sql
+
+# Разрезы строки: игрок, карта, сторона и атрибуты матча
+DIMENSIONS = ('player', 'map', 'side', 'opponent', 'tournament', 'date')
+FIELD_ALIASES = {'vs': 'opponent', 'nick': 'player', 'tour': 'tournament'}
+OPERATORS = ('>=', '<=', '!=', '=', '>', '<', '~')
+# Метрики в таблице результата, если не указано show
+DEFAULT_METRICS = ('Rating', 'ADR', 'KAST', 'K', 'D')
+MAX_QUERY_LENGTH = 300
+TOKEN_RE = re.compile(r'''"[^"]*"|'[^']*'|>=|<=|!=|[=<>~,]|[^\s=<>!~,"']+''')
+_METRICS_BY_KEY = {metric.lower(): metric for metric in NUMERIC_METRICS}
+
+# Скомпилированный запрос. filters — ((поле, оператор, значение), ...);
+# map_level — строки карт (иначе итоги матчей); sides — стороны строк
+Plan = namedtuple('Plan', ['filters', 'group_by', 'sort', 'descending', 'limit', 'metrics', 'map_level', 'sides'])
+
+
+class QueryError(ValueError):
+    """Ошибка разбора запроса; текст показывается пользователю"""
+
+
+# Тексты запросов по короткому ключу: в callback_data помещается только ключ
+_texts = OrderedDict()
+_texts_lock = threading.Lock()
+MAX_REMEMBERED = 1024
+
+
+def remember(text):
+    """Запоминает текст запроса и возвращает его ключ для кнопок"""
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()[:10]
+    with _texts_lock:
+        _texts[key] = text
+        _texts.move_to_end(key)
+        while len(_texts) > MAX_REMEMBERED:
+            _texts.popitem(last=False)
+    return key
+
+
+def recall(key):
+    """Текст запроса по ключу или None, если он уже вытеснен"""
+    with _texts_lock:
+        return _texts.get(key)
+
+
+def _field(token):
+    key = token.lower()
+    key = FIELD_ALIASES.get(key, key)
+    if key in DIMENSIONS:
+        return key
+    if key in _METRICS_BY_KEY:
+        return _METRICS_BY_KEY[key]
+    raise QueryError(f'Неизвестное поле: {token}')
+
+
+def _unquote(token):
+    if len(token) >= 2 and token[0] == token[-1] and token[0] in '"\'':
+        return token[1:-1]
+    return token
+
+
+def _field_list(tokens, pos):
+    """Поля через запятую начиная с pos: (поля, позиция после списка)"""
+    fields = [_field(tokens[pos])]
+    pos += 1
+    while pos + 1 < len(tokens) and tokens[pos] == ',':
+        fields.append(_field(tokens[pos + 1]))
+        pos += 2
+    return fields, pos
+
+
+@functools.lru_cache(maxsize=256)
+def compile_query(text, max_limit=20):
+    """Разбирает запрос в план; план кэшируется по тексту запроса.
+
+    Синтаксис: условия вида поле оператор значение (>, <, >=, <=, =, !=, ~ — подстрока),
+    group by поля, sort [-]поле [desc], limit N, show метрики. Пример:
+    rating > 1.2 map=Mirage side=ct tournament~ESEA group by player sort -rating
+
+    Без условия на карту строки — итоги матчей, с ним (map=* — любая карта) — строки карт.
+    """
+    if len(text) > MAX_QUERY_LENGTH:
+        raise QueryError(f'Запрос длиннее {MAX_QUERY_LENGTH} символов')
+    tokens = TOKEN_RE.findall(text)
+    filters, group_by, metrics = [], [], []
+    sort, descending, limit = None, False, max_limit
+    any_map = False
+    pos = 0
+    while pos < len(tokens):
+        word = tokens[pos].lower()
+        if word in (',', 'and', 'where'):
+            pos += 1
+        elif word == 'group' and pos + 2 < len(tokens) and tokens[pos + 1].lower() == 'by':
+            group_by, pos = _field_list(tokens, pos + 2)
+            if any(field not in DIMENSIONS for field in group_by):
+                raise QueryError('Группировать можно по player, map, side, opponent, tournament, date')
+        elif word in ('sort', 'order') and pos + 1 < len(tokens):
+            pos += 1
+            if tokens[pos].lower() == 'by' and pos + 1 < len(tokens):
+                pos += 1
+            field = tokens[pos]
+            descending = field.startswith('-')
+            sort = 'count' if field.lstrip('-').lower() == 'count' else _field(field.lstrip('-'))
+            pos += 1
+            if pos < len(tokens) and tokens[pos].lower() in ('desc', 'asc'):
+                descending = tokens[pos].lower() == 'desc'
+                pos += 1
+        elif word == 'limit' and pos + 1 < len(tokens):
+            if not tokens[pos + 1].isdigit() or int(tokens[pos + 1]) < 1:
+                raise QueryError('limit — целое число больше нуля')
+            limit = min(int(tokens[pos + 1]), max_limit)
+            pos += 2
+        elif word == 'show' and pos + 1 < len(tokens):
+            metrics, pos = _field_list(tokens, pos + 1)
+            if any(field in DIMENSIONS for field in metrics):
+                raise QueryError('show принимает только метрики')
+        elif pos + 2 < len(tokens) and tokens[pos + 1] in OPERATORS:
+            field, op, value = _field(tokens[pos]), tokens[pos + 1], _unquote(tokens[pos + 2])
+            if field in NUMERIC_METRICS:
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise QueryError(f'{field}: ожидается число, получено {value}')
+                if op == '~':
+                    raise QueryError(f'{field}: оператор ~ только для текстовых полей')
+            elif field == 'side' and (op != '=' or value.lower() not in SIDES):
+                raise QueryError('Сторона задаётся как side=t, side=ct или side=both')
+            if field == 'map' and op == '=' and value == '*':
+                # map=* — строки всех карт без фильтра по названию
+                any_map = True
+            else:
+                filters.append((field, op, value.lower() if field == 'side' else value))
+            pos += 3
+        else:
+            raise QueryError(f'Не удалось разобрать: {" ".join(tokens[pos:pos + 3])}')
+
+    if not metrics:
+        metrics = list(DEFAULT_METRICS)
+    # Метрики из условий и сортировки тоже показываем
+    for field in [f for f, _, _ in filters] + [sort]:
+        if field in NUMERIC_METRICS and field not in metrics:
+            metrics.append(field)
+    if sort is not None and sort not in metrics and sort not in DIMENSIONS and sort != 'count':
+        metrics.append(sort)
+    if sort == 'count' and not group_by:
+        raise QueryError('sort count — только вместе с group by')
+    side_filters = [value for field, _, value in filters if field == 'side']
+    if side_filters:
+        sides = tuple(dict.fromkeys(side_filters))
+    elif 'side' in group_by:
+        sides = ('t', 'ct')
+    else:
+        sides = ('both',)
+    map_level = any_map or 'map' in group_by or any(field == 'map' for field, _, _ in filters)
+    plan = Plan(tuple(filters), tuple(group_by), sort, descending, limit, tuple(metrics), map_level, sides)
+    if sort is not None and sort not in output_columns(plan):
+        # Например, sort tournament без group by tournament: такой колонки в результате нет
+        raise QueryError(f'sort {sort}: сортировать можно по колонкам результата — {", ".join(output_columns(plan))}')
+    return plan
+
+
+def output_columns(plan):
+    """Колонки результата: разрезы (или дата, игрок, соперник, карта), count и метрики"""
+    if plan.group_by:
+        return list(plan.group_by) + ['count'] + list(plan.metrics)
+    dims = ['date', 'player', 'opponent'] + (['map'] if plan.map_level else [])
+    if plan.sides != ('both',):
+        dims.append('side')
+    return dims + list(plan.metrics)
+
+
+def _compare(values, op, value):
+    if op == '=':
+        return values == value
+    if op == '!=':
+        return values != value
+    if op == '>':
+        return values > value
+    if op == '<':
+        return values < value
+    if op == '>=':
+        return values >= value
+    return values <= value
+
+
+def _text_match(text, op, value):
+    """Сравнение текстового поля по text_key — без учёта регистра, как в execute_sql (~ — подстрока)"""
+    text, value = text_key(text), text_key(value)
+    if op == '~':
+        return value in text
+    return _compare(text, op, value)
+
+
+def _ranked(values, codes):
+    """Ранги значений по кодам строк и значения по рангу: порядок рангов — порядок строк Python,
+    равные значения получают один ранг"""
+    labels, rank = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return rank.reshape(-1)[codes], labels.tolist()
+
+
+def _top(keys, limit, descending):
+    """Позиции первых limit ключей в порядке сортировки; равные ключи — в исходном порядке, как у sorted.
+    Полная сортировка только у строк не хуже limit-го ключа (np.partition)"""
+    keys = -keys if descending else keys
+    if limit < len(keys):
+        candidates = np.flatnonzero(keys <= np.partition(keys, limit - 1)[limit - 1])
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(keys[candidates], kind='stable')][:limit]
+
+
+def execute_columns(plan, columns, matches, resolve_player=None, resolve_map=None):
+    """Выполняет план над MetricColumns: маски NumPy, группировка через bincount.
+    Сортировка и limit — над массивами индексов, кортежи собираются только для строк результата.
+
+    Возвращает (колонки, строки — не больше plan.limit, всего строк).
+    """
+    mask = np.isin(columns.side, [SIDES.index(side) for side in plan.sides])
+    mask &= (columns.map != -1) if plan.map_level else (columns.map == -1)
+    match_fields = {'opponent': [], 'tournament': [], 'date': []}
+    for match in matches:
+        match_fields['opponent'].append(opponent_of(match))
+        match_fields['tournament'].append(match['tournament'])
+        match_fields['date'].append(match['date'])
+    for field, op, value in plan.filters:
+        if field in NUMERIC_METRICS:
+            mask &= _compare(columns.column(field), op, value)
+        elif field == 'side':
+            continue
+        elif field in match_fields:
+            ok = np.array([_text_match(v, op, value) for v in match_fields[field]] or [False], dtype=bool)
+            mask &= ok[columns.match]
+        else:
+            names = columns.player_names if field == 'player' else columns.map_names
+            resolve = resolve_player if field == 'player' else resolve_map
+            if op in ('=', '!=') and resolve is not None:
+                value = resolve(value) or value
+            ok = np.array([_text_match(name, op, value) for name in names] or [False], dtype=bool)
+            codes = columns.player if field == 'player' else columns.map
+            # Итоговые строки матча имеют код карты -1 и фильтром по карте не проходят
+            mask &= (codes >= 0) & ok[np.maximum(codes, 0)]
+
+    rows_idx = np.flatnonzero(mask)
+    out_columns = output_columns(plan)
+
+    def dim_values(dim, idx):
+        if dim == 'player':
+            return [columns.player_names[c] for c in columns.player[idx]]
+        if dim == 'map':
+            return [columns.map_names[c] if c >= 0 else '-' for c in columns.map[idx]]
+        if dim == 'side':
+            return [SIDES[c] for c in columns.side[idx]]
+        return [match_fields[dim][c] for c in columns.match[idx]]
+
+    def dim_ranks(dim, idx):
+        """Ранги значений разреза у строк idx и значения по рангу"""
+        if dim == 'player':
+            return _ranked(columns.player_names, columns.player[idx])
+        if dim == 'map':
+            # Итоговые строки (код -1) — последний код, '-'
+            return _ranked(columns.map_names + ['-'], np.where(columns.map[idx] >= 0, columns.map[idx], len(columns.map_names)))
+        if dim == 'side':
+            return _ranked(SIDES, columns.side[idx])
+        return _ranked(match_fields[dim], columns.match[idx])
+
+    if not plan.group_by:
+        if plan.sort is None:
+            top = rows_idx[:plan.limit]
+        else:
+            if plan.sort in DIMENSIONS:
+                keys = dim_ranks(plan.sort, rows_idx)[0]
+            else:
+                keys = columns.column(plan.sort)[rows_idx]
+            top = rows_idx[_top(keys, plan.limit, plan.descending)]
+        parts = [dim_values(col, top) if col in DIMENSIONS else columns.column(col)[top].tolist()
+                 for col in out_columns]
+        return out_columns, list(zip(*parts)), len(rows_idx)
+
+    dims = [dim_ranks(dim, rows_idx) for dim in plan.group_by]
+    # Номер группы строки: ранги разрезов сворачиваются в одно число, после каждого разреза
+    # ключ сжимается обратно в номера 0..групп-1
+    key = np.zeros(len(rows_idx), dtype=np.int64)
+    for ranks, labels in dims:
+        key = np.unique(key * len(labels) + ranks, return_inverse=True)[1].reshape(-1)
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    # Группы в порядке первой строки, как MIN(pl.id) в execute_sql
+    order = np.argsort(first)
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    first, inverse = first[order], position[inverse.reshape(-1)]
+    counts = np.bincount(inverse, minlength=len(first))
+    means = {
+        metric: np.bincount(inverse, weights=columns.column(metric)[rows_idx], minlength=len(first)) / np.maximum(counts, 1)
+        for metric in plan.metrics
+    }
+    if plan.sort is None:
+        top = np.arange(min(plan.limit, len(first)))
+    else:
+        if plan.sort == 'count':
+            keys = counts
+        elif plan.sort in DIMENSIONS:
+            keys = dims[plan.group_by.index(plan.sort)][0][first]
+        else:
+            keys = means[plan.sort]
+        top = _top(keys, plan.limit, plan.descending)
+    rows = [
+        tuple(labels[ranks[first[g]]] for ranks, labels in dims) + (int(counts[g]),)
+        + tuple(float(means[metric][g]) for metric in plan.metrics)
+        for g in top
+    ]
+    return out_columns, rows, len(first)
+
+
+_SQL_DIMENSIONS = {
+    'player': 'pl.nickname',
+    'map': "COALESCE(mp.name, '-')",
+    'side': 'pl.side',
+    'opponent': 'm.opponent',
+    'tournament': 'm.tournament',
+    'date': 'm.date',
+}
+# Ключи text_key для фильтров: сравниваются так же, как в execute_columns
+_SQL_KEYS = {
+    'player': 'pl.nickname_key',
+    'map': 'mp.name_key',
+    'opponent': 'm.opponent_key',
+    'tournament': 'm.tournament_key',
+    'date': 'm.date',
+}
+_SQL_OPERATORS = {'=': '=', '!=': '!=', '>': '>', '<': '<', '>=': '>=', '<=': '<='}
+
+
+def execute_sql(plan, conn, resolve_player=None, resolve_map=None):
+    """Выполняет план одним SQL-запросом к базе SqliteStore; результат как у execute_columns"""
+    where = [f"pl.side IN ({', '.join('?' * len(plan.sides))})",
+             'pl.map_id IS NOT NULL' if plan.map_level else 'pl.map_id IS NULL']
+    params = list(plan.sides)
+    for field, op, value in plan.filters:
+        if field == 'side':
+            continue
+        if field in NUMERIC_METRICS:
+            where.append(f'{metric_sql(field)} {_SQL_OPERATORS[op]} ?')
+            params.append(value)
+            continue
+        if op in ('=', '!=') and field in ('player', 'map'):
+            resolve = resolve_player if field == 'player' else resolve_map
+            if resolve is not None:
+                value = resolve(value) or value
+        column, value = _SQL_KEYS[field], text_key(value)
+        if op == '~':
+            where.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append('%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        else:
+            where.append(f'{column} {_SQL_OPERATORS[op]} ?')
+            params.append(value)
+    out_columns = output_columns(plan)
+    if plan.group_by:
+        select = [_SQL_DIMENSIONS[dim] for dim in plan.group_by] + ['COUNT(*)']
+        select += [f'AVG({metric_sql(metric)})' for metric in plan.metrics]
+        group = f'GROUP BY {", ".join(_SQL_DIMENSIONS[dim] for dim in plan.group_by)}'
+        natural = 'MIN(pl.id)'
+    else:
+        select = [_SQL_DIMENSIONS[col] if col in DIMENSIONS else metric_sql(col) for col in out_columns]
+        group = ''
+        natural = 'pl.id'
+    if plan.sort is None:
+        order = natural
+    else:
+        order = f'{out_columns.index(plan.sort) + 1} {"DESC" if plan.descending else "ASC"}, {natural}'
+    sql = (
+        f'SELECT {", ".join(select)}, COUNT(*) OVER () AS total '
+        'FROM player_lines pl JOIN matches m ON m.id = pl.match_id LEFT JOIN maps mp ON mp.id = pl.map_id '
+        f'WHERE {" AND ".join(where)} {group} ORDER BY {order} LIMIT ?'
+    )
+    rows = conn.execute(sql, params + [plan.limit]).fetchall()
+    total = rows[0]['total'] if rows else 0
+    return out_columns, [tuple(row)[:-1] for row in rows], total
@@ -0,0 +1,55 @@
+import hashlib
+import logging
+import os
+import pickle
+
+log = logging.getLogger(__name__)
+
+# Меняется при любом изменении классов, попадающих в снимок
+SNAPSHOT_FORMAT = 9
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load(snapshot_path, source_path):
+    """Загружает снимок, если он собран из текущей версии исходного файла, иначе None"""
+    try:
+        with open(snapshot_path, 'rb') as f:
+            header = pickle.load(f)
+            if header.get('format') != SNAPSHOT_FORMAT:
+                return None
+            st = os.stat(source_path)
+            if (header['size'], header['mtime']) != (st.st_size, st.st_mtime_ns):
+                # mtime мог смениться при деплое без изменения данных — сверяем содержимое
+                if header['size'] != st.st_size or header['sha256'] != _file_hash(source_path):
+                    return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        log.exception('Снимок %s повреждён, данные будут перечитаны', snapshot_path)
+        return None
+
+
+def save(snapshot_path, source_stat, source_bytes, payload):
+    """Атомарно записывает снимок; source_stat и source_bytes — те, из которых собран payload"""
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'size': source_stat.st_size,
+        'mtime': source_stat.st_mtime_ns,
+        'sha256': hashlib.sha256(source_bytes).hexdigest(),
+    }
+    tmp_path = f'{snapshot_path}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        log.exception('Не удалось записать снимок %s', snapshot_path)
@@ -0,0 +1,431 @@
+import json
+import sqlite3
+import sys
+import threading
+import numpy as np
+from config import DATA_PATH, SQLITE_PATH
+from stats_store import NUMERIC_METRICS, SIDES, PlayerLine, match_uid, opponent_of, parse_stats, parse_window, text_key
+
+TABLES = '''
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    uid TEXT,
+    tournament TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT,
+    team1 TEXT NOT NULL,
+    team2 TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    tournament_key TEXT NOT NULL,
+    opponent_key TEXT NOT NULL,
+    score TEXT,
+    team_stats TEXT
+);
+CREATE TABLE IF NOT EXISTS maps (
+    id INTEGER PRIMARY KEY,
+    match_id INTEGER NOT NULL REFERENCES matches(id),
+    map_no INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    score TEXT,
+    breakdown TEXT,
+    team_stats TEXT
+);
+CREATE TABLE IF NOT EXISTS player_lines (
+    id INTEGER PRIMARY KEY,
+    match_id INTEGER NOT NULL REFERENCES matches(id),
+    map_id INTEGER REFERENCES maps(id),
+    side TEXT NOT NULL,
+    nickname TEXT NOT NULL,
+    nickname_key TEXT NOT NULL,
+    K INTEGER, D INTEGER, A INTEGER, A_f INTEGER, D_t INTEGER, HS INTEGER, MKs INTEGER,
+    clutches INTEGER, ADR REAL, Rating REAL, KAST REAL, OpK INTEGER, OpD INTEGER
+);
+'''
+INDEXES = '''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_matches_uid ON matches(uid);
+CREATE INDEX IF NOT EXISTS idx_matches_date ON matches(date);
+CREATE INDEX IF NOT EXISTS idx_matches_tournament ON matches(tournament);
+CREATE INDEX IF NOT EXISTS idx_maps_match ON maps(match_id);
+CREATE INDEX IF NOT EXISTS idx_maps_name ON maps(name);
+CREATE INDEX IF NOT EXISTS idx_lines_player ON player_lines(nickname_key, side, map_id);
+CREATE INDEX IF NOT EXISTS idx_lines_match ON player_lines(match_id);
+CREATE INDEX IF NOT EXISTS idx_lines_map ON player_lines(map_id);
+'''
+
+LINE_COLUMNS = ('K', 'D', 'A', 'A_f', 'D_t', 'HS', 'MKs', 'clutches', 'ADR', 'Rating', 'KAST', 'OpK', 'OpD')
+# Итоговые строки игрока за матч
+OVERALL_BOTH = "map_id IS NULL AND side = 'both'"
+LINE_SELECT = f'''
+    SELECT pl.match_id AS match_rowid, pl.map_id, pl.side, pl.nickname, {", ".join("pl." + c for c in LINE_COLUMNS)},
+           m.tournament, m.date, m.opponent, m.uid AS match_id
+    FROM player_lines pl JOIN matches m ON m.id = pl.match_id
+'''
+
+
+# Хронологический порядок матчей (как ключ DateIndex в StatsStore)
+DATE_ORDER = "m.date, COALESCE(m.time, ''), m.id"
+
+
+def window_sql(window, table='m'):
+    """Условие SQL на матчи окна (см. stats_store.parse_window) и его параметры"""
+    kind, arg = parse_window(window)
+    if kind == 'last':
+        return (f"{table}.id IN (SELECT id FROM matches ORDER BY date DESC, COALESCE(time, '') DESC, id DESC LIMIT ?)",
+                (arg,))
+    if kind == 'since':
+        return f'{table}.date >= ?', (arg,)
+    return '1', ()
+
+
+def metric_sql(metric, table='pl'):
+    """Выражение SQL для числовой метрики записи"""
+    if metric == 'OpK-D':
+        return f'({table}.OpK - {table}.OpD)'
+    return f'{table}.{"clutches" if metric == "1vsX" else metric}'
+
+
+def _averages_sql(table='pl'):
+    return ', '.join(f'AVG({metric_sql(metric, table)}) AS "{metric}"' for metric in NUMERIC_METRICS)
+
+
+class SqliteStore:
+    """Хранилище статистики в SQLite с тем же интерфейсом запросов, что у StatsStore.
+
+    Матчи собираются из таблиц только по запросу, при старте ничего не разбирается.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        # Срез строится в потоке перезагрузки, а читается из event loop и потоков пула:
+        # у каждого потока своё соединение, одно соединение потоки не делят
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.conn.executescript(TABLES)
+        self._migrate()
+        self.conn.executescript(INDEXES)
+
+    @property
+    def conn(self):
+        """Соединение текущего потока (открывается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False — только чтобы close() мог закрыть соединения всех потоков
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            with self._connections_lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Закрывает соединения всех потоков (когда срез с этим хранилищем заменён).
+        Обращение после close откроет новое соединение"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def _migrate(self):
+        """Доводит базы, созданные раньше, до текущей схемы"""
+        columns = [row['name'] for row in self.conn.execute('PRAGMA table_info(matches)')]
+        if 'uid' not in columns:
+            self._add_uids()
+        if 'opponent_key' not in columns:
+            self._add_text_keys()
+
+    def _add_uids(self):
+        """Добавляет стабильные id матчей в базы, созданные до их появления"""
+        with self.conn:
+            self.conn.execute('ALTER TABLE matches ADD COLUMN uid TEXT')
+            taken = set()
+            for row in self.conn.execute('SELECT * FROM matches ORDER BY id').fetchall():
+                match = {'tournament': row['tournament'], 'date': row['date'], 'time': row['time'],
+                         'teams': [row['team1'], row['team2']]}
+                uid = base = match_uid(match)
+                n = 1
+                while uid in taken:
+                    n += 1
+                    uid = f'{base}-{n}'
+                taken.add(uid)
+                self.conn.execute('UPDATE matches SET uid = ? WHERE id = ?', (uid, row['id']))
+
+    def _add_text_keys(self):
+        """Добавляет ключи text_key турнира, соперника и карты и пересчитывает ключи ников
+        (раньше — lower()) в базах, созданных до них"""
+        self.conn.create_function('text_key', 1, text_key, deterministic=True)
+        with self.conn:
+            self.conn.execute("ALTER TABLE matches ADD COLUMN tournament_key TEXT NOT NULL DEFAULT ''")
+            self.conn.execute("ALTER TABLE matches ADD COLUMN opponent_key TEXT NOT NULL DEFAULT ''")
+            self.conn.execute("ALTER TABLE maps ADD COLUMN name_key TEXT NOT NULL DEFAULT ''")
+            self.conn.execute('UPDATE matches SET tournament_key = text_key(tournament), opponent_key = text_key(opponent)')
+            self.conn.execute('UPDATE maps SET name_key = text_key(name)')
+            self.conn.execute('UPDATE player_lines SET nickname_key = text_key(nickname)')
+
+    # --- запись ---
+
+    def add_match(self, match):
+        """Сохраняет разобранный матч (строки игроков — PlayerLine)"""
+        with self.conn:
+            cur = self.conn.execute(
+                'INSERT INTO matches (uid, tournament, date, time, team1, team2, opponent, tournament_key, opponent_key, '
+                'score, team_stats) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (match['id'], match['tournament'], match['date'], match.get('time'), match['teams'][0], match['teams'][1],
+                 opponent_of(match), text_key(match['tournament']), text_key(opponent_of(match)), match['score'],
+                 json.dumps(match['overall'].get('team_stats', {})))
+            )
+            match_id = cur.lastrowid
+            self._insert_lines(match_id, None, match['overall']['players'])
+            for map_no, m in enumerate(match['maps']):
+                cur = self.conn.execute(
+                    'INSERT INTO maps (match_id, map_no, name, name_key, score, breakdown, team_stats) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (match_id, map_no, m['name'], text_key(m['name']), m['score'], json.dumps(m.get('breakdown', {})),
+                     json.dumps(m.get('team_stats', {})))
+                )
+                self._insert_lines(match_id, cur.lastrowid, m['players'])
+        return match_id
+
+    def _insert_lines(self, match_id, map_id, players):
+        rows = [
+            (match_id, map_id, side, p.nickname, text_key(p.nickname)) + tuple(getattr(p, c) for c in LINE_COLUMNS)
+            for side in SIDES for p in players.get(side, [])
+        ]
+        placeholders = ', '.join('?' * (5 + len(LINE_COLUMNS)))
+        self.conn.executemany(
+            f'INSERT INTO player_lines (match_id, map_id, side, nickname, nickname_key, {", ".join(LINE_COLUMNS)}) '
+            f'VALUES ({placeholders})', rows
+        )
+
+    # --- сборка матчей ---
+
+    def _load_matches(self, where='', params=()):
+        """Собирает матчи в формате JSON-данных (строки игроков — PlayerLine)"""
+        rows = self.conn.execute(f'SELECT * FROM matches {where} ORDER BY id', params).fetchall()
+        if not rows:
+            return []
+        # Карты и строки выбираются тем же условием подзапросом: список id параметрами
+        # упёрся бы в лимит SQLite на число параметров (999 в старых сборках)
+        selected = f'SELECT id FROM matches {where}'
+        matches = {}
+        for row in rows:
+            matches[row['id']] = {
+                'id': row['uid'],
+                'tournament': sys.intern(row['tournament']),
+                'date': row['date'],
+                'time': row['time'],
+                'teams': [row['team1'], row['team2']],
+                'score': row['score'],
+                'overall': {
+                    'team_stats': json.loads(row['team_stats'] or '{}'),
+                    'players': {side: [] for side in SIDES},
+                },
+                'maps': [],
+            }
+        maps = {}
+        for row in self.conn.execute(f'SELECT * FROM maps WHERE match_id IN ({selected}) ORDER BY match_id, map_no', params):
+            m = {
+                'name': sys.intern(row['name']),
+                'score': row['score'],
+                'breakdown': json.loads(row['breakdown'] or '{}'),
+                'team_stats': json.loads(row['team_stats'] or '{}'),
+                'players': {side: [] for side in SIDES},
+            }
+            maps[row['id']] = m
+            matches[row['match_id']]['maps'].append(m)
+        for row in self.conn.execute(f'{LINE_SELECT} WHERE pl.match_id IN ({selected}) ORDER BY pl.id', params):
+            block = maps[row['map_id']] if row['map_id'] is not None else matches[row['match_rowid']]['overall']
+            block['players'][row['side']].append(PlayerLine.from_row(row))
+        return list(matches.values())
+
+    # --- интерфейс StatsStore ---
+
+    def all_matches(self):
+        """Все матчи в порядке загрузки"""
+        return self._load_matches()
+
+    def tournament_index(self):
+        """{турнир: [матчи]}"""
+        tournaments = {}
+        for match in self._load_matches():
+            tournaments.setdefault(match['tournament'], []).append(match)
+        return tournaments
+
+    def match_by_id(self, match_id):
+        """Матч по стабильному id"""
+        matches = self._load_matches('WHERE uid = ?', (match_id,))
+        return matches[0] if matches else None
+
+    def match_list(self):
+        """Все матчи, сгруппированные по турнирам"""
+        matches = []
+        for t_matches in self.tournament_index().values():
+            matches.extend(t_matches)
+        return matches
+
+    def _map_entry(self, match, m):
+        entry = m.copy()
+        entry['date'] = match['date']
+        entry['tournament'] = match['tournament']
+        entry['opponent'] = opponent_of(match)
+        return entry
+
+    def map_index(self):
+        """{карта: [карты матчей с датой, турниром и соперником]}"""
+        maps = {}
+        for match in self._load_matches():
+            for m in match['maps']:
+                maps.setdefault(m['name'], []).append(self._map_entry(match, m))
+        return maps
+
+    def map_names(self):
+        """Названия карт в порядке первого появления"""
+        rows = self.conn.execute('SELECT name, MIN(id) AS first_id FROM maps GROUP BY name ORDER BY first_id')
+        return [row['name'] for row in rows]
+
+    def map_entries(self, map_name, window='all'):
+        """Карты матчей с заданным названием (за окно — в порядке дат)"""
+        cond, params = window_sql(window, 'matches')
+        matches = self._load_matches(f'WHERE id IN (SELECT match_id FROM maps WHERE name = ?) AND {cond}',
+                                     (map_name,) + params)
+        if window != 'all':
+            matches.sort(key=lambda match: (match['date'], match['time'] or ''))
+        return [self._map_entry(match, m) for match in matches for m in match['maps'] if m['name'] == map_name]
+
+    def players(self):
+        """Список ников в порядке первого появления"""
+        rows = self.conn.execute(
+            f'SELECT nickname, MIN(id) AS first_id FROM player_lines WHERE {OVERALL_BOTH} '
+            'GROUP BY nickname_key ORDER BY first_id'
+        )
+        return [row['nickname'] for row in rows]
+
+    def player_stats(self, nickname, window='all'):
+        """Записи игрока за все матчи или за окно (за окно — в порядке дат)"""
+        cond, params = window_sql(window)
+        order = 'pl.match_id' if window == 'all' else DATE_ORDER
+        rows = self.conn.execute(
+            f'{LINE_SELECT} WHERE pl.nickname_key = ? AND pl.side = ? AND pl.map_id IS NULL AND {cond} ORDER BY {order}',
+            (text_key(nickname), 'both') + params
+        )
+        return [PlayerLine.from_row(row) for row in rows]
+
+    def player_match(self, nickname, match_id):
+        """Строка игрока за матч с заданным id или None"""
+        row = self.conn.execute(
+            f'{LINE_SELECT} WHERE pl.nickname_key = ? AND m.uid = ? AND pl.side = ? AND pl.map_id IS NULL',
+            (text_key(nickname), match_id, 'both')
+        ).fetchone()
+        return PlayerLine.from_row(row) if row else None
+
+    def best_map(self, nickname):
+        """Лучшая карта игрока по рейтингу"""
+        row = self.conn.execute(
+            'SELECT mp.name, pl.Rating FROM player_lines pl JOIN maps mp ON mp.id = pl.map_id '
+            "WHERE pl.nickname_key = ? AND pl.side = 'both' AND pl.Rating > 0 "
+            'ORDER BY pl.Rating DESC, pl.id LIMIT 1',
+            (text_key(nickname),)
+        ).fetchone()
+        return (row['name'], row['Rating']) if row else None
+
+    def last_match(self, nickname):
+        """Последний матч игрока"""
+        matches = self._load_matches(
+            f'WHERE id = (SELECT MAX(match_id) FROM player_lines WHERE nickname_key = ? AND {OVERALL_BOTH})',
+            (text_key(nickname),)
+        )
+        return matches[0] if matches else None
+
+    def averages(self, window='all'):
+        """Средние по итогам матчей для всех игроков: {ник: {метрика: среднее}}"""
+        cond, params = window_sql(window)
+        rows = self.conn.execute(
+            f'SELECT pl.nickname, MIN(pl.id) AS first_id, {_averages_sql()} '
+            'FROM player_lines pl JOIN matches m ON m.id = pl.match_id '
+            f"WHERE pl.map_id IS NULL AND pl.side = 'both' AND {cond} GROUP BY pl.nickname_key ORDER BY first_id",
+            params
+        )
+        return {row['nickname']: {metric: row[metric] for metric in NUMERIC_METRICS} for row in rows}
+
+    def player_map_averages(self, nickname):
+        """Средние игрока по картам: {карта: {метрика: среднее, 'count': n}}"""
+        rows = self.conn.execute(
+            f'SELECT mp.name, COUNT(*) AS count, {_averages_sql()} FROM player_lines pl JOIN maps mp ON mp.id = pl.map_id '
+            "WHERE pl.nickname_key = ? AND pl.side = 'both' GROUP BY mp.name ORDER BY MIN(pl.id)",
+            (text_key(nickname),)
+        )
+        return {row['name']: dict({metric: row[metric] for metric in NUMERIC_METRICS}, count=row['count'])
+                for row in rows}
+
+    def _map_side_averages(self, where='1', params=()):
+        rows = self.conn.execute(
+            f'SELECT mp.name, pl.side, MIN(mp.id) AS first_map, COUNT(*) AS count, {_averages_sql()} '
+            f'FROM player_lines pl JOIN maps mp ON mp.id = pl.map_id WHERE {where} GROUP BY mp.name, pl.side',
+            params
+        ).fetchall()
+        rows.sort(key=lambda row: (row['first_map'], SIDES.index(row['side'])))
+        result = {}
+        for row in rows:
+            result.setdefault(row['name'], {})[row['side']] = dict(
+                {metric: row[metric] for metric in NUMERIC_METRICS}, count=row['count']
+            )
+        return result
+
+    def player_map_side_averages(self, nickname):
+        """Средние игрока по картам и сторонам: {карта: {сторона: {метрика: среднее, 'count': n}}}"""
+        return self._map_side_averages('pl.nickname_key = ?', (text_key(nickname),))
+
+    def map_side_averages(self):
+        """Средние по строкам всех игроков команды по картам и сторонам:
+        {карта: {сторона: {метрика: среднее, 'count': n}}}"""
+        return self._map_side_averages()
+
+    def progress(self):
+        """Рейтинг в первом и последнем матче: [(ник, первый, последний)] для игроков с 2+ матчами"""
+        rows = self.conn.execute(
+            f'''SELECT p.nickname,
+                    (SELECT Rating FROM player_lines WHERE id = p.first_id) AS first,
+                    (SELECT Rating FROM player_lines WHERE id = p.last_id) AS last
+                FROM (SELECT nickname, MIN(id) AS first_id, MAX(id) AS last_id, COUNT(*) AS n
+                      FROM player_lines WHERE {OVERALL_BOTH} GROUP BY nickname_key) p
+                WHERE p.n >= 2 ORDER BY p.first_id'''
+        )
+        return [(row['nickname'], row['first'], row['last']) for row in rows]
+
+    def metric_values(self, metric, nickname=None, map_name=None, side='both'):
+        """Значения метрики для подмножества строк (map_name=None — итоги, '*' — все карты)"""
+        sql = f'SELECT {metric_sql(metric)} AS value FROM player_lines pl WHERE pl.side = ?'
+        params = [side]
+        if map_name is None:
+            sql += ' AND pl.map_id IS NULL'
+        elif map_name == '*':
+            sql += ' AND pl.map_id IS NOT NULL'
+        else:
+            sql += ' AND pl.map_id IN (SELECT id FROM maps WHERE name = ?)'
+            params.append(map_name)
+        if nickname is not None:
+            sql += ' AND pl.nickname_key = ?'
+            params.append(text_key(nickname))
+        rows = self.conn.execute(sql, params).fetchall()
+        return np.array([row['value'] for row in rows], dtype=np.float64)
+
+
+def import_json(json_path=DATA_PATH, db_path=SQLITE_PATH):
+    """Разовый импорт baks_stats.json в SQLite. Возвращает количество матчей"""
+    with open(json_path, encoding='utf-8') as f:
+        stats = parse_stats(json.load(f))
+    store = SqliteStore(db_path)
+    if store.conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0]:
+        raise ValueError(f'База {db_path} уже содержит матчи')
+    for match in stats['match_info']:
+        store.add_match(match)
+    store.close()
+    return len(stats['match_info'])
+
+
+if __name__ == '__main__':
+    # python sqlite_store.py [baks_stats.json] [baks_stats.sqlite3]
+    count = import_json(*sys.argv[1:3])
+    print(f'Импортировано матчей: {count}')
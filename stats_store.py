@@ -0,0 +1,537 @@
+import bisect
+import hashlib
+import itertools
+import sys
+from datetime import date
+
+TEAM_NAME = 'BAKS'
+SIDES = ('both', 't', 'ct')
+# Метрики строки игрока в порядке исходного JSON
+METRICS = ('K', 'D', 'ADR', 'Rating', 'KAST', 'OpK-D', 'MKs', '1vsX', 'HS', 'A', 'A_f', 'D_t')
+# Все числовые метрики записи (OpK-D — разница OpK и OpD)
+NUMERIC_METRICS = METRICS + ('OpK', 'OpD')
+# Метрики, у которых меньшее значение лучше
+LOWER_IS_BETTER = ('D', 'OpD')
+
+
+def opponent_of(match):
+    """Возвращает соперника BAKS в матче"""
+    return [t for t in match['teams'] if t != TEAM_NAME][0]
+
+
+def text_key(text):
+    """Ключ имени для сравнения без учёта регистра: общий для обоих хранилищ и фильтров /query"""
+    return text.casefold()
+
+
+def match_uid(match):
+    """Стабильный идентификатор матча: не зависит от порядка матчей в файле"""
+    key = '|'.join([match['tournament'], match['date'], match.get('time') or '', *sorted(match['teams'])])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+
+
+def parse_window(window):
+    """Окно выборки: 'all', 'last<N>' (N последних матчей команды), 'since:<ГГГГ-ММ-ДД>'.
+
+    Возвращает (вид, параметр), для неизвестного окна — ValueError.
+    """
+    if window in (None, 'all'):
+        return 'all', None
+    if window.startswith('last') and window[4:].isdigit() and int(window[4:]) > 0:
+        return 'last', int(window[4:])
+    if window.startswith('since:'):
+        try:
+            return 'since', date.fromisoformat(window[len('since:'):]).isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f'Неизвестное окно: {window}')
+
+
+def _parse_kast(value):
+    """'72.0%' -> 72.0"""
+    if isinstance(value, str):
+        return float(value.replace('%', '').replace(' ', '') or 0)
+    return float(value or 0)
+
+
+def _parse_opening(value):
+    """'9:4' -> (9, 4)"""
+    if isinstance(value, str) and ':' in value:
+        opk, opd = value.split(':', 1)
+        return int(opk), int(opd)
+    return 0, 0
+
+
+class PlayerLine:
+    """Строка статистики игрока с заранее разобранными метриками.
+
+    Доступ по ключу (line['KAST']) возвращает значение в исходном формате JSON
+    для таблиц и экспорта, атрибуты и value() — числа для расчётов.
+    """
+    __slots__ = (
+        'nickname', 'K', 'D', 'A', 'A_f', 'D_t', 'HS', 'MKs', 'clutches',
+        'ADR', 'Rating', 'KAST', 'OpK', 'OpD', 'tournament', 'date', 'opponent', 'match_id'
+    )
+
+    def __init__(self, raw, match=None):
+        self.nickname = sys.intern(raw['nickname'])
+        self.K = raw['K']
+        self.D = raw['D']
+        self.A = raw['A']
+        self.A_f = raw['A_f']
+        self.D_t = raw['D_t']
+        self.HS = raw['HS']
+        self.MKs = raw['MKs']
+        self.clutches = raw.get('1vsX', 0)
+        self.ADR = float(raw['ADR'])
+        self.Rating = float(raw['Rating'])
+        self.KAST = _parse_kast(raw['KAST'])
+        self.OpK, self.OpD = _parse_opening(raw['OpK-D'])
+        if match is not None:
+            self.tournament = match['tournament']
+            self.date = match['date']
+            self.opponent = opponent_of(match)
+            self.match_id = match.get('id')
+        else:
+            self.tournament = self.date = self.opponent = self.match_id = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Запись из строки БД с колонками, названными как слоты"""
+        line = cls.__new__(cls)
+        for slot in cls.__slots__:
+            setattr(line, slot, row[slot])
+        line.nickname = sys.intern(line.nickname)
+        return line
+
+    def __getitem__(self, key):
+        if key == 'KAST':
+            return f'{self.KAST:.1f}%'
+        if key == 'OpK-D':
+            return f'{self.OpK}:{self.OpD}'
+        if key == '1vsX':
+            return self.clutches
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in METRICS or key in self.__slots__
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def value(self, metric):
+        """Числовое значение метрики (OpK-D — разница первых убийств и смертей)"""
+        if metric == 'OpK-D':
+            return self.OpK - self.OpD
+        if metric == '1vsX':
+            return self.clutches
+        if metric in METRICS or metric in ('OpK', 'OpD'):
+            return getattr(self, metric)
+        return 0
+
+    def to_dict(self):
+        """Строка в исходном формате JSON"""
+        return {
+            'nickname': self.nickname, 'OpK-D': self['OpK-D'], 'MKs': self.MKs, 'KAST': self['KAST'],
+            '1vsX': self.clutches, 'K': self.K, 'HS': self.HS, 'A': self.A, 'A_f': self.A_f,
+            'D': self.D, 'D_t': self.D_t, 'ADR': self.ADR, 'Rating': self.Rating
+        }
+
+
+def parse_match(match, taken=()):
+    """Заменяет строки игроков матча на PlayerLine и присваивает матчу id, если его нет
+    (повторный вызов ничего не меняет). taken — уже занятые id"""
+    match['tournament'] = sys.intern(match['tournament'])
+    if not match.get('id'):
+        uid = match_uid(match)
+        n = 1
+        while uid in taken:
+            # Совпали турнир, дата, время и команды
+            n += 1
+            uid = f'{match_uid(match)}-{n}'
+        match['id'] = uid
+    match['teams'] = [sys.intern(t) for t in match['teams']]
+    blocks = [match['overall']] + match['maps']
+    for block in blocks:
+        for side in SIDES:
+            block['players'][side] = [
+                p if isinstance(p, PlayerLine) else PlayerLine(p, match)
+                for p in block['players'].get(side, [])
+            ]
+    for m in match['maps']:
+        m['name'] = sys.intern(m['name'])
+    return match
+
+
+def parse_stats(stats):
+    """Разбирает все матчи загруженного JSON"""
+    taken = set()
+    for match in stats['match_info']:
+        parse_match(match, taken)
+        taken.add(match['id'])
+    return stats
+
+
+def serialize_stats(stats):
+    """Обратное преобразование в JSON-совместимый словарь"""
+    matches = []
+    for match in stats['match_info']:
+        data = dict(match)
+        data['overall'] = dict(match['overall'])
+        data['overall']['players'] = {
+            side: [p.to_dict() for p in lines] for side, lines in match['overall']['players'].items()
+        }
+        data['maps'] = []
+        for m in match['maps']:
+            m_data = dict(m)
+            m_data['players'] = {side: [p.to_dict() for p in lines] for side, lines in m['players'].items()}
+            data['maps'].append(m_data)
+        matches.append(data)
+    return {'match_info': matches}
+
+
+class Totals:
+    """Накопленные суммы и количество строк по всем числовым метрикам"""
+    __slots__ = ('count', 'sums')
+
+    def __init__(self):
+        self.count = 0
+        self.sums = [0] * len(NUMERIC_METRICS)
+
+    def add(self, line):
+        self.count += 1
+        sums = self.sums
+        for i, metric in enumerate(NUMERIC_METRICS):
+            sums[i] += line.value(metric)
+
+    def copy(self):
+        totals = Totals()
+        totals.count = self.count
+        totals.sums = list(self.sums)
+        return totals
+
+    def mean(self, metric):
+        if not self.count:
+            return 0.0
+        return self.sums[NUMERIC_METRICS.index(metric)] / self.count
+
+    def means(self):
+        """{метрика: среднее}"""
+        count = self.count or 1
+        return {metric: total / count for metric, total in zip(NUMERIC_METRICS, self.sums)}
+
+
+class SharedList:
+    """Список с добавлением только в конец, общий для версий данных.
+
+    Объекту видны первые n элементов общего списка: copy() за O(1) делит список
+    с оригиналом, и дописанное в одну копию другая не видит. Если хвост уже
+    занят другой копией, append сначала отделяет свою часть.
+    """
+    __slots__ = ('items', 'n')
+
+    def __init__(self):
+        self.items = []
+        self.n = 0
+
+    def append(self, item):
+        if len(self.items) != self.n:
+            self.items = self.items[:self.n]
+        self.items.append(item)
+        self.n += 1
+
+    def copy(self):
+        shared = SharedList.__new__(SharedList)
+        shared.items, shared.n = self.items, self.n
+        return shared
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return itertools.islice(self.items, self.n)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return self.items[:self.n][pos]
+        if pos < 0:
+            pos += self.n
+        if not 0 <= pos < self.n:
+            raise IndexError('SharedList index out of range')
+        return self.items[pos]
+
+
+class DateIndex:
+    """Записи, упорядоченные по ключу матча (дата, время, порядковый номер).
+
+    Начало окна ищется бинарным поиском. Как у SharedList, видны первые n записей
+    списков, и copy() делит их с оригиналом; обычно матч попадает в конец
+    хронологии, а вставка в середину общих списков сначала их отделяет.
+    """
+    __slots__ = ('keys', 'items', 'n', 'shared')
+
+    def __init__(self):
+        self.keys = []
+        self.items = []
+        self.n = 0
+        self.shared = False
+
+    def add(self, key, item):
+        n = self.n
+        pos = bisect.bisect_right(self.keys, key, 0, n)
+        if self.shared and (pos < n or len(self.keys) != n):
+            self.keys, self.items, self.shared = self.keys[:n], self.items[:n], False
+        self.keys.insert(pos, key)
+        self.items.insert(pos, item)
+        self.n = n + 1
+
+    def copy(self):
+        # Оригинал тоже помечается: списки теперь общие и для его вставок
+        self.shared = True
+        index = DateIndex.__new__(DateIndex)
+        index.keys, index.items, index.n, index.shared = self.keys, self.items, self.n, True
+        return index
+
+    def __len__(self):
+        return self.n
+
+    def start(self, key):
+        """Позиция первой записи с ключом >= key (None — с начала)"""
+        return 0 if key is None else bisect.bisect_left(self.keys, key, 0, self.n)
+
+    def since(self, key):
+        """Записи с ключом >= key"""
+        return self.items[self.start(key):self.n]
+
+    def keys_since(self, key):
+        """Ключи записей с ключом >= key"""
+        return self.keys[self.start(key):self.n]
+
+
+def _writable(index, key, factory, owned):
+    """index[key] для записи: новый контейнер (factory) или свой; общий с прошлой
+    версией (его id нет в owned) сначала копируется. owned=None — все контейнеры свои"""
+    item = index.get(key)
+    if item is not None and (owned is None or id(item) in owned):
+        return item
+    item = index[key] = factory() if item is None else item.copy()
+    if owned is not None:
+        owned.add(id(item))
+    return item
+
+
+class StatsStore:
+    """Индексированное хранилище статистики, строится один раз при загрузке.
+
+    Ожидает матчи, уже разобранные parse_stats/parse_match. Списки под ключами —
+    SharedList, индексы по дате — DateIndex: следующая версия (with_match) делит
+    их с этой.
+    """
+
+    def __init__(self, stats):
+        self.matches = SharedList()
+        # id матча -> позиция в matches
+        self.match_ids = {}
+        # По позициям matches: {ник в нижнем регистре: строка игрока за матч}
+        self.player_match_lines = SharedList()
+        # ник в нижнем регистре -> ник как в данных
+        self.player_names = {}
+        # ник в нижнем регистре -> [(матч, строка игрока за матч)]
+        self.player_matches = {}
+        # ник в нижнем регистре -> [(матч, карта, строка игрока на карте)]
+        self.player_maps = {}
+        # ник в нижнем регистре -> (карта, рейтинг)
+        self.player_best_map = {}
+        self.tournaments = {}
+        self.maps = {}
+        self.opponents = {}
+        # Накопленные суммы по игроку, карте и стороне ({ник: {карта: {сторона: Totals}}})
+        # и по карте и стороне для всей команды ({карта: {сторона: Totals}});
+        # обновляются при add_match. Средние по итогам матчей считают колонки метрик
+        self.player_map_side_totals = {}
+        self.map_side_totals = {}
+        # Индексы по дате: матчи, строки игрока за матч, карты
+        self.dated_matches = DateIndex()
+        self.player_dated = {}
+        self.map_dated = {}
+        for match in stats['match_info']:
+            self.add_match(match)
+
+    def with_match(self, match):
+        """Следующая версия хранилища с матчем match; это хранилище не меняется.
+
+        Списки и индексы по дате общие с этой версией, их копии — O(1). Словари
+        верхнего уровня копируются поверхностно: у словаря id это копия массива
+        ссылок на все матчи, у остальных — по игрокам, картам, турнирам и соперникам.
+        Из накопленных сумм копируются только затронутые матчем; остальное —
+        O(игроков в матче), как add_match.
+        """
+        store = object.__new__(StatsStore)
+        for name, value in vars(self).items():
+            setattr(store, name, value.copy())
+        store._add_match(match, set())
+        return store
+
+    def add_match(self, match):
+        """Добавляет матч во все индексы за O(игроков в матче)"""
+        self._add_match(match, None)
+
+    def _add_match(self, match, owned):
+        # owned — id контейнеров, созданных этой версией (см. _writable)
+        def own(index, key, factory):
+            return _writable(index, key, factory, owned)
+
+        opponent = opponent_of(match)
+        if match['id'] in self.match_ids:
+            raise ValueError(f'Матч {match["id"]} уже загружен')
+        position = len(self.matches)
+        date_key = (match['date'], match.get('time') or '', position)
+        self.dated_matches.add(date_key, match)
+        self.match_ids[match['id']] = position
+        self.matches.append(match)
+        own(self.tournaments, match['tournament'], SharedList).append(match)
+        own(self.opponents, opponent, SharedList).append(match)
+
+        lines = {}
+        for p in match['overall']['players']['both']:
+            key = text_key(p.nickname)
+            self.player_names.setdefault(key, p.nickname)
+            own(self.player_matches, key, SharedList).append((match, p))
+            own(self.player_dated, key, DateIndex).add(date_key, p)
+            lines[key] = p
+        self.player_match_lines.append(lines)
+
+        for m in match['maps']:
+            map_copy = m.copy()
+            map_copy['date'] = match['date']
+            map_copy['tournament'] = match['tournament']
+            map_copy['opponent'] = opponent
+            own(self.maps, m['name'], SharedList).append(map_copy)
+            own(self.map_dated, m['name'], DateIndex).add(date_key, map_copy)
+            team_sides = own(self.map_side_totals, m['name'], dict)
+            for side in SIDES:
+                for p in m['players'].get(side, []):
+                    player_sides = own(own(self.player_map_side_totals, text_key(p.nickname), dict), m['name'], dict)
+                    own(player_sides, side, Totals).add(p)
+                    own(team_sides, side, Totals).add(p)
+            for p in m['players']['both']:
+                key = text_key(p.nickname)
+                own(self.player_maps, key, SharedList).append((match, m, p))
+                best = self.player_best_map.get(key)
+                if p.Rating > (best[1] if best else 0):
+                    self.player_best_map[key] = (m['name'], p.Rating)
+
+    def all_matches(self):
+        """Все матчи в порядке загрузки"""
+        return self.matches
+
+    def tournament_index(self):
+        """{турнир: [матчи]}"""
+        return self.tournaments
+
+    def match_by_id(self, match_id):
+        """Матч по стабильному id"""
+        position = self.match_ids.get(match_id)
+        return None if position is None else self.matches[position]
+
+    def map_index(self):
+        """{карта: [карты матчей с датой, турниром и соперником]}"""
+        return self.maps
+
+    def window_start(self, window):
+        """Ключ первого матча окна (None — с начала хронологии)"""
+        kind, arg = parse_window(window)
+        if kind == 'last':
+            index = self.dated_matches
+            return index.keys[len(index) - arg] if arg < len(index) else None
+        if kind == 'since':
+            return (arg,)
+        return None
+
+    def window_positions(self, window):
+        """Позиции матчей окна в self.matches (None — все матчи)"""
+        if window == 'all':
+            return None
+        return [key[2] for key in self.dated_matches.keys_since(self.window_start(window))]
+
+    def map_names(self):
+        """Названия карт в порядке первого появления"""
+        return list(self.maps)
+
+    def map_entries(self, map_name, window='all'):
+        """Карты матчей с заданным названием (за окно — в порядке дат)"""
+        if window == 'all':
+            return list(self.maps.get(map_name, ()))
+        index = self.map_dated.get(map_name)
+        return index.since(self.window_start(window)) if index else []
+
+    def players(self):
+        """Список ников в порядке первого появления"""
+        return list(self.player_names.values())
+
+    def player_lines(self, nickname):
+        """Строки игрока за все матчи: [(матч, строка)]"""
+        return self.player_matches.get(text_key(nickname), [])
+
+    def player_stats(self, nickname, window='all'):
+        """Записи игрока за все матчи или за окно (за окно — в порядке дат)"""
+        if window == 'all':
+            return [p for _, p in self.player_lines(nickname)]
+        index = self.player_dated.get(text_key(nickname))
+        return index.since(self.window_start(window)) if index else []
+
+    def player_map_averages(self, nickname):
+        """Средние игрока по картам: {карта: {метрика: среднее, 'count': n}}"""
+        by_map = self.player_map_side_totals.get(text_key(nickname), {})
+        return {map_name: dict(sides['both'].means(), count=sides['both'].count)
+                for map_name, sides in by_map.items() if 'both' in sides}
+
+    def player_map_side_averages(self, nickname):
+        """Средние игрока по картам и сторонам: {карта: {сторона: {метрика: среднее, 'count': n}}}"""
+        by_map = self.player_map_side_totals.get(text_key(nickname), {})
+        return {
+            map_name: {side: dict(totals.means(), count=totals.count) for side, totals in sides.items()}
+            for map_name, sides in by_map.items()
+        }
+
+    def map_side_averages(self):
+        """Средние по строкам всех игроков команды по картам и сторонам:
+        {карта: {сторона: {метрика: среднее, 'count': n}}}"""
+        return {
+            map_name: {side: dict(totals.means(), count=totals.count) for side, totals in sides.items()}
+            for map_name, sides in self.map_side_totals.items()
+        }
+
+    def progress(self):
+        """Рейтинг в первом и последнем матче: [(ник, первый, последний)] для игроков с 2+ матчами"""
+        return [
+            (self.player_names[key], lines[0][1].Rating, lines[-1][1].Rating)
+            for key, lines in self.player_matches.items() if len(lines) >= 2
+        ]
+
+    def player_match(self, nickname, match_id):
+        """Строка игрока за матч с заданным id или None"""
+        position = self.match_ids.get(match_id)
+        return None if position is None else self.player_match_lines[position].get(text_key(nickname))
+
+    def best_map(self, nickname):
+        """Лучшая карта игрока по рейтингу"""
+        return self.player_best_map.get(text_key(nickname))
+
+    def last_match(self, nickname):
+        """Последний матч игрока"""
+        lines = self.player_matches.get(text_key(nickname))
+        return lines[-1][0] if lines else None
+
+    def match_list(self):
+        """Все матчи, сгруппированные по турнирам"""
+        matches = []
+        for t_matches in self.tournaments.values():
+            matches.extend(t_matches)
+        return matches
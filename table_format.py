@@ -0,0 +1,243 @@
+import functools
+import math
+
+try:
+    import wcwidth
+except ImportError:
+    wcwidth = None
+
+# Типы колонок по возрастанию общности, как в tabulate: пусто < bool < int < float < str
+_EMPTY, _BOOL, _INT, _FLOAT, _STR = range(5)
+KINDS = {'int': _INT, 'float': _FLOAT, 'str': _STR}
+
+
+class _Fallback(Exception):
+    """Таблица вне быстрого пути — строим её через tabulate"""
+
+
+@functools.lru_cache(maxsize=4096)
+def _wide_width(s):
+    width = wcwidth.wcswidth(s) if wcwidth is not None else len(s)
+    if width < 0:
+        # Управляющие символы: ширину считает только tabulate
+        raise _Fallback
+    return width
+
+
+def _width(s):
+    if s.isascii() and s.isprintable():
+        return len(s)
+    return _wide_width(s)
+
+
+def _cell_kind(value):
+    """Тип значения по правилам tabulate; _Fallback для редких случаев"""
+    if value is None:
+        return _EMPTY
+    t = type(value)
+    if t is str:
+        if not value:
+            return _EMPTY
+        if value in ('True', 'False'):
+            return _BOOL
+        if '\n' in value or '\r' in value or '\x1b' in value or ',' in value:
+            # Многострочные ячейки, ANSI-коды и разделители тысяч
+            raise _Fallback
+        try:
+            int(value)
+            return _INT
+        except ValueError:
+            pass
+        try:
+            number = float(value)
+        except ValueError:
+            return _STR
+        if (math.isinf(number) or math.isnan(number)) and value.lower() not in ('inf', '-inf', 'nan'):
+            return _STR
+        return _FLOAT
+    if t is bool:
+        return _BOOL
+    if t is int:
+        return _INT
+    if isinstance(value, float):
+        return _FLOAT
+    raise _Fallback
+
+
+def _format(value, kind):
+    if value is None:
+        return ''
+    if kind == _INT:
+        return format(value, '')
+    if kind == _FLOAT:
+        if value == '':
+            return ''
+        try:
+            return format(float(value), 'g')
+        except ValueError:
+            return f'{value}'
+    return f'{value}'
+
+
+def _afterpoint(s):
+    """Знаков после точки для выравнивания по десятичной точке; -1 — точки нет"""
+    try:
+        int(s)
+        return -1
+    except ValueError:
+        pass
+    try:
+        float(s)
+    except ValueError:
+        return -1
+    pos = s.rfind('.')
+    if pos < 0:
+        pos = s.lower().rfind('e')
+    return len(s) - pos - 1 if pos >= 0 else -1
+
+
+@functools.lru_cache(maxsize=256)
+def _template(widths, right):
+    """Линии рамки и шаблон строки для данных ширин и выравниваний колонок"""
+    def line(begin, fill, sep, end):
+        return begin + sep.join(fill * (w + 2) for w in widths) + end
+    row = '│ ' + ' │ '.join(f'{{:{">" if r else "<"}{w}}}' for w, r in zip(widths, right)) + ' │'
+    return (
+        line('╒', '═', '╤', '╕'),
+        line('╞', '═', '╪', '╡'),
+        line('├', '─', '┼', '┤'),
+        line('╘', '═', '╧', '╛'),
+        row
+    )
+
+
+def _render(rows, headers, kinds):
+    if headers == 'keys':
+        if not rows or not all(type(row) is dict for row in rows):
+            raise _Fallback
+        keys = list(rows[0])
+        if any(len(row) != len(keys) or list(row) != keys for row in rows[1:]):
+            # Разные наборы ключей — порядок колонок определяет tabulate
+            raise _Fallback
+        headers = [str(k) for k in keys]
+        rows = [list(row.values()) for row in rows]
+    else:
+        headers = [str(h) for h in headers]
+    ncols = len(headers)
+    if not rows or not ncols or any(len(row) != ncols for row in rows):
+        raise _Fallback
+    if kinds is not None and len(kinds) != ncols:
+        raise ValueError('kinds: по одному типу на колонку')
+
+    columns = []
+    right = []
+    for i in range(ncols):
+        values = [row[i] for row in rows]
+        if kinds is not None:
+            kind = KINDS[kinds[i]]
+        else:
+            kind = max(_BOOL, max(_cell_kind(v) for v in values))
+        cells = [_format(v, kind) for v in values]
+        if kind in (_INT, _FLOAT):
+            decimals = [_afterpoint(s) for s in cells]
+            most = max(decimals)
+            cells = [s + ' ' * (most - d) for s, d in zip(cells, decimals)]
+            right.append(True)
+        else:
+            cells = [s.strip() for s in cells]
+            right.append(False)
+        columns.append(cells)
+
+    widths = []
+    plain = True
+    cell_widths = []
+    for header, cells in zip(headers, columns):
+        ws = [_width(s) for s in cells]
+        hw = _width(header)
+        plain = plain and hw == len(header) and all(w == len(s) for w, s in zip(ws, cells))
+        widths.append(max(hw + 2, max(ws)))
+        cell_widths.append(ws)
+    top, below_header, between, bottom, row_template = _template(tuple(widths), tuple(right))
+
+    if plain:
+        header_line = row_template.format(*headers)
+        body = [row_template.format(*cells) for cells in zip(*columns)]
+    else:
+        # Широкие символы (эмодзи): дополняем пробелами по видимой ширине
+        def pad(s, w, width, r):
+            return ' ' * (width - w) + s if r else s + ' ' * (width - w)
+        header_line = '│ ' + ' │ '.join(
+            pad(h, _width(h), width, r) for h, width, r in zip(headers, widths, right)
+        ) + ' │'
+        body = []
+        for j in range(len(rows)):
+            body.append('│ ' + ' │ '.join(
+                pad(columns[i][j], cell_widths[i][j], widths[i], right[i]) for i in range(ncols)
+            ) + ' │')
+    return '\n'.join([top, header_line, below_header, f'\n{between}\n'.join(body), bottom])
+
+
+def fancy_grid(rows, headers='keys', kinds=None):
+    """То же, что tabulate(rows, headers, tablefmt='fancy_grid'), но без общего разбора таблицы.
+
+    rows — список словарей с одинаковыми ключами (headers='keys') или список строк
+    при явных заголовках. kinds — типы колонок ('int', 'float', 'str') для таблиц
+    с известной схемой: тогда типы значений не выводятся. Многострочные ячейки,
+    ANSI-коды и прочие редкие случаи передаются в tabulate.
+    """
+    try:
+        return _render(rows, headers, kinds)
+    except _Fallback:
+        # tabulate нужен только редким таблицам — загружается при первой из них
+        from tabulate import tabulate
+        return tabulate(rows, headers=headers, tablefmt='fancy_grid')
+
+
+if __name__ == '__main__':
+    # Замер на таблицах бота: python table_format.py
+    import timeit
+    from tabulate import tabulate
+    from data_loader import get_match_list, get_player_averages, get_players, get_player_stats
+
+    averages = get_player_averages()
+    tables = {
+        'players': ([{
+            "Место": f"{i}",
+            "Игрок": nickname,
+            "Рейтинг": f"{stats['Rating']:.2f}",
+            "ADR": f"{stats['ADR']:.0f}",
+            "KAST": f"{stats['KAST']:.1f}%",
+            "K/D": f"{stats['K']:.1f}/{stats['D']:.1f}"
+        } for i, (nickname, stats) in enumerate(averages.items(), 1)], ('int', 'str', 'float', 'int', 'str', 'str')),
+        'player_matches': ([{
+            "Дата": s['date'],
+            "Соперник": s.get('opponent', '-'),
+            "Рейтинг": s['Rating'],
+            "ADR": s['ADR'],
+            "KAST": s['KAST'],
+        } for s in get_player_stats(get_players()[0])], None),
+        'match': ([{
+            "Игрок": p['nickname'],
+            "K/D": f'{p["K"]}/{p["D"]}',
+            "ADR": p['ADR'],
+            "KAST": p['KAST'],
+            "OpK-D": p['OpK-D'],
+            "MKs": p['MKs'],
+            "1vsX": p.get('1vsX', 0),
+            "HS": p['HS'],
+            "A": p['A'],
+            "A_f": p['A_f'],
+            "D_t": p['D_t'],
+            "Rating": p['Rating']
+        } for p in get_match_list()[0]['overall']['players']['both']], None),
+    }
+    for name, (rows, kinds) in tables.items():
+        expected = tabulate(rows, headers='keys', tablefmt='fancy_grid')
+        assert fancy_grid(rows) == expected, name
+        if kinds is not None:
+            assert fancy_grid(rows, kinds=kinds) == expected, name
+        number = 2000
+        slow = timeit.timeit(lambda: tabulate(rows, headers='keys', tablefmt='fancy_grid'), number=number)
+        fast = timeit.timeit(lambda: fancy_grid(rows, kinds=kinds), number=number)
+        print(f'{name:15} {len(rows):3} строк: tabulate {slow / number * 1e6:7.1f} мкс, '
+              f'fancy_grid {fast / number * 1e6:7.1f} мкс, ускорение x{slow / fast:.1f}')